@@ -0,0 +1,31 @@
+"""Reset the ecoregions of external_sampling
+
+The ecoregions of external_sampling were resolved with the latitude
+and longitude swapped until the batched backfill replaced
+update_external_samples_with_ecoregions. They are cleared so that
+backfill_ecoregions("external_sampling") resolves them all again.
+
+Revision ID: 4d7a1c9e2b60
+Revises: 9b4e62d1f7a8
+Create Date: 2026-10-18 19:12:45.902114
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "4d7a1c9e2b60"
+down_revision: Union[str, None] = "9b4e62d1f7a8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("UPDATE external_sampling SET resolve_ecoregion_id = NULL")
+
+
+def downgrade() -> None:
+    # The swapped ecoregions are not restored
+    pass
@@ -0,0 +1,50 @@
+"""Make otu.abundance NOT NULL and index it for the taxonomy search
+
+Taxonomy search pages sorted by abundance used COALESCE(abundance, 0),
+which no index can serve. Missing abundances become 0, the column gets
+that default, and (abundance, id) is indexed for the keyset pagination.
+
+Revision ID: 6f2a8d3b9c15
+Revises: 4d7a1c9e2b60
+Create Date: 2026-10-18 23:04:17.381526
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "6f2a8d3b9c15"
+down_revision: Union[str, None] = "4d7a1c9e2b60"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("UPDATE otu SET abundance = 0 WHERE abundance IS NULL")
+    op.alter_column(
+        table_name="otu",
+        column_name="abundance",
+        existing_type=sa.Integer(),
+        nullable=False,
+        server_default="0",
+    )
+    op.create_index(
+        "idx_otu_abundance_id",
+        "otu",
+        ["abundance", "id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_otu_abundance_id", table_name="otu")
+    op.alter_column(
+        table_name="otu",
+        column_name="abundance",
+        existing_type=sa.Integer(),
+        nullable=True,
+        server_default=None,
+    )
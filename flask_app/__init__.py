@@ -156,6 +156,18 @@ def create_app(test_config=None):
             "task": "tasks.send_vm_status_to_slack_task",
             "schedule": crontab(hour=7, minute=0),  # every day at 07:00
         },
+        "verify_reports_bucket_status_every_6_hours": {
+            "task": "tasks.verify_reports_bucket_status_async",
+            "schedule": crontab(hour="*/6", minute=30),
+        },
+        "reconcile_bucket_uploads_every_night": {
+            "task": "tasks.reconcile_bucket_uploads_async",
+            "schedule": crontab(hour=3, minute=0),
+        },
+        "rebuild_taxonomy_lineages_every_night": {
+            "task": "tasks.rebuild_taxonomy_lineages_async",
+            "schedule": crontab(hour=4, minute=0),
+        },
     }
 
     # 6. Import tasks AFTER Celery is initialized
@@ -2,80 +2,96 @@ import geopandas as gpd
 import json
 import os
 import sys
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from shapely.geometry import Point
 
 # Path to the .gpkg file
 GPKG_FILE = "Resolve_Ecoregions_-6779945127424040112.gpkg"
 
+MISSING_FILE_ERROR = (
+    "Missing file, please download the gpkg "
+    "file (GeoPackage) it from "
+    "https://hub.arcgis.com/datasets/esri::"
+    "resolve-ecoregions-and-biomes/explore and place it "
+    "in the geopandasapp directory"
+)
 
-def get_ecoregions(coords):
-    """Returns the ecoregions for a list of coordinates."""
+# Port of the lookup service (python app.py serve)
+SERVICE_PORT = int(os.environ.get("ECOREGIONS_SERVICE_PORT", "5001"))
 
-    # Check if the GPKG file exists
-    if not os.path.exists(GPKG_FILE):
-        print(
-            json.dumps(
-                {
-                    "error": (
-                        "Missing file, please download the gpkg "
-                        "file (GeoPackage) it from "
-                        "https://hub.arcgis.com/datasets/esri::"
-                        "resolve-ecoregions-and-biomes/explore and place it "
-                        "in the geopandasapp directory"
-                    )
-                }
-            )
-        )
-        return
+# Results kept for coordinates that were already resolved
+RESULT_CACHE_SIZE = 500000
+
+# Most points accepted in one request
+MAX_BATCH_POINTS = 50000
+
+_ecoregions = None
+_results = OrderedDict()
+_lock = threading.Lock()
 
-    # Load the GeoDataFrame (only once to optimize performance)
-    global ecoregions
-    if "ecoregions" not in globals():
+
+def load_ecoregions():
+    """
+    The ecoregion polygons, loaded once per process, with what every
+    lookup needs built up front: the STRtree of the polygons, the same
+    in Equal Earth (EPSG:6933) for snapping to the nearest polygon in
+    metres, and the attributes of each polygon.
+    """
+    global _ecoregions
+    if _ecoregions is None:
         ecoregions = gpd.read_file(GPKG_FILE)
+        projected = ecoregions.to_crs(epsg=6933)
+        # Building the spatial indexes is lazy in geopandas, do it now
+        ecoregions.sindex
+        projected.sindex
+        _ecoregions = {
+            "polygons": ecoregions,
+            "projected": projected,
+            "attributes": [
+                {"index_right": index, **attributes}
+                for index, attributes in zip(
+                    ecoregions.index.tolist(),
+                    ecoregions.drop(columns="geometry").to_dict(
+                        orient="records"
+                    ),
+                )
+            ],
+        }
+    return _ecoregions
+
 
-    # Create a GeoDataFrame for the input points
-    points = gpd.GeoDataFrame(
-        geometry=[Point(lon, lat) for lat, lon in coords], crs=ecoregions.crs
+def _resolve(coords):
+    """Results of get_ecoregions for coordinates not resolved before."""
+    ecoregions = load_ecoregions()
+    points = gpd.GeoSeries(
+        [Point(lon, lat) for lat, lon in coords],
+        crs=ecoregions["polygons"].crs,
     )
 
-    # Perform spatial join to find matching ecoregions
-    matched = gpd.sjoin(points, ecoregions, predicate="within")
+    # Polygons the points are within, the first one when on a border
+    found = {}
+    point_idx, polygon_idx = ecoregions["polygons"].sindex.query(
+        points, predicate="within"
+    )
+    for i, polygon in sorted(zip(point_idx.tolist(), polygon_idx.tolist())):
+        found.setdefault(i, (polygon, False))
 
     # For points that didn't fall within any polygon, snap to nearest.
     # Project to Equal Earth (EPSG:6933) so distance is in metres, not degrees.
-    unmatched_idx = [i for i in range(len(coords)) if i not in matched.index]
-    nearest = {}
+    unmatched_idx = [i for i in range(len(coords)) if i not in found]
     if unmatched_idx:
-        unmatched_points = gpd.GeoDataFrame(
-            geometry=[points.geometry[i] for i in unmatched_idx],
-            index=unmatched_idx,
-            crs=ecoregions.crs,
+        projected_points = points.iloc[unmatched_idx].to_crs(epsg=6933)
+        point_idx, polygon_idx = ecoregions["projected"].sindex.nearest(
+            projected_points
         )
-        projected_points = unmatched_points.to_crs(epsg=6933)
-        projected_ecoregions = ecoregions.to_crs(epsg=6933)
-        snapped = gpd.sjoin_nearest(projected_points, projected_ecoregions)
-        for i in unmatched_idx:
-            if i in snapped.index:
-                nearest[i] = snapped.loc[i]
+        for i, polygon in zip(point_idx.tolist(), polygon_idx.tolist()):
+            found.setdefault(unmatched_idx[i], (polygon, True))
 
     results = []
     for i, (lat, lon) in enumerate(coords):
-        if i in matched.index:
-            ecoregion_info = matched.loc[i].drop("geometry").to_dict()
-            results.append(
-                {"lat": lat, "lon": lon, "ecoregion": ecoregion_info}
-            )
-        elif i in nearest:
-            ecoregion_info = nearest[i].drop("geometry").to_dict()
-            results.append(
-                {
-                    "lat": lat,
-                    "lon": lon,
-                    "ecoregion": ecoregion_info,
-                    "snapped": True,
-                }
-            )
-        else:
+        if i not in found:
             results.append(
                 {
                     "lat": lat,
@@ -83,17 +99,126 @@ def get_ecoregions(coords):
                     "message": "No matching ecoregion found",
                 }
             )
+            continue
+        polygon, snapped = found[i]
+        result = {
+            "lat": lat,
+            "lon": lon,
+            "ecoregion": ecoregions["attributes"][polygon],
+        }
+        if snapped:
+            result["snapped"] = True
+        results.append(result)
+    return results
+
+
+def resolve_ecoregions(coords):
+    """
+    Returns the ecoregions for a list of (lat, lon), resolving all the
+    new coordinates in one spatial join and reusing earlier results.
+    """
+    coords = [(float(lat), float(lon)) for lat, lon in coords]
+    with _lock:
+        new_coords = list(
+            dict.fromkeys(
+                coordinate
+                for coordinate in coords
+                if coordinate not in _results
+            )
+        )
+        if new_coords:
+            for coordinate, result in zip(new_coords, _resolve(new_coords)):
+                _results[coordinate] = result
+        results = []
+        for coordinate in coords:
+            _results.move_to_end(coordinate)
+            results.append(_results[coordinate])
+        while len(_results) > RESULT_CACHE_SIZE:
+            _results.popitem(last=False)
+    return results
+
+
+def get_ecoregions(coords):
+    """Returns the ecoregions for a list of coordinates."""
+
+    # Check if the GPKG file exists
+    if not os.path.exists(GPKG_FILE):
+        print(json.dumps({"error": MISSING_FILE_ERROR}))
+        return
+
+    print(json.dumps(resolve_ecoregions(coords), indent=2, default=str))
+
+
+class EcoregionsHandler(BaseHTTPRequestHandler):
+    """
+    POST /ecoregions with {"coordinates": [[lat, lon], ...]} returns
+    {"results": [...]}, one result per coordinate as in get_ecoregions.
+    GET /health tells whether the polygons are loaded.
+    """
+
+    def _send(self, status, data):
+        body = json.dumps(data, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send(404, {"error": "Not found"})
+            return
+        self._send(
+            200,
+            {
+                "status": "ok",
+                "loaded": _ecoregions is not None,
+                "cached": len(_results),
+            },
+        )
+
+    def do_POST(self):
+        if self.path != "/ecoregions":
+            self._send(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            coords = json.loads(self.rfile.read(length))["coordinates"]
+            coords = [(float(lat), float(lon)) for lat, lon in coords]
+        except (ValueError, KeyError, TypeError) as e:
+            self._send(400, {"error": f"Invalid request: {e}"})
+            return
+        if len(coords) > MAX_BATCH_POINTS:
+            self._send(
+                400, {"error": f"At most {MAX_BATCH_POINTS} points per call"}
+            )
+            return
+        if not os.path.exists(GPKG_FILE):
+            self._send(500, {"error": MISSING_FILE_ERROR})
+            return
+
+        self._send(200, {"results": resolve_ecoregions(coords)})
+
 
-    print(json.dumps(results, indent=2))
+def serve(port=SERVICE_PORT):
+    """Keeps the polygons in memory and answers lookups over HTTP."""
+    if os.path.exists(GPKG_FILE):
+        load_ecoregions()
+    server = HTTPServer(("0.0.0.0", port), EcoregionsHandler)
+    print(f"Ecoregions lookup service listening on port {port}", flush=True)
+    server.serve_forever()
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3 or len(sys.argv) % 2 == 0:
+    if sys.argv[1:] == ["serve"]:
+        serve()
+    elif len(sys.argv) < 3 or len(sys.argv) % 2 == 0:
         print(
             json.dumps(
                 {
                     "error": (
-                        "Usage: python app.py <lat1> <lon1> <lat2> <lon2> ..."
+                        "Usage: python app.py <lat1> <lon1> <lat2> <lon2> ... "
+                        "or python app.py serve"
                     )
                 }
             )
@@ -1,30 +1,89 @@
 import os
+import time
 import logging
+import threading
 import base64
 import hashlib
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    FIRST_COMPLETED,
+    as_completed,
+    wait,
+)
 
 # Library about google cloud storage
 from google.cloud import storage
+from requests.adapters import HTTPAdapter
 from models.db_model import (
     SequencingFilesUploadedTable,
 )
 from helpers.dbm import session_scope
+from helpers.checksums import compute_md5
 from google.api_core.exceptions import Forbidden, NotFound
 
 logger = logging.getLogger("my_app_logger")  # Use the same name as in app.py
 
+# Files larger than this are uploaded in parts of this size and composed
+UPLOAD_PART_SIZE = 30 * 1024 * 1024
+
+# GCS composes at most this many objects in one request
+COMPOSE_MAX_COMPONENTS = 32
+
+# Seconds between two progress updates written to the database
+PROGRESS_UPDATE_INTERVAL = 5
+
+# One storage client (credentials and HTTP connection pool) per process,
+# with bucket handles cached by name. Like the database engine, it is
+# rebuilt in Celery prefork children after they fork.
+_storage_client = None
+_storage_client_pid = None
+_storage_client_lock = threading.Lock()
+_buckets = {}
+
+
+def get_storage_client():
+    """Returns the storage client of this process, creating it on first use."""
+    global _storage_client, _storage_client_pid
+
+    pid = os.getpid()
+    if _storage_client is not None and _storage_client_pid == pid:
+        return _storage_client
+
+    with _storage_client_lock:
+        if _storage_client is None or _storage_client_pid != pid:
+            try:
+                pool_size = int(os.environ.get("GCS_HTTP_POOL_SIZE", 16))
+            except ValueError:
+                pool_size = 16
+            client = storage.Client()
+            # Enough connections for the parallel part uploads
+            adapter = HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size
+            )
+            client._http.mount("https://", adapter)
+            _buckets.clear()
+            _storage_client = client
+            _storage_client_pid = pid
+
+    return _storage_client
+
+
+def get_bucket(bucket_name):
+    """Returns a (cached) handle on a bucket, without any request to GCS."""
+    client = get_storage_client()
+    bucket = _buckets.get(bucket_name)
+    if bucket is None:
+        bucket = client.bucket(bucket_name)
+        _buckets[bucket_name] = bucket
+    return bucket
+
 
 def calculate_md5(file_path):
-    md5 = hashlib.md5()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            md5.update(chunk)
-    return md5.hexdigest()
+    return compute_md5(file_path)
 
 
 def list_buckets():
-    # Instantiates a client
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
 
     # List the buckets in the project
     buckets = list(storage_client.list_buckets())
@@ -106,8 +165,7 @@ def delete_bucket_folder(folder_name, bucket_name=None):
         bucket_name = os.environ.get("GOOGLE_STORAGE_BUCKET_NAME")
 
     bucket_name = bucket_name.lower()
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
 
     blobs = bucket.list_blobs(
         prefix=folder_name
@@ -169,13 +227,20 @@ def bucket_upload_folder_v2(folder_path, destination_upload_directory, bucket):
 
 
 def init_bucket_upload_folder_v2(
-    folder_path, destination_upload_directory, bucket
+    folder_path, destination_upload_directory, bucket, process_id=None
 ):
+    """
+    Uploads a folder to the bucket in the background. With process_id,
+    the bucket status of the reports of that upload is verified after.
+    """
     from tasks import bucket_upload_folder_v2_async
 
     try:
         result = bucket_upload_folder_v2_async.delay(
-            folder_path, destination_upload_directory, bucket
+            folder_path,
+            destination_upload_directory,
+            bucket,
+            process_id=process_id,
         )
         logger.info(
             f"Celery bucket_upload_folder_v2_async task "
@@ -191,6 +256,52 @@ def init_bucket_upload_folder_v2(
     return {"msg": "Process initiated"}
 
 
+def _blob_path(destination_upload_directory, destination_blob_name):
+    if destination_upload_directory:
+        return f"{destination_upload_directory}/{destination_blob_name}"
+    return f"{destination_blob_name}"
+
+
+def _upload_workers():
+    try:
+        return max(1, int(os.environ.get("BUCKET_UPLOAD_WORKERS", 4)))
+    except ValueError:
+        return 4
+
+
+def _upload_part(part_blob, data):
+    # GCS rejects the part if it does not arrive intact
+    part_blob.upload_from_string(
+        data, content_type="application/octet-stream", checksum="md5"
+    )
+    return len(data)
+
+
+def _compose_parts(bucket, blob, parts):
+    """
+    Composes parts into blob. GCS composes at most 32 objects per
+    request, so larger sets are first composed into intermediate
+    objects, level by level. Returns the intermediates for cleanup.
+    """
+    intermediates = []
+    level = 0
+    while len(parts) > COMPOSE_MAX_COMPONENTS:
+        grouped = []
+        for start in range(0, len(parts), COMPOSE_MAX_COMPONENTS):
+            group_blob = bucket.blob(
+                f"{blob.name}.compose{level}_"
+                f"{start // COMPOSE_MAX_COMPONENTS}"
+            )
+            group_blob.compose(parts[start : start + COMPOSE_MAX_COMPONENTS])
+            grouped.append(group_blob)
+        intermediates += grouped
+        parts = grouped
+        level += 1
+
+    blob.compose(parts)
+    return intermediates
+
+
 # Quite similar to bucket_chunked_upload but accomodating for a different data
 # model in version 2 of the application.
 # To keep things simple, we are redoing the function with different parameters
@@ -209,20 +320,15 @@ def bucket_chunked_upload_v2(
         bucket_name = os.environ.get("GOOGLE_STORAGE_BUCKET_NAME")
 
     bucket_name = bucket_name.lower()
-
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
 
     total_size = os.path.getsize(local_file_path)
+    blob = bucket.blob(
+        _blob_path(destination_upload_directory, destination_blob_name)
+    )
 
     # If the file is smaller than 30 MB, upload it directly
-    if total_size <= 30 * 1024 * 1024:
-        if destination_upload_directory:
-            blob = bucket.blob(
-                f"{destination_upload_directory}/{destination_blob_name}"
-            )
-        else:
-            blob = bucket.blob(f"{destination_blob_name}")
+    if total_size <= UPLOAD_PART_SIZE:
         blob.upload_from_filename(local_file_path)
 
         # Verify MD5 checksum
@@ -244,70 +350,102 @@ def bucket_chunked_upload_v2(
 
         return True
 
-    # If the file is between 30 MB and 700 MB, do chunks of 30 MB each
-    if 30 * 1024 * 1024 < total_size <= 700 * 1024 * 1024:
-        chunk_size = 30 * 1024 * 1024
-
-    # If the file is larger than 700 MB, separate it into 32 chunks
-    else:
-        chunk_size = total_size // 30
-
-    chunk_num = 0
-    chunks = []
+    # Larger files are uploaded as .partN objects in parallel and then
+    # composed. Parts left by an interrupted attempt are kept if their
+    # size and MD5 match what we read now, so a retry resumes from there.
+    part_prefix = f"{blob.name}.part"
+    existing_parts = {
+        part.name: part for part in bucket.list_blobs(prefix=part_prefix)
+    }
+
+    workers = _upload_workers()
+    file_md5 = hashlib.md5()
+    parts = []
+    resumed_parts = 0
+    done_bytes = 0
+    last_progress_at = 0
+
+    def report_progress(final=False):
+        nonlocal last_progress_at
+        now = time.time()
+        if not final and now - last_progress_at < PROGRESS_UPDATE_INTERVAL:
+            return
+        last_progress_at = now
+        logger.info(
+            f"Bytes uploaded for {blob.name}: {done_bytes} / {total_size}"
+        )
+        if sequencer_file_id:
+            update_sequencer_file_progress(
+                sequencer_file_id, (done_bytes / total_size) * 100
+            )
 
-    with open(local_file_path, "rb") as file:
+    with ThreadPoolExecutor(max_workers=workers) as executor, open(
+        local_file_path, "rb"
+    ) as file:
+        in_flight = set()
         while True:
-            data = file.read(chunk_size)
+            data = file.read(UPLOAD_PART_SIZE)
             if not data:
                 break
-
-            if destination_upload_directory:
-                temp_blob = bucket.blob(
-                    f"{destination_upload_directory}/"
-                    f"{destination_blob_name}.part{chunk_num}"
-                )
+            file_md5.update(data)
+
+            part_blob = bucket.blob(f"{part_prefix}{len(parts)}")
+            parts.append(part_blob)
+
+            existing = existing_parts.get(part_blob.name)
+            if (
+                existing is not None
+                and existing.size == len(data)
+                and existing.md5_hash
+                == base64.b64encode(hashlib.md5(data).digest()).decode("utf-8")
+            ):
+                resumed_parts += 1
+                done_bytes += len(data)
             else:
-                temp_blob = bucket.blob(
-                    f"{destination_blob_name}.part{chunk_num}"
-                )
-            temp_blob.upload_from_string(
-                data, content_type="application/octet-stream"
-            )
-            chunks.append(temp_blob)
-            chunk_num += 1
-
-            if sequencer_file_id:
-                update_sequencer_file_progress(
-                    sequencer_file_id, (file.tell() / total_size) * 100
-                )
-            print(f"Bytes uploaded: {file.tell()} / {total_size}", flush=True)
-
-        if destination_upload_directory:
-            blob = bucket.blob(
-                f"{destination_upload_directory}/{destination_blob_name}"
-            )
-        else:
-            blob = bucket.blob(f"{destination_blob_name}")
-        blob.compose(chunks)
+                # Keep at most one part per worker in memory
+                if len(in_flight) >= workers:
+                    finished, in_flight = wait(
+                        in_flight, return_when=FIRST_COMPLETED
+                    )
+                    done_bytes += sum(f.result() for f in finished)
+                in_flight.add(executor.submit(_upload_part, part_blob, data))
+            report_progress()
+
+        for future in as_completed(in_flight):
+            done_bytes += future.result()
+            report_progress()
+
+    if resumed_parts:
+        logger.info(
+            f"Reused {resumed_parts} of {len(parts)} parts already "
+            f"uploaded for {blob.name}"
+        )
 
-        for temp_blob in chunks:
-            temp_blob.delete()
+    md5_hex = file_md5.hexdigest()
+    if known_md5 and known_md5 != md5_hex:
+        raise ValueError("MD5 checksum does not match!")
 
-        if known_md5:
-            # Verify MD5 checksum
-            blob_md5 = blob.md5_hash
-            # Convert known_md5 from hex to base64
-            known_md5_base64 = base64.b64encode(
-                bytes.fromhex(known_md5)
-            ).decode("utf-8")
-            if blob_md5:
-                if known_md5_base64 == blob_md5:
-                    if sequencer_file_id:
-                        update_sequencer_file_progress(sequencer_file_id, 100)
-                else:
-                    raise ValueError("MD5 checksum does not match!")
+    intermediates = _compose_parts(bucket, blob, parts)
 
-        return True
+    # Composite objects have no MD5 of their own, so keep ours with it
+    blob.metadata = {"md5_hash": md5_hex}
+    blob.patch()
+
+    # With the parts of an earlier attempt that used more of them
+    part_names = {part.name for part in parts}
+    stale_parts = [
+        part
+        for name, part in existing_parts.items()
+        if name not in part_names and name[len(part_prefix) :].isdigit()
+    ]
+    for temp_blob in parts + intermediates + stale_parts:
+        try:
+            temp_blob.delete()
+        except NotFound:
+            pass
+
+    report_progress(final=True)
+    return True
 
 
 def init_bucket_chunked_upload_v2(
@@ -348,8 +486,7 @@ def init_bucket_chunked_upload_v2(
 
 
 def count_fastq_gz_files_in_buckets():
-    # Instantiate a client
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
 
     # List the buckets in the project
     buckets = list(storage_client.list_buckets())
@@ -413,9 +550,7 @@ def check_file_exists_in_bucket(
     bucket_name = bucket_name.lower()
 
     try:
-        # Initialize the storage client and get the bucket
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
+        bucket = get_bucket(bucket_name)
 
         # Construct the full blob name
         blob_name = os.path.join(
@@ -432,6 +567,72 @@ def check_file_exists_in_bucket(
         return False
 
 
+def _list_blob_names(bucket, **list_args):
+    try:
+        return {blob.name for blob in bucket.list_blobs(**list_args)}
+    except (Forbidden, NotFound):
+        # Access is denied or the bucket does not exist
+        return set()
+
+
+def check_files_exist_in_bucket(blob_paths, bucket_name, match_glob=None):
+    """
+    Returns {blob_path: exists} for blobs of one bucket. Each directory
+    is listed once, instead of one request per blob as with
+    check_file_exists_in_bucket. With match_glob (for example
+    "reports/*/summary.log"), one listing of the objects matching it
+    answers for all the paths.
+    """
+    if not blob_paths:
+        return {}
+
+    if bucket_name is None:
+        bucket_name = os.environ.get("GOOGLE_STORAGE_BUCKET_NAME")
+
+    bucket = get_bucket(bucket_name.lower())
+
+    if match_glob:
+        names = _list_blob_names(bucket, match_glob=match_glob)
+        return {blob_path: blob_path in names for blob_path in blob_paths}
+
+    paths_by_directory = {}
+    for blob_path in blob_paths:
+        directory = blob_path.rpartition("/")[0]
+        paths_by_directory.setdefault(directory, set()).add(blob_path)
+
+    result = {}
+    for directory, paths in paths_by_directory.items():
+        prefix = f"{directory}/" if directory else ""
+        names = _list_blob_names(bucket, prefix=prefix, delimiter="/")
+        for blob_path in paths:
+            result[blob_path] = blob_path in names
+
+    return result
+
+
+def list_blob_sizes(bucket_name, prefix=None):
+    """
+    Returns {blob_name: size} of all the objects of a bucket (under
+    prefix), in one paginated listing that asks GCS for the name and
+    size of each object only. An empty dict if the bucket does not
+    exist, a denied access is raised: it is not the same as no files.
+    """
+    bucket = get_bucket(bucket_name.lower())
+    try:
+        # nextPageToken must be in the projection, or only the first
+        # page is listed
+        return {
+            blob.name: blob.size
+            for blob in bucket.list_blobs(
+                prefix=prefix,
+                page_size=1000,
+                fields="items(name,size),nextPageToken",
+            )
+        }
+    except NotFound:
+        return {}
+
+
 def download_file_from_bucket(bucket_name, blob_path, local_file_path):
     """
     Downloads a single file from a Google Cloud Storage bucket to a local path.
@@ -445,8 +646,7 @@ def download_file_from_bucket(bucket_name, blob_path, local_file_path):
         bool: True if the file was successfully downloaded, False otherwise.
     """
     try:
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
+        bucket = get_bucket(bucket_name)
         blob = bucket.blob(blob_path)
 
         # Ensure the local directory exists
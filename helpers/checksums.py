@@ -0,0 +1,279 @@
+import os
+import mmap
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("my_app_logger")  # Use the same name as in app.py
+
+# Files are read in blocks of this size into a reused buffer
+MD5_READ_SIZE = 8 * 1024 * 1024
+
+# Digests of files that were already hashed, one JSON store per directory,
+# kept in a central folder so that we never write into the directories we
+# read from. An entry is only trusted while the file keeps the same size,
+# mtime and inode.
+CHECKSUMS_FOLDER = os.path.join("seq_processed", ".checksums")
+
+_store_lock = threading.Lock()
+
+
+def _hash_workers():
+    try:
+        return max(1, int(os.environ["CHECKSUM_WORKERS"]))
+    except (KeyError, ValueError):
+        return min(8, os.cpu_count() or 1)
+
+
+def compute_md5(file_path):
+    """Returns the hex MD5 of a file, reading it in large blocks."""
+    md5 = hashlib.md5()
+    buffer = bytearray(MD5_READ_SIZE)
+    view = memoryview(buffer)
+    with open(file_path, "rb", buffering=0) as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            md5.update(view[:read])
+    return md5.hexdigest()
+
+
+def _copy_range(source_fd, destination_fd, size, view):
+    """
+    Appends size bytes of source_fd to destination_fd inside the kernel
+    with copy_file_range, or sendfile where that is not available, and
+    writes view (the same bytes, mapped) when neither can be used.
+    """
+    copied = 0
+    for copy in ("copy_file_range", "sendfile"):
+        if not hasattr(os, copy):
+            continue
+        try:
+            while copied < size:
+                if copy == "copy_file_range":
+                    sent = os.copy_file_range(
+                        source_fd, destination_fd, size - copied
+                    )
+                else:
+                    sent = os.sendfile(
+                        destination_fd, source_fd, copied, size - copied
+                    )
+                if not sent:
+                    break
+                copied += sent
+            if copied == size:
+                return
+        except OSError:
+            # Not supported between these files, carry on from where it
+            # stopped with the next way
+            pass
+        os.lseek(source_fd, copied, os.SEEK_SET)
+    while copied < size:
+        copied += os.write(destination_fd, view[copied:])
+
+
+def _assemble(part_paths, destination, md5=None):
+    destination_fd = os.open(
+        destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644
+    )
+    try:
+        for part_path in part_paths:
+            with open(part_path, "rb", buffering=0) as part:
+                size = os.fstat(part.fileno()).st_size
+                if not size:
+                    continue
+                with mmap.mmap(
+                    part.fileno(), 0, access=mmap.ACCESS_READ
+                ) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        if md5 is not None:
+                            md5.update(view)
+                        _copy_range(part.fileno(), destination_fd, size, view)
+                    finally:
+                        view.release()
+    finally:
+        os.close(destination_fd)
+
+
+def assemble_md5(part_paths, destination):
+    """
+    Concatenates part_paths into destination and returns the hex MD5
+    of the result, in one pass over the parts. Each part is hashed
+    through a memory map and copied by the kernel, so its data is never
+    read into Python objects. destination is replaced if it exists.
+    """
+    md5 = hashlib.md5()
+    _assemble(part_paths, destination, md5)
+    return md5.hexdigest()
+
+
+def assemble(part_paths, destination):
+    """Concatenates part_paths into destination, see assemble_md5."""
+    _assemble(part_paths, destination)
+
+
+# The chunk ledger: next to each uploaded chunk (.partN) a small file
+# with its size, mtime, inode and MD5, written when the chunk arrives.
+CHUNK_LEDGER_SUFFIX = ".md5"
+
+
+def _ledger_path(part_path):
+    return f"{part_path}{CHUNK_LEDGER_SUFFIX}"
+
+
+def save_chunk(part_path, data):
+    """
+    Writes an uploaded chunk to part_path and records it in the chunk
+    ledger, hashing it from memory while it is at hand.
+    """
+    with open(part_path, "wb") as f:
+        f.write(data)
+    ledger_path = _ledger_path(part_path)
+    temp_path = f"{ledger_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(
+                _file_key(os.stat(part_path))
+                + [hashlib.md5(data).hexdigest()],
+                f,
+            )
+        os.replace(temp_path, ledger_path)
+    except OSError as e:
+        logger.error(f"Could not record chunk {part_path}: {e}")
+
+
+def get_chunk_md5s(part_paths):
+    """
+    The MD5 of each chunk, in order, from the chunk ledger. Chunks
+    missing from the ledger, or changed since they were recorded, are
+    hashed now.
+    """
+    md5s = []
+    for part_path in part_paths:
+        entry = None
+        try:
+            with open(_ledger_path(part_path), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if entry and entry[:3] == _file_key(os.stat(part_path)):
+            md5s.append(entry[3])
+        else:
+            md5s.append(compute_md5(part_path))
+    return md5s
+
+
+def remove_chunks(part_paths):
+    """Deletes uploaded chunks and their ledger entries."""
+    for part_path in part_paths:
+        os.remove(part_path)
+        try:
+            os.remove(_ledger_path(part_path))
+        except FileNotFoundError:
+            pass
+
+
+def _store_file(directory):
+    key = hashlib.sha1(os.path.abspath(directory).encode("utf-8"))
+    return os.path.join(CHECKSUMS_FOLDER, f"{key.hexdigest()}.json")
+
+
+def _load_store(directory):
+    try:
+        with open(_store_file(directory), "r") as f:
+            return json.load(f).get("files", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_store(directory, files):
+    store_file = _store_file(directory)
+    temp_file = f"{store_file}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(CHECKSUMS_FOLDER, exist_ok=True)
+        with open(temp_file, "w") as f:
+            json.dump(
+                {"directory": os.path.abspath(directory), "files": files}, f
+            )
+        os.replace(temp_file, store_file)
+    except OSError as e:
+        logger.error(f"Could not save checksums for {directory}: {e}")
+
+
+def _file_key(file_stat):
+    return [file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino]
+
+
+def get_md5s(file_paths, workers=None):
+    """
+    Returns {file_path: hex MD5} for the given files. Digests stored by
+    an earlier call are reused while the file is unchanged, so only new
+    or modified files are read, several at a time.
+    """
+    file_paths = [str(file_path) for file_path in file_paths]
+    result = {}
+    stats = {}
+    stores = {}
+    to_hash = []
+
+    for file_path in file_paths:
+        directory, name = os.path.split(os.path.abspath(file_path))
+        if directory not in stores:
+            stores[directory] = _load_store(directory)
+        file_stat = os.stat(file_path)
+        stats[file_path] = file_stat
+
+        entry = stores[directory].get(name)
+        if entry and entry[:3] == _file_key(file_stat):
+            result[file_path] = entry[3]
+        else:
+            to_hash.append(file_path)
+
+    if not to_hash:
+        return result
+
+    with ThreadPoolExecutor(max_workers=workers or _hash_workers()) as pool:
+        for file_path, md5 in zip(to_hash, pool.map(compute_md5, to_hash)):
+            result[file_path] = md5
+
+    changed = set()
+    for file_path in to_hash:
+        directory, name = os.path.split(os.path.abspath(file_path))
+        stores[directory][name] = _file_key(stats[file_path]) + [
+            result[file_path]
+        ]
+        changed.add(directory)
+
+    with _store_lock:
+        for directory in changed:
+            # Keep what other processes stored in the meantime
+            files = _load_store(directory)
+            files.update(stores[directory])
+            # Forget files that have been moved away or deleted
+            try:
+                present = set(os.listdir(directory))
+            except OSError:
+                present = set(files)
+            _save_store(
+                directory,
+                {
+                    name: entry
+                    for name, entry in files.items()
+                    if name in present
+                },
+            )
+
+    logger.info(
+        f"Calculated {len(to_hash)} MD5 checksums, "
+        f"reused {len(file_paths) - len(to_hash)}"
+    )
+    return result
+
+
+def get_md5(file_path):
+    """Cached MD5 of a single file, see get_md5s."""
+    return get_md5s([file_path])[str(file_path)]
@@ -1,9 +1,43 @@
+import os
 import subprocess
 import re
 import logging
+import itertools
+
+from helpers.fastq_stats import open_fastq
 
 logger = logging.getLogger("my_app_logger")
 
+# Cores kept busy by one adapter count of a sequencer ID
+# (cutadapt -j 3, then vsearch piped into cutadapt -j 4)
+ADAPTER_COUNT_JOB_CORES = 4
+
+
+def adapter_count_workers():
+    """Number of sequencer IDs whose adapters are counted at the same time"""
+    try:
+        return max(1, int(os.environ["ADAPTER_COUNT_WORKERS"]))
+    except (KeyError, ValueError):
+        return max(1, (os.cpu_count() or 1) // ADAPTER_COUNT_JOB_CORES)
+
+
+def init_adapters_count_all():
+    from tasks import adapters_count_all_async
+
+    adapters_count_all_async.delay()
+
+
+def subsample_fastq(file_path, output_path, reads):
+    """
+    Writes the first `reads` reads of a (gzipped) FASTQ file to
+    output_path, uncompressed, and returns how many were written.
+    """
+    with open_fastq(file_path) as stream:
+        lines = list(itertools.islice(stream, 4 * reads))
+    with open(output_path, "wb") as f:
+        f.writelines(lines)
+    return len(lines) // 4
+
 
 def detect_single_read_primers(
     file_1_path, file_2_path, forward_primer_seq, reverse_primer_seq
@@ -122,28 +156,6 @@ def parse_detect_merged_read_primers_output(log_output):
     return reads
 
 
-def get_read_length_stats(file_path):
-    cmd = [
-        "bash",
-        "-c",
-        f"zcat {file_path} | awk 'NR%4==2{{sum+=length($0); if(NR==2)min=length($0); if(length($0)<min)min=length($0); if(length($0)>max)max=length($0); count++}} END{{print min, max, sum/count}}'",
-    ]
-    try:
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, check=True
-        )
-        parts = result.stdout.strip().split()
-        if len(parts) == 3:
-            return {
-                "read_length_min": int(parts[0]),
-                "read_length_max": int(parts[1]),
-                "read_length_avg": float(parts[2]),
-            }
-        return None
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Read length stats failed: {e.stderr}") from e
-
-
 def find_forward_reverse_files(filename1, filename2):
     """
     Given two filenames, return them as forward and reverse files
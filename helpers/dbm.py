@@ -1,11 +1,46 @@
 # -*- coding: utf-8 -*-
 from contextlib import contextmanager
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 import os
+import threading
 
+# One engine (and therefore one connection pool) per process. Celery
+# prefork workers inherit the parent's module state when they fork, so
+# we remember which pid built the engine and rebuild it in the child.
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
 
-def connect_db():
+# Counters kept per pool, reset whenever the engine is rebuilt
+_pool_stats = {"connects": 0, "checkouts": 0, "checkins": 0}
+
+# Sessions currently open in this thread, innermost last
+_active_sessions = threading.local()
+
+
+def _int_from_env(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _register_pool_events(db_engine):
+    @event.listens_for(db_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        _pool_stats["connects"] += 1
+
+    @event.listens_for(db_engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        _pool_stats["checkouts"] += 1
+
+    @event.listens_for(db_engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        _pool_stats["checkins"] += 1
+
+
+def _create_engine():
     db_engine = create_engine(
         "mysql+mysqldb://{0}:{1}@{2}:{4}/{3}?charset=utf8mb4".format(
             os.environ["MYSQL_USER"],
@@ -14,16 +49,91 @@ def connect_db():
             os.environ["MYSQL_DATABASE"],
             os.environ["MYSQL_PORT"],
         ),
-        pool_recycle=3600,
+        pool_size=_int_from_env("DB_POOL_SIZE", 5),
+        max_overflow=_int_from_env("DB_MAX_OVERFLOW", 10),
+        pool_timeout=_int_from_env("DB_POOL_TIMEOUT", 30),
+        pool_recycle=_int_from_env("DB_POOL_RECYCLE", 3600),
+        pool_pre_ping=True,
     )
+    _register_pool_events(db_engine)
     return db_engine
 
 
+def connect_db():
+    """
+    Returns the engine shared by this process, creating it on first use.
+    If we are running in a forked child (e.g. a Celery prefork worker),
+    the inherited pool is dropped without closing the parent's sockets
+    and a fresh engine is created for the child.
+    """
+    global _engine, _engine_pid
+
+    pid = os.getpid()
+    if _engine is not None and _engine_pid == pid:
+        return _engine
+
+    with _engine_lock:
+        if _engine is not None and _engine_pid != pid:
+            _engine.dispose(close=False)
+            _engine = None
+
+        if _engine is None:
+            for key in _pool_stats:
+                _pool_stats[key] = 0
+            _engine = _create_engine()
+            _engine_pid = pid
+
+    return _engine
+
+
+def get_pool_status():
+    """
+    Returns a dictionary describing the connection pool of this process,
+    so that admins can see how many connections are in use.
+    """
+    if _engine is None or _engine_pid != os.getpid():
+        return {"pid": os.getpid(), "initialized": False}
+
+    pool = _engine.pool
+    return {
+        "pid": _engine_pid,
+        "initialized": True,
+        "pool_class": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "connects": _pool_stats["connects"],
+        "checkouts": _pool_stats["checkouts"],
+        "checkins": _pool_stats["checkins"],
+        "status": pool.status(),
+    }
+
+
+def _session_stack():
+    if not hasattr(_active_sessions, "stack"):
+        _active_sessions.stack = []
+    return _active_sessions.stack
+
+
 @contextmanager
-def session_scope():
-    """Provide a transactional scope around a series of operations."""
+def session_scope(reuse=False):
+    """
+    Provide a transactional scope around a series of operations.
+
+    With reuse=True, a session already opened by an enclosing
+    session_scope() in the same thread is handed back instead of
+    opening a new one. The enclosing scope stays responsible for
+    committing and closing it.
+    """
+    stack = _session_stack()
+    if reuse and stack:
+        yield stack[-1]
+        return
+
     db_engine = connect_db()
     session = sessionmaker(bind=db_engine, autoflush=False)()
+    stack.append(session)
     try:
         yield session  # Provide the session for use
         session.commit()  # Commit any changes made inside the block
@@ -31,4 +141,5 @@ def session_scope():
         session.rollback()  # Rollback on error
         raise
     finally:
+        stack.remove(session)
         session.close()  # Always close the session
@@ -1,14 +1,35 @@
+import os
+import math
 import docker
+import requests
 import pandas as pd
 import logging
 import json
-import time
+import datetime
+from sqlalchemy import and_, or_, case, tuple_, update
 from helpers.dbm import session_scope
-from models.db_model import ResolveEcoregionsTable, ExternalSamplingTable
+from models.db_model import (
+    ResolveEcoregionsTable,
+    ExternalSamplingTable,
+    SequencingSamplesTable,
+)
 
 # Get the logger instance from app.py
 logger = logging.getLogger("my_app_logger")
 
+# Lookup service of the geopandas container (python app.py serve), which
+# keeps the ecoregion polygons and their spatial index in memory
+ECOREGIONS_SERVICE_URL = os.environ.get(
+    "ECOREGIONS_SERVICE_URL", "http://spun-geopandas:5001"
+)
+
+# Points sent to the lookup service in one request
+ECOREGIONS_BATCH_SIZE = 5000
+
+ECOREGIONS_SERVICE_TIMEOUT = 300
+
+_service_session = requests.Session()
+
 
 def import_ecoregions_from_csv(csv_file_path):
     try:
@@ -130,102 +151,370 @@ def init_update_external_samples_with_ecoregions():
     update_external_samples_with_ecoregions_async.delay()
 
 
-def get_resolve_ecoregion_objectid(longitude, latitude):
-    """Get the resolved ecoregion OBJECTID using the Geopandas container."""
-    coordinates_list = [(latitude, longitude)]  # Ensure correct format
-    result = return_ecoregion(coordinates_list)
+def init_update_samples_with_ecoregions():
+    from tasks import update_samples_with_ecoregions_async
 
     try:
-        output = json.loads(result)  # Parse the JSON string
-
-        if isinstance(output, list) and output:
-            ecoregion_data = output[0]  # Extract the first result
-            logger.info(ecoregion_data)
-            if (
-                "ecoregion" in ecoregion_data
-                and "OBJECTID" in ecoregion_data["ecoregion"]
-            ):
-                return ecoregion_data["ecoregion"][
-                    "OBJECTID"
-                ]  # Return OBJECTID
-            else:
-                logger.error("Unexpected response format: Missing 'OBJECTID'")
+        result = update_samples_with_ecoregions_async.delay()
+        logger.info(
+            f"Celery update_samples_with_ecoregions_async task called "
+            f"successfully! Task ID: {result.id}"
+        )
+    except Exception as e:
+        logger.error(
+            "This is an error message from helpers/ecoregions.py "
+            "while trying to update_samples_with_ecoregions_async"
+        )
+        logger.error(e)
+
+
+def resolve_ecoregions(coordinates_list):
+    """
+    The ecoregions of a list of (lat, lon), as returned by the geopandas
+    app: one dict per coordinate with "ecoregion" when one was found.
+    The points are sent to the lookup service in batches. When it can't
+    be reached the geopandas app is run in the container instead, which
+    loads the polygons again for every batch. Returns None on failure.
+    """
+    results = []
+    for start in range(0, len(coordinates_list), ECOREGIONS_BATCH_SIZE):
+        batch = [
+            (float(lat), float(lon))
+            for lat, lon in coordinates_list[
+                start : start + ECOREGIONS_BATCH_SIZE
+            ]
+        ]
+        try:
+            response = _service_session.post(
+                f"{ECOREGIONS_SERVICE_URL}/ecoregions",
+                json={"coordinates": batch},
+                timeout=ECOREGIONS_SERVICE_TIMEOUT,
+            )
+            response.raise_for_status()
+            output = response.json()["results"]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            logger.warning(
+                f"Ecoregions lookup service failed ({e}), "
+                "running the geopandas app instead"
+            )
+            try:
+                output = json.loads(return_ecoregion(batch))
+            except json.JSONDecodeError as e:
+                logger.error(f"Failed to parse Geopandas response: {e}")
                 return None
-        else:
+
+        if not isinstance(output, list) or len(output) != len(batch):
             logger.error("Unexpected response format from Geopandas")
             return None
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse Geopandas response: {e}")
+        results.extend(output)
+    return results
+
+
+def get_resolve_ecoregion_objectids(coordinates_list):
+    """
+    {(lat, lon): OBJECTID} of the resolve ecoregions of a list of
+    (lat, lon), with None for coordinates without an ecoregion.
+    Returns None if the lookup failed.
+    """
+    output = resolve_ecoregions(coordinates_list)
+    if output is None:
         return None
 
-
-def update_external_samples_with_ecoregions():
-    with session_scope() as session:
-        # Get the ecoregion ID for OBJECTID = 0
-        zero_ecoregion = (
-            session.query(ResolveEcoregionsTable.id)
-            .filter_by(OBJECTID=0)
-            .first()
+    objectids = {}
+    for (lat, lon), ecoregion_data in zip(coordinates_list, output):
+        objectids[(lat, lon)] = ecoregion_data.get("ecoregion", {}).get(
+            "OBJECTID"
         )
+    return objectids
 
-        if not zero_ecoregion:
-            logger.error(
-                "Ecoregion with OBJECTID = 0 is missing from the database."
-            )
-            return
 
-        zero_ecoregion_id = zero_ecoregion.id
+def get_resolve_ecoregion_objectid(longitude, latitude):
+    """Get the resolved ecoregion OBJECTID using the Geopandas service."""
+    output = resolve_ecoregions([(latitude, longitude)])
+    if not output:
+        return None
 
-        while True:
-            # Get one coordinate where resolve_ecoregion_id is NULL
-            coordinate = (
-                session.query(
-                    ExternalSamplingTable.latitude,
-                    ExternalSamplingTable.longitude,
-                )
-                .filter(ExternalSamplingTable.resolve_ecoregion_id.is_(None))
-                .distinct()
-                .first()
-            )
+    ecoregion_data = output[0]  # Extract the first result
+    logger.info(ecoregion_data)
+    if (
+        "ecoregion" in ecoregion_data
+        and "OBJECTID" in ecoregion_data["ecoregion"]
+    ):
+        return ecoregion_data["ecoregion"]["OBJECTID"]  # Return OBJECTID
+    logger.error("Unexpected response format: Missing 'OBJECTID'")
+    return None
+
+
+def _external_sampling_filter():
+    return ExternalSamplingTable.resolve_ecoregion_id.is_(None)
+
+
+def _sequencing_samples_filter():
+    # The samples update_missing_fields would look at
+    return and_(
+        SequencingSamplesTable.resolve_ecoregion_id.is_(None),
+        SequencingSamplesTable.Latitude.isnot(None),
+        SequencingSamplesTable.Latitude != "",
+        SequencingSamplesTable.Longitude.isnot(None),
+        SequencingSamplesTable.Longitude != "",
+        SequencingSamplesTable.Latitude != "nan",
+        SequencingSamplesTable.Longitude != "nan",
+        SequencingSamplesTable.Sample_or_Control == "True sample",
+    )
+
+
+# Tables whose resolve_ecoregion_id is filled by backfill_ecoregions.
+# Coordinates that are not numbers get the OBJECTID = 0 ecoregion when
+# invalid_to_zero, and are left alone otherwise, as are (0, 0) ones
+# when skip_zero.
+ECOREGION_BACKFILL_TARGETS = {
+    "external_sampling": {
+        "table": ExternalSamplingTable,
+        "latitude": ExternalSamplingTable.latitude,
+        "longitude": ExternalSamplingTable.longitude,
+        "filter": _external_sampling_filter,
+        "invalid_to_zero": True,
+        "skip_zero": False,
+    },
+    "sequencing_samples": {
+        "table": SequencingSamplesTable,
+        "latitude": SequencingSamplesTable.Latitude,
+        "longitude": SequencingSamplesTable.Longitude,
+        "filter": _sequencing_samples_filter,
+        "invalid_to_zero": False,
+        "skip_zero": True,
+    },
+}
+
+# Distinct coordinates resolved and written per page
+ECOREGION_BACKFILL_PAGE_SIZE = 2000
+
+# Where each table's backfill saves how far it got
+ECOREGION_BACKFILL_FOLDER = os.path.join("seq_processed", ".ecoregions")
+
+
+def _checkpoint_path(target):
+    return os.path.join(ECOREGION_BACKFILL_FOLDER, f"{target}.json")
+
+
+def load_backfill_checkpoint(target):
+    """The saved progress of a table's backfill, or None."""
+    try:
+        with open(_checkpoint_path(target), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
 
-            if not coordinate:
-                logger.info("No more coordinates to process.")
-                break  # Exit when there are no more samples to update
 
-            lat, lon = coordinate.latitude, coordinate.longitude
-            objectid = get_resolve_ecoregion_objectid(lat, lon)
+def _save_backfill_checkpoint(target, checkpoint):
+    path = _checkpoint_path(target)
+    temp_path = f"{path}.tmp"
+    try:
+        os.makedirs(ECOREGION_BACKFILL_FOLDER, exist_ok=True)
+        with open(temp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.error(f"Could not save ecoregion backfill checkpoint: {e}")
 
-            if objectid is None:
-                resolve_ecoregion_id = (
-                    zero_ecoregion_id  # Assign OBJECTID = 0 ecoregion
+
+def _parse_coordinate(latitude, longitude):
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if not (math.isfinite(latitude) and math.isfinite(longitude)):
+        return None
+    return latitude, longitude
+
+
+def backfill_ecoregions(target, page_size=ECOREGION_BACKFILL_PAGE_SIZE):
+    """
+    Fills resolve_ecoregion_id of a table of ECOREGION_BACKFILL_TARGETS
+    a page of distinct (latitude, longitude) at a time. Each page is
+    resolved with one call to the lookup service and written with one
+    UPDATE, grouped by ecoregion with CASE, and committed.
+
+    Pages are taken in (latitude, longitude) order after the last pair
+    of the previous page, which is saved after each page, so a run that
+    stopped (a crash, the lookup service down) resumes where it was.
+    A run that finished starts over from the beginning.
+    Returns the checkpoint: pages, coordinates and rows updated.
+    """
+    config = ECOREGION_BACKFILL_TARGETS[target]
+    table = config["table"]
+    latitude_column = config["latitude"]
+    longitude_column = config["longitude"]
+    rows_filter = config["filter"]
+
+    with session_scope() as session:
+        ecoregion_ids = dict(
+            session.query(
+                ResolveEcoregionsTable.OBJECTID, ResolveEcoregionsTable.id
+            ).all()
+        )
+    zero_ecoregion_id = ecoregion_ids.get(0)
+    if zero_ecoregion_id is None:
+        logger.error(
+            "Ecoregion with OBJECTID = 0 is missing from the database."
+        )
+        return None
+
+    checkpoint = load_backfill_checkpoint(target)
+    if not checkpoint or checkpoint.get("finished_at"):
+        checkpoint = {
+            "last": None,
+            "pages": 0,
+            "coordinates": 0,
+            "updated": 0,
+            "started_at": datetime.datetime.now().isoformat(),
+            "finished_at": None,
+        }
+
+    while True:
+        with session_scope() as session:
+            query = session.query(latitude_column, longitude_column).filter(
+                rows_filter(),
+                latitude_column.isnot(None),
+                longitude_column.isnot(None),
+            )
+            if checkpoint["last"] is not None:
+                last_latitude, last_longitude = checkpoint["last"]
+                query = query.filter(
+                    or_(
+                        latitude_column > last_latitude,
+                        and_(
+                            latitude_column == last_latitude,
+                            longitude_column > last_longitude,
+                        ),
+                    )
                 )
+            page = [
+                (latitude, longitude)
+                for latitude, longitude in query.distinct()
+                .order_by(latitude_column, longitude_column)
+                .limit(page_size)
+                .all()
+            ]
+
+        if not page:
+            break
+
+        coordinates = {}
+        skipped = set()
+        for pair in page:
+            coordinate = _parse_coordinate(*pair)
+            if coordinate is None:
+                if not config["invalid_to_zero"]:
+                    skipped.add(pair)
+            elif config["skip_zero"] and 0 in coordinate:
+                skipped.add(pair)
             else:
-                # Find the resolve_ecoregions ID corresponding to the OBJECTID
-                resolve_ecoregion = (
-                    session.query(ResolveEcoregionsTable.id)
-                    .filter_by(OBJECTID=objectid)
-                    .first()
+                coordinates[pair] = coordinate
+
+        objectids = {}
+        if coordinates:
+            objectids = get_resolve_ecoregion_objectids(
+                list(dict.fromkeys(coordinates.values()))
+            )
+            if objectids is None:
+                # Leave the page for the next run
+                logger.error(
+                    f"Ecoregion backfill of {target} stopped: "
+                    "the coordinates could not be resolved"
                 )
-                resolve_ecoregion_id = (
-                    resolve_ecoregion.id
-                    if resolve_ecoregion
-                    else zero_ecoregion_id
+                return checkpoint
+
+        pairs_by_ecoregion = {}
+        for pair in page:
+            if pair in skipped:
+                continue
+            if pair in coordinates:
+                ecoregion_id = ecoregion_ids.get(
+                    objectids.get(coordinates[pair]), zero_ecoregion_id
                 )
+            else:
+                ecoregion_id = zero_ecoregion_id
+            pairs_by_ecoregion.setdefault(ecoregion_id, []).append(pair)
+
+        updated = 0
+        if pairs_by_ecoregion:
+            coordinate_pair = tuple_(latitude_column, longitude_column)
+            with session_scope() as session:
+                result = session.execute(
+                    update(table)
+                    .where(rows_filter())
+                    .where(
+                        coordinate_pair.in_(
+                            [
+                                pair
+                                for pairs in pairs_by_ecoregion.values()
+                                for pair in pairs
+                            ]
+                        )
+                    )
+                    .values(
+                        resolve_ecoregion_id=case(
+                            *[
+                                (coordinate_pair.in_(pairs), ecoregion_id)
+                                for ecoregion_id, pairs in (
+                                    pairs_by_ecoregion.items()
+                                )
+                            ],
+                            else_=table.resolve_ecoregion_id,
+                        )
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                updated = result.rowcount
 
-            # Update all records with this coordinate
-            session.query(ExternalSamplingTable).filter_by(
-                latitude=lat, longitude=lon, resolve_ecoregion_id=None
-            ).update({"resolve_ecoregion_id": resolve_ecoregion_id})
+        checkpoint["last"] = list(page[-1])
+        checkpoint["pages"] += 1
+        checkpoint["coordinates"] += len(page)
+        checkpoint["updated"] += updated
+        _save_backfill_checkpoint(target, checkpoint)
+        logger.info(
+            f"Ecoregion backfill of {target}: page {checkpoint['pages']}, "
+            f"{len(page)} coordinates, {updated} rows updated"
+        )
 
-            session.commit()
-            logger.info(
-                f"Updated {lat}, {lon} with "
-                f"ecoregion ID {resolve_ecoregion_id}"
+    if config["invalid_to_zero"]:
+        # Missing coordinates can't be paged through, they are all set
+        # at once
+        with session_scope() as session:
+            result = session.execute(
+                update(table)
+                .where(rows_filter())
+                .where(
+                    or_(latitude_column.is_(None), longitude_column.is_(None))
+                )
+                .values(resolve_ecoregion_id=zero_ecoregion_id)
+                .execution_options(synchronize_session=False)
             )
+            checkpoint["updated"] += result.rowcount
+
+    checkpoint["finished_at"] = datetime.datetime.now().isoformat()
+    _save_backfill_checkpoint(target, checkpoint)
+    logger.info(
+        f"Ecoregion backfill of {target} finished: "
+        f"{checkpoint['coordinates']} coordinates, "
+        f"{checkpoint['updated']} rows updated"
+    )
+    return checkpoint
+
+
+def update_external_samples_with_ecoregions():
+    """
+    Resolves the ecoregions of external_sampling. Until the backfill,
+    they were looked up with latitude and longitude swapped, and the
+    migration 4d7a1c9e2b60 clears them so that they are all redone.
+    """
+    return backfill_ecoregions("external_sampling")
+
 
-            time.sleep(
-                0.2
-            )  # Wait 0.2 second before processing the next coordinate
+def update_samples_with_ecoregions():
+    """Resolves the ecoregions of the sequencing samples missing one."""
+    return backfill_ecoregions("sequencing_samples")
 
 
 def import_ecoregions_from_csv_its(csv_file_path):
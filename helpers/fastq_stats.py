@@ -0,0 +1,158 @@
+import os
+import gzip
+import shutil
+import tempfile
+import itertools
+import subprocess
+from contextlib import contextmanager
+
+import numpy as np
+
+# Reads handled together in one numpy batch
+FASTQ_BATCH_READS = 100000
+
+# Quality characters are Phred+33 encoded
+PHRED_OFFSET = 33
+
+# Threads pigz may use to decompress, when it is installed
+PIGZ_THREADS = 4
+
+
+@contextmanager
+def open_fastq(file_path):
+    """
+    Yields a binary stream of the decompressed FASTQ file. Gzipped files
+    are decompressed by pigz in a separate process when it is available,
+    so that decompression and parsing run at the same time.
+    """
+    file_path = str(file_path)
+    if not file_path.endswith(".gz"):
+        with open(file_path, "rb") as f:
+            yield f
+        return
+
+    pigz = shutil.which("pigz")
+    if not pigz:
+        with gzip.open(file_path, "rb") as f:
+            yield f
+        return
+
+    # Errors go to a file: a pipe nobody reads while the output is
+    # streamed would block pigz once it is full
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(
+            [pigz, "-dc", "-p", str(PIGZ_THREADS), file_path],
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            bufsize=1024 * 1024,
+        )
+        stopped_early = False
+        try:
+            yield process.stdout
+            # The caller did not read everything, pigz fails writing the rest
+            if process.stdout.read(1):
+                stopped_early = True
+                process.kill()
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            process.stdout.close()
+            process.wait()
+
+        if process.returncode != 0 and not stopped_early:
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
+            raise OSError(
+                f"pigz failed for {file_path}: "
+                f"{stderr.decode(errors='replace')}"
+            )
+
+
+def _add_counts(total, counts):
+    """Adds counts to total, growing total if needed."""
+    if counts.size > total.size:
+        total = np.pad(total, (0, counts.size - total.size))
+    total[: counts.size] += counts
+    return total
+
+
+def scan_fastq(file_path):
+    """
+    Reads a (gzipped) FASTQ file once and returns its statistics: number
+    of reads and bases, read length min/max/average and histogram, GC
+    percentage and mean quality per position.
+    """
+    read_count = 0
+    base_count = 0
+    gc_count = 0
+    length_counts = np.zeros(0, dtype=np.int64)
+    quality_sums = np.zeros(0, dtype=np.float64)
+    quality_counts = np.zeros(0, dtype=np.int64)
+
+    with open_fastq(file_path) as stream:
+        while True:
+            lines = list(itertools.islice(stream, 4 * FASTQ_BATCH_READS))
+            if not lines:
+                break
+
+            sequences = [line.rstrip(b"\r\n") for line in lines[1::4]]
+            qualities = [line.rstrip(b"\r\n") for line in lines[3::4]]
+
+            lengths = np.fromiter(
+                map(len, sequences), dtype=np.int64, count=len(sequences)
+            )
+            read_count += lengths.size
+            base_count += int(lengths.sum())
+            length_counts = _add_counts(length_counts, np.bincount(lengths))
+
+            joined = b"".join(sequences).upper()
+            gc_count += joined.count(b"G") + joined.count(b"C")
+
+            # Position of every quality value within its read
+            quality_lengths = np.fromiter(
+                map(len, qualities), dtype=np.int64, count=len(qualities)
+            )
+            values = np.frombuffer(b"".join(qualities), dtype=np.uint8)
+            if values.size:
+                starts = np.cumsum(quality_lengths) - quality_lengths
+                positions = np.arange(values.size) - np.repeat(
+                    starts, quality_lengths
+                )
+                quality_sums = _add_counts(
+                    quality_sums,
+                    np.bincount(positions, weights=values - PHRED_OFFSET),
+                )
+                quality_counts = _add_counts(
+                    quality_counts, np.bincount(positions)
+                )
+
+    present_lengths = np.nonzero(length_counts)[0]
+    return {
+        "read_count": read_count,
+        "base_count": base_count,
+        "read_length_min": (
+            int(present_lengths[0]) if present_lengths.size else None
+        ),
+        "read_length_max": (
+            int(present_lengths[-1]) if present_lengths.size else None
+        ),
+        "read_length_avg": (base_count / read_count if read_count else None),
+        "gc_content": (
+            round(gc_count * 100 / base_count, 2) if base_count else None
+        ),
+        "length_histogram": {
+            str(length): int(length_counts[length])
+            for length in present_lengths
+        },
+        "mean_quality_per_position": [
+            round(float(total / count), 2)
+            for total, count in zip(quality_sums, quality_counts)
+        ],
+    }
+
+
+def file_signature(file_path):
+    """(size, mtime) of a file, to tell whether stored stats are stale."""
+    file_stat = os.stat(file_path)
+    return file_stat.st_size, file_stat.st_mtime
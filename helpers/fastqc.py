@@ -5,6 +5,7 @@ import subprocess
 import zipfile
 from pathlib import Path
 from helpers.bucket import bucket_upload_folder_v2, bucket_chunked_upload_v2
+from helpers import fs_index
 
 import logging
 
@@ -25,6 +26,7 @@ def create_fastqc_report(fastq_file, input_folder, bucket, region):
         f"'{input_file}'"
     )
     subprocess.run(fastqc_cmd, shell=True, executable="/bin/bash")
+    fs_index.invalidate(output_folder_of_file)
 
 
 def init_create_fastqc_report(fastq_file, input_folder, bucket, region):
@@ -88,7 +90,7 @@ def check_fastqc_report(filename, region, upload_folder, return_format="html"):
         abs_zip_file = os.path.abspath(zip_file)
 
         # Check if both files exist
-        if os.path.isfile(abs_html_file) and os.path.isfile(abs_zip_file):
+        if fs_index.file_exists(html_file) and fs_index.file_exists(zip_file):
             if return_format == "zip":
                 return abs_zip_file
             else:
@@ -118,6 +120,7 @@ def create_multiqc_report(process_id):
             multiqc.run(
                 multiqc_folder, outdir=multiqc_folder, export_plots=True
             )
+            fs_index.invalidate(multiqc_folder)
             bucket_upload_directory = (
                 region + "/MultiQC_report/" + uploads_folder
             )
@@ -158,10 +161,11 @@ def init_create_multiqc_report(process_id):
         logger.error(e)
 
 
-def check_multiqc_report(process_id):
+def check_multiqc_report(process_id, process_data=None):
     from models.sequencing_upload import SequencingUpload
 
-    process_data = SequencingUpload.get(process_id)
+    if process_data is None:
+        process_data = SequencingUpload.get(process_id)
     uploads_folder = process_data["uploads_folder"]
     existing_reports = []  # Changed from True/False logic
 
@@ -178,7 +182,7 @@ def check_multiqc_report(process_id):
             )
 
             # Check if the multiqc report file exists
-            if os.path.isfile(multiqc_report_file):
+            if fs_index.file_exists(multiqc_report_file):
                 existing_reports.append(region)
 
         return existing_reports  # Returns a list (truthy if not empty)
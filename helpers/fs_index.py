@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger("my_app_logger")  # Use the same name as in app.py
+
+# Directory listings are reused until the directory's mtime changes
+# (an entry was added, removed or renamed). Files that grow in place do
+# not touch the directory mtime, so listings also expire after a while.
+LISTING_MAX_AGE = 300
+
+# Listings of directories inside seq_processed/<uploads_folder> are kept
+# in a manifest per upload folder, persisted as JSON so that the web
+# workers and the Celery workers share them. Within this many seconds a
+# recorded directory is trusted without even a stat() call.
+PROCESSED_ROOT = "seq_processed"
+MANIFESTS_FOLDER = os.path.join(PROCESSED_ROOT, ".manifests")
+DIRECTORY_CHECK_INTERVAL = 10
+
+# path -> (directory mtime_ns, time listed, {name: (is_file, size)})
+_listing_cache = {}
+
+# uploads_folder -> {"file_mtime_ns", "loaded_at", "dirs", "checked_at"}
+_manifests = {}
+# The manifests are read and changed by the threads of a web worker
+_manifests_lock = threading.RLock()
+
+
+def _scan_directory(path):
+    """Returns {name: (is_file, size, mtime)} or None if path is unreadable."""
+    entries = {}
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_file = entry.is_file()
+                    entry_stat = entry.stat()
+                except OSError:
+                    continue
+                entries[entry.name] = (
+                    is_file,
+                    entry_stat.st_size if is_file else 0,
+                    entry_stat.st_mtime,
+                )
+    except OSError as e:
+        logger.error(f"Error listing directory '{path}': {e}")
+        return None
+    return entries
+
+
+def _locate(path):
+    """
+    Splits a path inside seq_processed/<uploads_folder> into
+    (uploads_folder, relative_directory). Returns None for any other path.
+    """
+    root = os.path.abspath(PROCESSED_ROOT)
+    relative = os.path.relpath(os.path.abspath(path), root)
+    if relative == "." or relative.startswith(".."):
+        return None
+
+    parts = relative.split(os.sep)
+    if parts[0].startswith("."):
+        return None
+    return parts[0], "/".join(parts[1:])
+
+
+def _manifest_file(uploads_folder):
+    return os.path.join(MANIFESTS_FOLDER, f"{uploads_folder}.json")
+
+
+def _load_manifest(uploads_folder):
+    """
+    Returns the in-memory manifest of an upload folder, reloading it
+    from disk if another process has saved a newer version.
+    """
+    now = time.time()
+    manifest = _manifests.get(uploads_folder)
+    if manifest and now - manifest["loaded_at"] < DIRECTORY_CHECK_INTERVAL:
+        return manifest
+
+    manifest_file = _manifest_file(uploads_folder)
+    try:
+        file_mtime_ns = os.stat(manifest_file).st_mtime_ns
+    except OSError:
+        file_mtime_ns = None
+
+    if manifest and manifest["file_mtime_ns"] == file_mtime_ns:
+        manifest["loaded_at"] = now
+        return manifest
+
+    dirs = {}
+    if file_mtime_ns is not None:
+        try:
+            with open(manifest_file, "r") as f:
+                dirs = json.load(f).get("dirs", {})
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring unreadable manifest {manifest_file}: {e}")
+
+    manifest = {
+        "file_mtime_ns": file_mtime_ns,
+        "loaded_at": now,
+        "dirs": dirs,
+        "checked_at": {},
+    }
+    _manifests[uploads_folder] = manifest
+    return manifest
+
+
+def _save_manifest(uploads_folder, manifest):
+    manifest_file = _manifest_file(uploads_folder)
+    temp_file = None
+    try:
+        os.makedirs(MANIFESTS_FOLDER, exist_ok=True)
+        # A temp file of its own, other threads and processes save too
+        fd, temp_file = tempfile.mkstemp(
+            dir=MANIFESTS_FOLDER, prefix=f"{uploads_folder}.", suffix=".tmp"
+        )
+        with os.fdopen(fd, "w") as f:
+            json.dump({"dirs": manifest["dirs"]}, f)
+        os.replace(temp_file, manifest_file)
+        temp_file = None
+        manifest["file_mtime_ns"] = os.stat(manifest_file).st_mtime_ns
+    except OSError as e:
+        logger.error(f"Could not save manifest {manifest_file}: {e}")
+    finally:
+        if temp_file is not None:
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+
+
+def _manifest_listing(uploads_folder, relative_dir):
+    with _manifests_lock:
+        return _locked_manifest_listing(uploads_folder, relative_dir)
+
+
+def _locked_manifest_listing(uploads_folder, relative_dir):
+    manifest = _load_manifest(uploads_folder)
+    record = manifest["dirs"].get(relative_dir)
+    now = time.time()
+
+    last_checked = manifest["checked_at"].get(relative_dir)
+    if last_checked and now - last_checked < DIRECTORY_CHECK_INTERVAL:
+        return record["entries"] if record else {}
+    manifest["checked_at"][relative_dir] = now
+
+    path = os.path.join(PROCESSED_ROOT, uploads_folder, relative_dir)
+    try:
+        dir_mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        if record is not None:
+            del manifest["dirs"][relative_dir]
+            _save_manifest(uploads_folder, manifest)
+        return {}
+
+    if (
+        record
+        and record["mtime_ns"] == dir_mtime_ns
+        and now - record["scanned_at"] < LISTING_MAX_AGE
+    ):
+        return record["entries"]
+
+    entries = _scan_directory(path)
+    if entries is None:
+        return {}
+
+    record = {
+        "mtime_ns": dir_mtime_ns,
+        "scanned_at": now,
+        "entries": {name: list(info) for name, info in entries.items()},
+    }
+    manifest["dirs"][relative_dir] = record
+    _save_manifest(uploads_folder, manifest)
+    return record["entries"]
+
+
+def _plain_listing(path):
+    try:
+        dir_stat = os.stat(path)
+    except OSError:
+        _listing_cache.pop(path, None)
+        return {}
+
+    cached = _listing_cache.get(path)
+    if (
+        cached
+        and cached[0] == dir_stat.st_mtime_ns
+        and time.time() - cached[1] < LISTING_MAX_AGE
+    ):
+        return cached[2]
+
+    entries = _scan_directory(path)
+    if entries is None:
+        return {}
+
+    _listing_cache[path] = (dir_stat.st_mtime_ns, time.time(), entries)
+    return entries
+
+
+def list_directory(path):
+    """
+    Returns {entry_name: (is_file, size_in_bytes, mtime)} for the entries
+    directly inside path, or an empty dictionary if path is not a
+    directory. Subsequent calls cost at most one stat() while the
+    directory is unchanged.
+    """
+    located = _locate(path)
+    if located is None:
+        return _plain_listing(path)
+    return _manifest_listing(*located)
+
+
+def file_info(path):
+    """Returns (size_in_bytes, mtime) of a file, or None if it is missing."""
+    directory, name = os.path.split(os.path.normpath(path))
+    entry = list_directory(directory).get(name)
+    if entry and entry[0]:
+        return entry[1], entry[2]
+    return None
+
+
+def file_exists(path):
+    """Cached equivalent of os.path.isfile(path)."""
+    return file_info(path) is not None
+
+
+def path_exists(path):
+    """Cached equivalent of os.path.exists(path), for files or folders."""
+    directory, name = os.path.split(os.path.normpath(path))
+    return name in list_directory(directory)
+
+
+def get_upload_manifest(uploads_folder):
+    """
+    Returns what is currently recorded for an upload folder, as
+    {relative_directory: {entry_name: (is_file, size, mtime)}}.
+    Only directories that have been looked at are recorded.
+    """
+    with _manifests_lock:
+        manifest = _load_manifest(uploads_folder)
+        return {
+            relative_dir: record["entries"]
+            for relative_dir, record in manifest["dirs"].items()
+        }
+
+
+def invalidate(path=None):
+    """
+    Forgets what is recorded about path and everything below it, or
+    about everything if no path is given. Celery tasks call this after
+    they write into seq_processed so that pages see the new files on
+    their next look, in every process.
+    """
+    if path is None:
+        _listing_cache.clear()
+        with _manifests_lock:
+            _manifests.clear()
+        return
+
+    _listing_cache.pop(path, None)
+
+    located = _locate(path)
+    if located is None:
+        return
+
+    uploads_folder, relative_dir = located
+    prefix = f"{relative_dir}/" if relative_dir else ""
+    with _manifests_lock:
+        manifest = _load_manifest(uploads_folder)
+        stale = [
+            recorded_dir
+            for recorded_dir in manifest["dirs"]
+            if recorded_dir == relative_dir or recorded_dir.startswith(prefix)
+        ]
+        for recorded_dir in stale:
+            del manifest["dirs"][recorded_dir]
+        manifest["checked_at"].clear()
+        if stale:
+            _save_manifest(uploads_folder, manifest)
@@ -1,7 +1,7 @@
 import ee
 import json
 import logging
-from helpers.ecoregions import return_ecoregion
+from helpers.ecoregions import resolve_ecoregions
 
 # Define the path to the service account JSON
 service_account_key = "/google_auth_file/key_file.json"
@@ -62,33 +62,22 @@ def get_land_use(longitude, latitude):
 
 
 def get_resolve_ecoregion(longitude, latitude):
-    """Get the resolved ecoregion name using the Geopandas container."""
-    coordinates_list = [(latitude, longitude)]  # Ensure correct format
-    result = return_ecoregion(coordinates_list)
-
-    try:
-        output = json.loads(result)  # Parse the JSON string
-
-        if isinstance(output, list) and output:
-            ecoregion_data = output[0]  # Extract the first result
-
-            if (
-                "ecoregion" in ecoregion_data
-                and "ECO_NAME" in ecoregion_data["ecoregion"]
-            ):
-                return ecoregion_data["ecoregion"][
-                    "ECO_NAME"
-                ]  # Return the ecoregion name
-            else:
-                logger.error("Unexpected response format: Missing 'ECO_NAME'")
-                return None
-        else:
-            logger.error("Unexpected response format from Geopandas")
-            return None
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse Geopandas response: {e}")
+    """Get the resolved ecoregion name using the Geopandas service."""
+    output = resolve_ecoregions([(latitude, longitude)])
+    if not output:
         return None
 
+    ecoregion_data = output[0]  # Extract the first result
+    if (
+        "ecoregion" in ecoregion_data
+        and "ECO_NAME" in ecoregion_data["ecoregion"]
+    ):
+        return ecoregion_data["ecoregion"][
+            "ECO_NAME"
+        ]  # Return the ecoregion name
+    logger.error("Unexpected response format: Missing 'ECO_NAME'")
+    return None
+
 
 def get_baileys_ecoregion(longitude, latitude):
     # Load the UNEP-WCMC Baileys Ecoregions of the World dataset
@@ -1,58 +1,54 @@
-import os
 import re
-import math
 import logging
-import json
 import pandas as pd
 from unidecode import unidecode
-from collections import defaultdict
 from flask_login import current_user
+from helpers import metadata_config
+from helpers.metadata_config import build_canonical_lookup
 
 logger = logging.getLogger("my_app_logger")
 
+# in 2025-04-10 we changed the accepted soil depths
+# but because templates were out in the world
+# and data would keep coming in with the old values
+# we would have to continue accepting them
+# So for this field we overide the json of the values
+# and we check the validity with a function
+# accepting both old and new values
+SOIL_DEPTHS = [
+    "0-20cm",
+    "20cm-40cm",
+    "40cm-60cm",
+    "60cm-80cm",
+    "80cm-1m",
+    "1m+",
+    "0-10cm",
+    "10-20cm",
+    "20cm-30cm",
+    "30cm-1m",
+]
+
+# Regular expression for YYYY-MM-DD format
+DATE_FORMAT = r"\b\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12][0-9]|3[01])\b"
 
-def get_columns_data(exclude=True):
-    current_dir = os.path.dirname(__file__)
-    base_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
-    columns_file_path = os.path.join(
-        base_dir, "metadataconfig", "columns.json"
-    )
-
-    # Load the main configuration JSON
-    with open(columns_file_path, "r") as columns_file:
-        data = json.load(columns_file)
-
-    # Process each item in the data
-    for key, value in list(data.items()):
-        # Exclude fields with "excludeFromTemplate": "True" if exclude is True
-        if exclude and value.get("excludeFromTemplate") == "True":
-            del data[key]  # Remove the key from the data
-            continue
 
-        lookup_file = value.get("lookup_file")
-        if (
-            lookup_file and lookup_file.strip()
-        ):  # Check if lookup_file is not empty
-            lookup_file_path = os.path.join(
-                base_dir, "metadataconfig", lookup_file
-            )
-            if os.path.exists(lookup_file_path) and lookup_file_path.endswith(
-                ".json"
-            ):
-                with open(lookup_file_path, "r") as lookup:
-                    value["options"] = json.load(lookup)
-            else:
-                value["options"] = []  # Handle missing or unsupported files
-
-            # Check for allowAdminNA and if the user is an admin
-            if (
-                current_user.is_authenticated
-                and current_user.admin
-                and value.get("allowAdminNA") == "True"
-            ):
-                value["options"].append("NA")
+def get_columns_data(exclude=True):
+    """
+    The columns of columns.json with the options of their lookup files,
+    without those excluded from the template if exclude is True.
+    The columns are shared (see helpers.metadata_config) and must not
+    be modified, the returned dict may be.
+    """
+    config = metadata_config.fields("columns.json")
+    columns = config["template"] if exclude else config["all"]
 
-    return data
+    # Check for allowAdminNA and if the user is an admin
+    if current_user.is_authenticated and current_user.admin:
+        return {
+            key: config["admin"].get(key, value)
+            for key, value in columns.items()
+        }
+    return dict(columns)
 
 
 def normalize_value(value, options):
@@ -94,34 +90,11 @@ def normalize_row(datadict, columns_data):
 
 
 def get_project_common_data():
-    current_dir = os.path.dirname(__file__)
-    base_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
-    columns_file_path = os.path.join(
-        base_dir, "metadataconfig", "project_common_data.json"
-    )
-
-    # Load the primary JSON configuration
-    with open(columns_file_path, "r") as columns_file:
-        data = json.load(columns_file)
-
-    # Process each item in the data
-    for key, value in data.items():
-        lookup_file = value.get("lookup_file")
-        if (
-            lookup_file and lookup_file.strip()
-        ):  # Check if lookup_file is not empty
-            lookup_file_path = os.path.join(
-                base_dir, "metadataconfig", lookup_file
-            )
-            if os.path.exists(lookup_file_path) and lookup_file_path.endswith(
-                ".json"
-            ):
-                with open(lookup_file_path, "r") as lookup:
-                    value["options"] = json.load(lookup)
-            else:
-                value["options"] = []  # Handle missing or unsupported files
-
-    return data
+    """
+    The fields of project_common_data.json with the options of their
+    lookup files. The fields are shared and must not be modified.
+    """
+    return dict(metadata_config.fields("project_common_data.json")["all"])
 
 
 def check_sample_id(sample_id):
@@ -161,26 +134,7 @@ def check_vegetation(value):
 
 
 def check_soil_depth(value):
-    # in 2025-04-10 we changed the accepted values
-    # but because templates were out in the world
-    # and data would keep coming in with the old values
-    # we would have to continue accepting them
-    # So for this field we overide the json of the values
-    # and we check the validity with a function
-    # accepting both old and new values
-    if value in [
-        "0-20cm",
-        "20cm-40cm",
-        "40cm-60cm",
-        "60cm-80cm",
-        "80cm-1m",
-        "1m+",
-        "0-10cm",
-        "10-20cm",
-        "20cm-30cm",
-        "30cm-1m",
-        "1m+",
-    ]:
+    if value in SOIL_DEPTHS:
         return {"status": 1, "message": "Valid value"}
     else:
         return {"status": 0, "message": "Not an accepted soil depth"}
@@ -212,13 +166,6 @@ def check_field_length_value(value, max_length):
         return {"status": 1, "message": "Valid value"}
 
 
-def build_canonical_lookup(valid_values):
-    """
-    Build a mapping of lowercase value → canonical value
-    """
-    return {str(v).strip().lower(): v for v in valid_values}
-
-
 def check_field_values_lookup(df, valid_values, field_name, allow_empty=True):
     """
     Check if field_name values are valid based on the valid_values list.
@@ -261,10 +208,7 @@ def check_date_collected(date):
     """
     Check if a single Date_collected value is in YYYY-MM-DD format.
     """
-    # Regular expression for YYYY-MM-DD format
-    date_format = r"\b\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12][0-9]|3[01])\b"
-
-    if not re.match(date_format, str(date)):
+    if not re.match(DATE_FORMAT, str(date)):
         return {"status": 0, "message": "Invalid value"}
     else:
         return {"status": 1, "message": "Valid value"}
@@ -384,6 +328,237 @@ def check_latitude_longitude(value):
         return {"status": 0, "message": "Invalid value: not a valid number"}
 
 
+def _is_empty(values):
+    """Empty cells: None, NaN or ""."""
+    return values.isna() | (values == "")
+
+
+def _messages(invalid, message):
+    """Series of message where invalid is True and None elsewhere."""
+    return invalid.map({True: message, False: None})
+
+
+def _check_sample_id_column(values):
+    stripped = values.astype(str).str.strip()
+    messages = _messages(
+        ~stripped.str.match(r"^[A-Za-z0-9_]+$"),
+        (
+            "SampleID contains invalid characters. "
+            "Only letters, numbers, and underscores are allowed."
+        ),
+    )
+    messages[stripped == ""] = "SampleID cannot be empty"
+    return messages
+
+
+def _check_field_length_column(max_length):
+    def check(values):
+        return _messages(
+            values.astype(str).str.len() > max_length,
+            f"Value exceeds maximum length of {max_length}",
+        )
+
+    return check
+
+
+def _check_soil_depth_column(values):
+    return _messages(~values.isin(SOIL_DEPTHS), "Not an accepted soil depth")
+
+
+def _check_date_collected_column(values):
+    return _messages(
+        ~values.astype(str).str.match(DATE_FORMAT), "Invalid value"
+    )
+
+
+# Whole column versions of the check functions named in columns.json.
+# Check functions without one are called once per distinct value.
+COLUMN_CHECKS = {
+    "check_sample_id": _check_sample_id_column,
+    "check_sequencing_facility": _check_field_length_column(150),
+    "check_vegetation": _check_field_length_column(200),
+    "check_soil_depth": _check_soil_depth_column,
+    "check_expedition_lead": _check_field_length_column(150),
+    "check_notes": _check_field_length_column(200),
+    "check_collaborators_value": _check_field_length_column(150),
+    "check_date_collected": _check_date_collected_column,
+}
+
+
+def _check_values_column(check_function):
+    def check(values):
+        results = {}
+        messages = []
+        for value in values:
+            key = (type(value), value)
+            if key not in results:
+                results[key] = check_function(value)
+            result = results[key]
+            messages.append(None if result["status"] else result["message"])
+        return pd.Series(messages, index=values.index, dtype=object)
+
+    return check
+
+
+def _check_lookup_column(options, field_name, allow_empty, canonical=None):
+    if canonical is None:
+        canonical = build_canonical_lookup(options)
+    canonical_lower = list(canonical)
+    message = f"Invalid {field_name} values"
+
+    def check(values):
+        stripped = values.astype(str).str.strip()
+        empty = values.isna() | (stripped == "")
+        invalid = ~stripped.str.lower().isin(canonical_lower)
+        invalid = invalid & ~empty if allow_empty else invalid | empty
+        return _messages(invalid, message)
+
+    return check
+
+
+def _check_function_not_found(check_function_name):
+    # Every cell is reported, with the spacing check_row always had
+    message = f"Check function {' ' * 32}{check_function_name} not found"
+
+    def check(values):
+        return pd.Series(message, index=values.index, dtype=object)
+
+    return check
+
+
+def compile_rules(expected_columns_data, canonical_lookups=None):
+    """
+    Turns the columns of get_columns_data into validation rules, one
+    per column, each checking a whole pandas column at once.
+    A rule is a dict with:
+
+    - column: the column name
+    - required: empty cells are reported, unless admin_na
+    - admin_na: the column allows NA from admins and the user is one
+    - check: function of the non-empty cells of the column (or of all
+      cells when skip_empty is False) returning a Series of messages,
+      None where the value is valid
+    - message: message of the column's issue when check fails
+
+    canonical_lookups are the prebuilt {column: {lowercase option:
+    option}} of the columns' options (see helpers.metadata_config), they
+    are built here when not given.
+    """
+    rules = []
+    for column_key, column_values in expected_columns_data.items():
+        admin_na = (
+            column_values.get("allowAdminNA", False) == "True"
+            and current_user.admin
+        )
+        rule = {
+            "column": column_key,
+            "required": bool(column_values.get("required", False)),
+            "admin_na": admin_na,
+            "check": None,
+            "skip_empty": True,
+            "message": f"Column {column_key} has invalid values",
+        }
+
+        if "check_function" in column_values:
+            check_function_name = column_values["check_function"]
+            if check_function_name in COLUMN_CHECKS:
+                rule["check"] = COLUMN_CHECKS[check_function_name]
+            elif check_function_name in globals():
+                rule["check"] = _check_values_column(
+                    globals()[check_function_name]
+                )
+            else:
+                rule["check"] = _check_function_not_found(check_function_name)
+                rule["skip_empty"] = False
+                rule["message"] = (
+                    f"Check function {check_function_name} not found"
+                )
+        elif "options" in column_values:
+            rule["check"] = _check_lookup_column(
+                column_values["options"],
+                column_key,
+                admin_na,
+                (canonical_lookups or {}).get(column_key),
+            )
+            rule["skip_empty"] = False
+            rule["message"] = f"Invalid {column_key} values"
+
+        rules.append(rule)
+    return rules
+
+
+def check_columns(df, rules):
+    """
+    Runs the rules over the rows of df that are not controls.
+    Returns {column: {"status": 0, "invalid": [...], "message": ...}}
+    for the columns with invalid cells, in the order check_row would
+    have found them (by first invalid row, then by column), with the
+    invalid cells in row order.
+    """
+    rows = df
+    if "Sample_or_Control" in df.columns:
+        rows = df[df["Sample_or_Control"] != "Control"]
+    labels = rows.index.tolist()
+
+    found = []
+    for column_order, rule in enumerate(rules):
+        column_key = rule["column"]
+        if column_key not in rows.columns or rows.empty:
+            continue
+
+        values = rows[column_key].reset_index(drop=True)
+        cell_values = values.tolist()
+        empty = _is_empty(values)
+        errors = {}
+
+        # Required but empty: reported, the cell is not checked further
+        if rule["required"] and not rule["admin_na"]:
+            reported_empty = empty
+        else:
+            reported_empty = pd.Series(False, index=values.index)
+        for position in reported_empty[reported_empty].index:
+            errors[position] = (
+                {
+                    "row": labels[position],
+                    "value": "",
+                    # With the spacing check_row always had
+                    "message": (
+                        f"Required column {column_key}{' ' * 37}"
+                        "has empty values"
+                    ),
+                },
+                f"Required column {column_key} has empty values",
+            )
+
+        if rule["check"] is not None:
+            to_check = ~reported_empty
+            if rule["skip_empty"]:
+                to_check &= ~empty
+            messages = rule["check"](values[to_check]).dropna()
+            for position, message in messages.items():
+                errors[position] = (
+                    {
+                        "row": labels[position],
+                        "value": cell_values[position],
+                        "message": message,
+                    },
+                    rule["message"],
+                )
+
+        if errors:
+            found.append((min(errors), column_order, column_key, errors))
+
+    issues = {}
+    for first_position, _, column_key, errors in sorted(found):
+        first_message = errors[first_position][1]
+        issues[column_key] = {
+            "status": 0,
+            "invalid": [errors[position][0] for position in sorted(errors)],
+            "message": first_message,
+        }
+    return issues
+
+
 def check_metadata(df, using_scripps):
     """
     Check metadata including columns, and validity of fields.
@@ -393,9 +568,12 @@ def check_metadata(df, using_scripps):
     issues = {}
     messages = []
 
+    # The columns are shared, the ones that change are replaced
     for key, value in expected_columns_data.items():
         if "required" in value and value["required"] == "IfNotScripps":
-            value["required"] = using_scripps.lower() != "yes"
+            expected_columns_data[key] = dict(
+                value, required=using_scripps.lower() != "yes"
+            )
 
     # Check for presence of "Control" in "Sample_or_Control" column
     if "Sample_or_Control" in df.columns:
@@ -419,36 +597,38 @@ def check_metadata(df, using_scripps):
     if "SampleID" in df.columns:
         duplicates = df[df.duplicated(subset="SampleID", keep=False)]
         if not duplicates.empty:
-            duplicate_entries = []
-            for idx, value in duplicates.iterrows():
-                duplicate_entries.append(
+            issues["SampleID"] = {
+                "status": 0,
+                "message": "Duplicate SampleID values found.",
+                "invalid": [
                     {
                         "row": idx,
-                        "value": value["SampleID"],
+                        "value": value,
                         "message": "Duplicate SampleID value found",
                     }
-                )
-            issues["SampleID"] = {
-                "status": 0,
-                "message": "Duplicate SampleID values found.",
-                "invalid": duplicate_entries,
+                    for idx, value in zip(
+                        duplicates.index.tolist(),
+                        duplicates["SampleID"].tolist(),
+                    )
+                ],
             }
             overall_status = 0
 
-    # Check each row using the check_row function
-    for idx, row in df.iterrows():
-        row_result = check_row(row, expected_columns_data)
-        if row_result["status"] == 0:
-            overall_status = 0
-            for key, value in row_result.items():
-                if key != "status":
-                    if key not in issues:
-                        issues[key] = {
-                            "status": 0,
-                            "invalid": [],
-                            "message": value["message"],
-                        }
-                    issues[key]["invalid"].extend(value["invalid"])
+    # Check all the rows, a column at a time
+    config = metadata_config.fields("columns.json")
+    if current_user.is_authenticated and current_user.admin:
+        canonical_lookups = config["canonical_admin"]
+    else:
+        canonical_lookups = config["canonical"]
+    column_issues = check_columns(
+        df, compile_rules(expected_columns_data, canonical_lookups)
+    )
+    for key, value in column_issues.items():
+        overall_status = 0
+        if key not in issues:
+            issues[key] = value
+        else:
+            issues[key]["invalid"].extend(value["invalid"])
 
     final_result = {"status": overall_status}
     final_result.update(issues)
@@ -463,151 +643,17 @@ def check_row(row, expected_columns_data):
     """
     Validate a single row of data.
     """
-    # Skip checks if "Sample_or_Control" column
-    # exists and its value is "Control"
-    if (
-        "Sample_or_Control" in row.index
-        and row["Sample_or_Control"] == "Control"
-    ):
-        return {"status": 1}
-    row_issues = {}
-    row_status = 1
-
-    for column_key, column_values in expected_columns_data.items():
-        if column_key not in row.index:
-            continue  # Skip missing columns
-
-        allow_admin_na = (
-            column_values.get("allowAdminNA", False) == "True"
-            and current_user.admin
-        )
-
-        # Check if the field is required but has empty values
-        column_data = row[column_key]
-        if column_values.get("required", False):
-            if (
-                column_data is None
-                or column_data == ""
-                or (isinstance(column_data, float) and math.isnan(column_data))
-            ):
-                if not allow_admin_na:
-                    row_issues[column_key] = {
-                        "status": 0,
-                        "invalid": [
-                            {
-                                "row": row.name,
-                                "value": "",
-                                "message": (
-                                    f"Required column {column_key} \
-                                    has empty values"
-                                ),
-                            }
-                        ],
-                        "message": (
-                            f"Required column {column_key} has empty values"
-                        ),
-                    }
-                    row_status = 0
-                    # Skip further checks for this column if empty values found
-                    continue
-
-        # Perform specific checks based on the type of validation
-        if "check_function" in column_values:
-            check_function_name = column_values["check_function"]
-            if check_function_name in globals():
-                check_function = globals()[check_function_name]
-                if not (
-                    column_data is None
-                    or column_data == ""
-                    or (
-                        isinstance(column_data, float)
-                        and math.isnan(column_data)
-                    )
-                ):
-                    check_result = check_function(column_data)
-                    if check_result["status"] == 0:
-                        row_status = 0
-                        row_issues[column_key] = {
-                            "status": 0,
-                            "invalid": [
-                                {
-                                    "row": row.name,
-                                    "value": column_data,
-                                    "message": check_result["message"],
-                                }
-                            ],
-                            "message": (
-                                f"Column {column_key} has invalid values"
-                            ),
-                        }
-            else:
-                row_status = 0
-                row_issues[column_key] = {
-                    "status": 0,
-                    "invalid": [
-                        {
-                            "row": row.name,
-                            "value": column_data,
-                            "message": (
-                                f"Check function \
-                                {check_function_name} not found"
-                            ),
-                        }
-                    ],
-                    "message": (
-                        f"Check function {check_function_name} not found"
-                    ),
-                }
-        elif "options" in column_values:
-            options_check_result = check_field_values_lookup(
-                pd.DataFrame([row]),
-                column_values["options"],
-                column_key,
-                allow_admin_na,
-            )
-            if options_check_result["status"] == 0:
-                row_status = 0
-                row_issues[column_key] = {
-                    "status": 0,
-                    "invalid": [
-                        {
-                            "row": row.name,
-                            "value": column_data,
-                            "message": options_check_result["message"],
-                        }
-                    ],
-                    "message": options_check_result["message"],
-                }
-
-    row_result = {"status": row_status}
+    row_issues = check_columns(
+        row.to_frame().T, compile_rules(expected_columns_data)
+    )
+    row_result = {"status": 0 if row_issues else 1}
     row_result.update(row_issues)
-
     return row_result
 
 
 def get_primer_sets_regions():
-    current_dir = os.path.dirname(__file__)
-    base_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
-    regions_file_path = os.path.join(
-        base_dir, "metadataconfig", "primer_set_regions.json"
-    )
-
-    # Load the JSON file
-    with open(regions_file_path, "r") as f:
-        primer_set_regions = json.load(f)
-
-    return primer_set_regions
-
-
-def primers_forward_to_reverse(primer_set_regions):
-
-    forward_to_reverse = defaultdict(list)
-
-    for key in primer_set_regions:
-        forward, reverse = key.split("/")
-        if reverse not in forward_to_reverse[forward]:
-            forward_to_reverse[forward].append(reverse)
-    return forward_to_reverse
+    """primer_set_regions.json, shared: it must not be modified."""
+    return metadata_config.load_json("primer_set_regions.json")
 
 
 def get_sequences_based_on_primers(forward_primer, reverse_primer):
@@ -0,0 +1,202 @@
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger("my_app_logger")  # Use the same name as in app.py
+
+CONFIG_FOLDER = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), os.pardir, "metadataconfig")
+)
+
+# Parsed files, {path: ((mtime_ns, size), data)}
+_files = {}
+
+# Structures built from parsed files, {key: (inputs, value)}. They are
+# built again when one of the parsed files they were built from is
+# replaced, which is checked by identity.
+_built = {}
+
+_lock = threading.Lock()
+
+# Options of a lookup file that is missing or not JSON
+_NO_OPTIONS = ()
+
+
+def _signature(path):
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        return None
+    return file_stat.st_mtime_ns, file_stat.st_size
+
+
+def load_json(filename):
+    """
+    Parsed content of metadataconfig/<filename>. The file is read once
+    per process and again only when its mtime or size changes.
+    The data is shared between all callers and must not be modified.
+    """
+    path = os.path.join(CONFIG_FOLDER, filename)
+    signature = _signature(path)
+    cached = _files.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    with open(path, "r") as f:
+        data = json.load(f)
+    with _lock:
+        _files[path] = (signature, data)
+    if cached is not None:
+        logger.info(f"Reloaded metadata configuration {filename}")
+    return data
+
+
+def _derived(key, inputs, build):
+    """build(*inputs), cached until one of the inputs is replaced."""
+    cached = _built.get(key)
+    if cached is not None and len(cached[0]) == len(inputs):
+        if all(old is new for old, new in zip(cached[0], inputs)):
+            return cached[1]
+
+    value = build(*inputs)
+    with _lock:
+        _built[key] = (inputs, value)
+    return value
+
+
+def _lookup_options(lookup_file):
+    if not lookup_file.endswith(".json") or not os.path.exists(
+        os.path.join(CONFIG_FOLDER, lookup_file)
+    ):
+        return _NO_OPTIONS  # Handle missing or unsupported files
+    return load_json(lookup_file)
+
+
+def build_canonical_lookup(valid_values):
+    """
+    Build a mapping of lowercase value → canonical value
+    """
+    return {str(v).strip().lower(): v for v in valid_values}
+
+
+def _build_fields(fields, lookup_options):
+    all_fields = {}
+    admin_fields = {}
+    canonical = {}
+    canonical_admin = {}
+
+    for key, value in fields.items():
+        lookup_file = (value.get("lookup_file") or "").strip()
+        if not lookup_file:
+            all_fields[key] = value
+            continue
+
+        options = list(lookup_options[lookup_file])
+        all_fields[key] = dict(value, options=options)
+        canonical[key] = build_canonical_lookup(options)
+        if value.get("allowAdminNA") == "True":
+            admin_options = options + ["NA"]
+            admin_fields[key] = dict(value, options=admin_options)
+            canonical_admin[key] = build_canonical_lookup(admin_options)
+
+    return {
+        "all": all_fields,
+        "template": {
+            key: value
+            for key, value in all_fields.items()
+            if value.get("excludeFromTemplate") != "True"
+        },
+        "admin": admin_fields,
+        "canonical": canonical,
+        "canonical_admin": dict(canonical, **canonical_admin),
+    }
+
+
+def fields(filename):
+    """
+    The fields of a configuration file like columns.json, with the
+    options of their lookup files. Returns a dict with:
+
+    - all: {key: field}, fields with a lookup file have "options"
+    - template: the same without the fields excluded from the template
+    - admin: {key: field} of the fields that allow NA from admins,
+      with "NA" added to their options
+    - canonical, canonical_admin: {key: {lowercase option: option}} of
+      the fields with options, for users and for admins
+
+    Everything is built once and shared, it must not be modified.
+    """
+    data = load_json(filename)
+    lookup_files = sorted(
+        {
+            value["lookup_file"].strip()
+            for value in data.values()
+            if (value.get("lookup_file") or "").strip()
+        }
+    )
+    return _derived(
+        ("fields", filename, tuple(lookup_files)),
+        (data,) + tuple(_lookup_options(name) for name in lookup_files),
+        lambda data, *options: _build_fields(
+            data, dict(zip(lookup_files, options))
+        ),
+    )
+
+
+def _build_primer_sets(primer_set_regions):
+    forward_to_reverse = {}
+    for primer_set in primer_set_regions:
+        forward, reverse = primer_set.split("/")
+        reverses = forward_to_reverse.setdefault(forward, [])
+        if reverse not in reverses:
+            reverses.append(reverse)
+
+    return {
+        "primer_to_region": {
+            primer_set: value["Region"]
+            for primer_set, value in primer_set_regions.items()
+        },
+        "forward_to_reverse": forward_to_reverse,
+    }
+
+
+def primer_sets():
+    """
+    Maps built from primer_set_regions.json:
+
+    - primer_to_region: {"forward/reverse": region}
+    - forward_to_reverse: {forward primer: [reverse primers]}
+
+    Shared, they must not be modified.
+    """
+    return _derived(
+        "primer_sets",
+        (load_json("primer_set_regions.json"),),
+        _build_primer_sets,
+    )
+
+
+def _build_excluded_otus(excluded_otus):
+    by_project = {}
+    for entry in excluded_otus:
+        by_project.setdefault(entry["project_id"], []).append(
+            {
+                "Taxonomy_level": entry["Taxonomy_level"],
+                "Value": entry["Value"],
+            }
+        )
+    return by_project
+
+
+def excluded_otus(project_id):
+    """
+    The OTUs of excluded_otus.json excluded from the reports of a
+    project, as [{"Taxonomy_level": ..., "Value": ...}].
+    """
+    by_project = _derived(
+        "excluded_otus",
+        (load_json("excluded_otus.json"),),
+        _build_excluded_otus,
+    )
+    return list(by_project.get(project_id, []))
@@ -0,0 +1,235 @@
+import itertools
+
+import numpy as np
+
+from helpers.fastq_stats import open_fastq
+
+# Every base is a bit, a degenerate base matches any of its bits.
+# Inosine (I) pairs with any base, like N.
+IUPAC_CODES = {
+    "A": 1,
+    "C": 2,
+    "G": 4,
+    "T": 8,
+    "U": 8,
+    "R": 1 | 4,
+    "Y": 2 | 8,
+    "S": 2 | 4,
+    "W": 1 | 8,
+    "K": 4 | 8,
+    "M": 1 | 2,
+    "B": 2 | 4 | 8,
+    "D": 1 | 4 | 8,
+    "H": 1 | 2 | 8,
+    "V": 1 | 2 | 4,
+    "N": 15,
+    "I": 15,
+}
+
+IUPAC_COMPLEMENTS = str.maketrans("ACGTURYSWKMBDHVNI", "TGCAAYRSWMKVHDBNI")
+
+# Read bases as bits, anything else (N in reads too, as in cutadapt
+# without --match-read-wildcards) matches nothing
+READ_CODES = np.zeros(256, dtype=np.uint8)
+for base in "ACGT":
+    READ_CODES[ord(base)] = IUPAC_CODES[base]
+    READ_CODES[ord(base.lower())] = IUPAC_CODES[base]
+
+# Errors (mismatches and indels) allowed per primer base,
+# cutadapt's default error rate
+MAX_ERROR_RATE = 0.1
+
+# Longest primer the matcher handles, a primer is one 64 bit word
+MAX_PRIMER_LENGTH = 64
+
+# Read pairs looked at by default
+SAMPLE_READS = 10000
+
+# vsearch merges R1 with the reverse complement of R2 where they
+# overlap. We look for k-mers taken from the end of R1 in the reverse
+# complement of R2 and accept the overlap they give if it is long and
+# similar enough (vsearch's --fastq_minovlen and --fastq_maxdiffs).
+OVERLAP_KMER = 12
+OVERLAP_KMER_STEP = 6
+MERGE_MIN_OVERLAP = 10
+MERGE_MAX_DIFFS = 10
+
+
+def reverse_complement(sequence):
+    """Reverse complement of a DNA sequence, degenerate bases included."""
+    return sequence.upper().translate(IUPAC_COMPLEMENTS)[::-1]
+
+
+def compile_primer(sequence):
+    """
+    Table of 64 bit masks, one per read base code, with bit i set when
+    that base matches base i of the primer (see IUPAC_CODES).
+    """
+    sequence = sequence.upper()
+    if not 0 < len(sequence) <= MAX_PRIMER_LENGTH:
+        raise ValueError(
+            f"Primer {sequence} must have 1 to {MAX_PRIMER_LENGTH} bases"
+        )
+    try:
+        masks = [IUPAC_CODES[base] for base in sequence]
+    except KeyError as e:
+        raise ValueError(f"Not a IUPAC base in primer {sequence}: {e}")
+
+    table = np.zeros(256, dtype=np.uint64)
+    for code in range(256):
+        table[code] = sum(
+            1 << i for i, mask in enumerate(masks) if code & mask
+        )
+    return table, len(masks)
+
+
+def encode_reads(sequences):
+    """
+    2D array of base codes, one row per read, padded with zeros
+    (which match nothing) to the longest read.
+    """
+    width = max((len(sequence) for sequence in sequences), default=0)
+    padded = b"".join(sequence.ljust(width, b"\0") for sequence in sequences)
+    codes = READ_CODES[np.frombuffer(padded, dtype=np.uint8)]
+    return codes.reshape(len(sequences), width)
+
+
+def find_primer(reads, primer, max_error_rate=MAX_ERROR_RATE):
+    """
+    Boolean array telling which rows of encoded reads contain the
+    compiled primer anywhere, with an edit distance of at most
+    max_error_rate per primer base.
+
+    This is Myers' bit-parallel algorithm: the edit distance column
+    of every read is kept in two bit vectors and all reads advance by
+    one base per step, so the loop runs once per read position.
+    """
+    table, length = primer
+    full = np.uint64((1 << length) - 1)
+    high = np.uint64(1 << (length - 1))
+    one = np.uint64(1)
+
+    count = reads.shape[0]
+    positive = np.full(count, full, dtype=np.uint64)
+    negative = np.zeros(count, dtype=np.uint64)
+    score = np.full(count, length, dtype=np.int32)
+    best = score.copy()
+
+    for column in reads.T:
+        equal = table[column]
+        vertical = equal | negative
+        horizontal = (
+            (((equal & positive) + positive) & full) ^ positive
+        ) | equal
+        plus = (negative | ~(horizontal | positive)) & full
+        minus = positive & horizontal
+        score += (plus & high) != 0
+        score -= (minus & high) != 0
+        # A match may start anywhere in the read, so the
+        # first row stays zero and nothing is shifted in
+        plus = (plus << one) & full
+        minus = (minus << one) & full
+        positive = (minus | ~(vertical | plus)) & full
+        negative = plus & vertical
+        np.minimum(best, score, out=best)
+
+    return best <= int(length * max_error_rate)
+
+
+def _merged_length(read_1, read_2):
+    """
+    Length of the read vsearch would make of a pair, or None if the
+    reads do not overlap well enough to be merged.
+    """
+    read_1 = read_1.decode("ascii", "replace").upper()
+    read_2 = reverse_complement(read_2.decode("ascii", "replace"))
+    for offset in range(
+        OVERLAP_KMER, min(len(read_1), len(read_2)) + 1, OVERLAP_KMER_STEP
+    ):
+        start = len(read_1) - offset
+        position = read_2.find(read_1[start : start + OVERLAP_KMER])
+        if position < 0:
+            continue
+
+        # Where read 2 starts relative to read 1, negative when it
+        # sticks out before read 1 (staggered, the overhang is cut)
+        shift = start - position
+        if shift >= 0:
+            overlap = zip(read_1[shift:], read_2)
+        else:
+            overlap = zip(read_1, read_2[-shift:])
+        pairs = list(overlap)
+        diffs = sum(base_1 != base_2 for base_1, base_2 in pairs)
+        if len(pairs) < MERGE_MIN_OVERLAP or diffs > MERGE_MAX_DIFFS:
+            continue
+        return shift + len(read_2) if shift >= 0 else len(pairs)
+    return None
+
+
+def read_pairs(file_1_path, file_2_path, reads=SAMPLE_READS):
+    """Sequences of the first `reads` read pairs of two FASTQ files."""
+    with open_fastq(file_1_path) as stream_1, open_fastq(
+        file_2_path
+    ) as stream_2:
+        lines_1 = list(itertools.islice(stream_1, 4 * reads))
+        lines_2 = list(itertools.islice(stream_2, 4 * reads))
+    return (
+        [line.rstrip(b"\r\n") for line in lines_1[1::4]],
+        [line.rstrip(b"\r\n") for line in lines_2[1::4]],
+    )
+
+
+def count_primer_hits(
+    file_1_path,
+    file_2_path,
+    forward_primer,
+    reverse_primer,
+    reverse_primer_revcomp=None,
+    sample_reads=SAMPLE_READS,
+):
+    """
+    Counts primers on the first sample_reads read pairs, with the same
+    meaning as the columns filled by cutadapt and vsearch: forward
+    primer in R1, reverse primer in R2, both, and (when
+    reverse_primer_revcomp is given) both in pairs that can be merged
+    into a read long enough to hold the two primers.
+    Returns the counts by column name, plus "reads" (the pairs looked
+    at) and "fractions" (each count divided by reads).
+    """
+    sequences_1, sequences_2 = read_pairs(
+        file_1_path, file_2_path, sample_reads
+    )
+    pairs = min(len(sequences_1), len(sequences_2))
+    sequences_1 = sequences_1[:pairs]
+    sequences_2 = sequences_2[:pairs]
+
+    forward_hits = find_primer(
+        encode_reads(sequences_1), compile_primer(forward_primer)
+    )
+    reverse_hits = find_primer(
+        encode_reads(sequences_2), compile_primer(reverse_primer)
+    )
+    both_hits = forward_hits & reverse_hits
+
+    counts = {
+        "fwd_read_fwd_adap": int(forward_hits.sum()),
+        "rev_read_rev_adap": int(reverse_hits.sum()),
+        "fwd_rev_adap": int(both_hits.sum()),
+    }
+    if reverse_primer_revcomp:
+        primers_length = len(forward_primer) + len(reverse_primer_revcomp)
+        merged = 0
+        for i in np.flatnonzero(both_hits):
+            merged_length = _merged_length(sequences_1[i], sequences_2[i])
+            if merged_length and merged_length >= primers_length:
+                merged += 1
+        counts["fwd_rev_mrg_adap"] = merged
+
+    return dict(
+        counts,
+        reads=pairs,
+        fractions={
+            field: count / pairs if pairs else None
+            for field, count in counts.items()
+        },
+    )
@@ -6,6 +6,7 @@ import json
 import shlex
 from datetime import datetime
 from helpers.vtx import generate_vtx_file
+from helpers import metadata_config
 from jinja2 import Environment, FileSystemLoader
 from weasyprint import HTML
 from urllib.request import pathname2url
@@ -347,18 +348,8 @@ def generate_rscripts_report(
         process_data = SequencingUpload.get(process_id)
         project_id = process_data["project_id"]
 
-        # Load standard exclusions for single projects
-        with open("metadataconfig/excluded_otus.json", "r") as f:
-            excluded_otus = json.load(f)
-
-        filtered_exclusions = [
-            {
-                "Taxonomy_level": entry["Taxonomy_level"],
-                "Value": entry["Value"],
-            }
-            for entry in excluded_otus
-            if entry["project_id"] == project_id
-        ]
+        # Standard exclusions for single projects
+        filtered_exclusions = metadata_config.excluded_otus(project_id)
         exclude_json = json.dumps(filtered_exclusions)
 
         # Get Analysis ID using standard lookup
@@ -0,0 +1,97 @@
+FASTQ_EXTENSIONS = [".fastq.gz", ".fq.gz"]
+
+# Key of the records that end at a trie node, no character uses it
+_END = None
+
+
+def split_fastq_filename(filename):
+    """
+    (name without extension, extension) of a gzipped FASTQ filename,
+    or (None, None) if it has another extension.
+    """
+    for extension in FASTQ_EXTENSIONS:
+        if filename.endswith(extension):
+            return filename[: -len(extension)], extension
+    return None, None
+
+
+class SequencerIdIndex:
+    """
+    Prefix trie of the sequencer IDs of an upload. A file belongs to
+    every sequencer ID its name (without extension) starts with, which
+    the trie finds in one walk along the filename, however many
+    sequencer IDs the upload has.
+
+    records are dicts with at least "id" and "SequencerID". Matches are
+    returned in the order of the records.
+    """
+
+    def __init__(self, records):
+        self.records = list(records)
+        self._root = {}
+        for position, record in enumerate(self.records):
+            if record["SequencerID"] is None:
+                continue
+            node = self._root
+            for char in record["SequencerID"]:
+                node = node.setdefault(char, {})
+            node.setdefault(_END, []).append(position)
+
+    def __len__(self):
+        return len(self.records)
+
+    def match_records(self, filename):
+        """Records whose sequencer ID the filename starts with."""
+        name, _ = split_fastq_filename(filename)
+        if name is None:
+            return []
+
+        positions = []
+        node = self._root
+        for char in name:
+            positions += node.get(_END, [])
+            node = node.get(char)
+            if node is None:
+                break
+        else:
+            positions += node.get(_END, [])
+        return [self.records[position] for position in sorted(positions)]
+
+    def match(self, filename):
+        """Ids of the sequencer IDs matching a filename."""
+        return [record["id"] for record in self.match_records(filename)]
+
+    def match_many(self, filenames):
+        """
+        {filename: {"matches": [ids], "ambiguous": bool}} for a list of
+        filenames; ambiguous means more than one sequencer ID matches.
+        """
+        results = {}
+        for filename in filenames:
+            matches = self.match(filename)
+            results[filename] = {
+                "matches": matches,
+                "ambiguous": len(matches) > 1,
+            }
+        return results
+
+    def new_filename(self, filename):
+        """
+        Name of the processed file: SampleID, region and what follows
+        the sequencer ID in the original name, without _001. Needs the
+        records to have "SampleID" and "Region" too. None if no
+        sequencer ID matches.
+        """
+        name, extension = split_fastq_filename(filename)
+        records = self.match_records(filename)
+        if not records:
+            return None
+
+        record = records[0]
+        region = record["Region"].replace(" ", "_")
+
+        # Get suffix after ID, remove _001, and handle underscores
+        suffix = name[len(record["SequencerID"]) :].replace("_001", "")
+        connector = "_" if suffix and not suffix.startswith("_") else ""
+
+        return f"{record['SampleID']}_{region}{connector}{suffix}{extension}"
@@ -0,0 +1,474 @@
+import os
+import json
+import queue
+import errno
+import shutil
+import logging
+import datetime
+import threading
+from pathlib import Path
+from helpers.bucket import init_bucket_chunked_upload_v2
+from helpers.checksums import get_md5s
+from helpers.fastqc import init_create_fastqc_report
+from helpers.sequencer_id_index import split_fastq_filename
+from models.sequencing_upload import SequencingUpload
+from models.sequencing_files_uploaded import SequencingFileUploaded
+from models.sequencing_sequencer_ids import SequencingSequencerId
+
+logger = logging.getLogger("my_app_logger")  # Use the same name as in app.py
+
+# Server files whose checksums are calculated together, in parallel
+MD5_BATCH_SIZE = 16
+
+# Files waiting between two stages of the pipeline. Hashing stops when
+# the next stage falls behind, so memory stays flat for any directory.
+INGEST_QUEUE_SIZE = 64
+
+SERVER_FILES_PROGRESS_FILE = "server_files_progress.json"
+
+# Redis lock held by the task while it processes the files of an upload
+INGEST_SERVER_FILES_LOCK = "celery-lock:ingest_server_files:{process_id}"
+
+# The progress file is written at most this often while files are
+# processed, and always at the end
+PROGRESS_SAVE_SECONDS = 1.0
+
+# Errors of os.link that mean "cannot link here", not "cannot read":
+# another filesystem, or one without hardlinks
+_LINK_UNSUPPORTED = {
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EMLINK,
+    errno.ENOTSUP,
+    errno.EOPNOTSUPP,
+}
+
+# Marks the end of a queue
+_DONE = object()
+
+
+def link_or_copy(source, destination):
+    """
+    Puts source at destination as a hardlink when both are on the same
+    filesystem, so no data is written, and copies it otherwise. An
+    existing destination is replaced, as shutil.copy2 would do.
+    Returns "link" or "copy".
+    """
+    if os.path.exists(destination):
+        if os.path.samefile(source, destination):
+            return "link"
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+        return "link"
+    except OSError as e:
+        if e.errno not in _LINK_UNSUPPORTED:
+            raise
+    shutil.copy2(source, destination)
+    return "copy"
+
+
+def register_uploaded_file(
+    process_id,
+    source_directory,
+    filename,
+    expected_md5,
+    process_data,
+    sequencer_id_index=None,
+):
+    """
+    Saves a file of an upload in the database under its sequencer ID
+    and links (or copies) it to seq_processed with its new name.
+    Returns (new_filename, dispatch), where dispatch holds the arguments
+    of dispatch_uploaded_file for a newly created file and is None for
+    a file that was already registered. new_filename is None when the
+    file does not match exactly one sequencer ID.
+    """
+    uploads_folder = process_data["uploads_folder"]
+    final_file_path = f"{source_directory}/{filename}"
+
+    # The index can be passed in when many files are processed together
+    if sequencer_id_index is None:
+        sequencer_id_index = SequencingSequencerId.get_index(process_id)
+
+    matching_sequencer_ids = sequencer_id_index.match(filename)
+    if len(matching_sequencer_ids) != 1:
+        return None, None
+
+    file_sequencer_id = matching_sequencer_ids[0]
+    new_filename = sequencer_id_index.new_filename(filename)
+    file_dict = {
+        "md5": expected_md5,
+        "original_filename": filename,
+        "new_name": new_filename,
+    }
+
+    # Check if the file already exists before creating a new one
+    if SequencingFileUploaded.check_if_exists(file_sequencer_id, file_dict):
+        return new_filename, None
+
+    new_file_uploaded_id = SequencingFileUploaded.create(
+        file_sequencer_id, file_dict
+    )
+
+    # Get the data of the SequencingSequencerId to get the region
+    sequencerId = SequencingSequencerId.get(file_sequencer_id)
+    processed_folder = f"seq_processed/{uploads_folder}"
+    processed_file_path = f"{processed_folder}/{new_filename}"
+    os.makedirs(processed_folder, exist_ok=True)
+    link_or_copy(final_file_path, processed_file_path)
+
+    return new_filename, {
+        "new_filename": new_filename,
+        "processed_folder": processed_folder,
+        "bucket": process_data["project_id"],
+        "region": sequencerId.Region,
+        "sequencer_file_id": new_file_uploaded_id,
+        "md5": expected_md5,
+    }
+
+
+def dispatch_uploaded_file(
+    new_filename, processed_folder, bucket, region, sequencer_file_id, md5
+):
+    """Queues the FastQC report and the bucket upload of a new file."""
+    init_create_fastqc_report(new_filename, processed_folder, bucket, region)
+    init_bucket_chunked_upload_v2(
+        local_file_path=f"{processed_folder}/{new_filename}",
+        destination_upload_directory=region,
+        destination_blob_name=new_filename,
+        sequencer_file_id=sequencer_file_id,
+        bucket_name=bucket,
+        known_md5=md5,
+    )
+
+
+def process_uploaded_file(
+    process_id,
+    source_directory,
+    filename,
+    expected_md5,
+    process_data,
+    sequencing_run=None,
+    sequencer_id_index=None,
+):
+    """
+    Registers one file and queues its processing.
+    Returns (new_filename, is_new), new_filename is None when the file
+    does not match exactly one sequencer ID.
+    """
+    new_filename, dispatch = register_uploaded_file(
+        process_id,
+        source_directory,
+        filename,
+        expected_md5,
+        process_data,
+        sequencer_id_index=sequencer_id_index,
+    )
+    if dispatch is None:
+        return new_filename, False
+    dispatch_uploaded_file(**dispatch)
+    return new_filename, True
+
+
+def _progress_path(uploads_folder):
+    return os.path.join(
+        "seq_processed", uploads_folder, SERVER_FILES_PROGRESS_FILE
+    )
+
+
+def save_progress(uploads_folder, progress):
+    path = _progress_path(uploads_folder)
+    temp_path = f"{path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp_path, "w") as f:
+            json.dump(progress, f)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.error(f"Could not save server files progress: {e}")
+
+
+def get_progress(process_id):
+    """Progress of the last server files run of an upload, or None."""
+    process_data = SequencingUpload.get(process_id)
+    if not process_data or not process_data["uploads_folder"]:
+        return None
+    try:
+        with open(_progress_path(process_data["uploads_folder"])) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def new_progress(directory_name, status="queued"):
+    return {
+        "status": status,
+        "directory": str(directory_name),
+        "total": 0,
+        "hashed": 0,
+        "done": 0,
+        "new": 0,
+        "existing": 0,
+        "unmatched": 0,
+        "ambiguous": 0,
+        "linked": 0,
+        "copied": 0,
+        "failed": 0,
+        "errors": [],
+        "report": [],
+        "started_at": None,
+        "finished_at": None,
+    }
+
+
+def ingest_server_files(
+    process_id, directory_name, sequencing_run=None, uploads_folder=None
+):
+    """
+    Processes all the FASTQ files of a server directory for an upload,
+    as a pipeline of stages joined by bounded queues:
+
+    - match: all filenames are matched to sequencer IDs at once, only
+      files of exactly one sequencer ID go on
+    - hash: checksums are calculated a batch of files at a time, in
+      parallel, reusing those of unchanged files
+    - register: each file is saved in the database and linked (or
+      copied) into seq_processed, then moved to "processed" in the
+      source directory so a later run does not visit it again
+    - dispatch: FastQC and the bucket upload of new files are queued
+
+    Progress is saved in seq_processed/<uploads_folder> as it goes, see
+    get_progress. Returns the final progress. If the run stops on an
+    error, the progress is saved as "failed" with it, and the error is
+    raised again. uploads_folder can be given so that even a failure to
+    read the upload is reported.
+    """
+    progress = new_progress(directory_name, status="running")
+    progress["started_at"] = datetime.datetime.now().isoformat()
+
+    try:
+        process_data = SequencingUpload.get(process_id)
+        uploads_folder = process_data["uploads_folder"]
+        _run_ingest_pipeline(
+            process_id, directory_name, process_data, progress
+        )
+    except Exception as e:
+        logger.error(
+            f"Server files of {process_id} from {directory_name} "
+            f"stopped: {e}"
+        )
+        progress["status"] = "failed"
+        progress["errors"].append(f"The processing stopped: {e}")
+        progress["finished_at"] = datetime.datetime.now().isoformat()
+        if uploads_folder:
+            save_progress(uploads_folder, progress)
+        raise
+
+    progress["status"] = "finished"
+    progress["finished_at"] = datetime.datetime.now().isoformat()
+    save_progress(uploads_folder, progress)
+
+    logger.info(
+        f"Server files of {process_id} from {directory_name}: "
+        f"{progress['new']} new, {progress['existing']} existing, "
+        f"{progress['failed']} failed, {progress['unmatched']} unmatched, "
+        f"{progress['ambiguous']} ambiguous"
+    )
+    return progress
+
+
+def _run_ingest_pipeline(process_id, directory_name, process_data, progress):
+    """The stages of ingest_server_files, updating progress as they go."""
+    uploads_folder = process_data["uploads_folder"]
+    directory = Path(directory_name)
+    processed_subdir = directory / "processed"
+
+    progress_lock = threading.Lock()
+    last_saved = [0.0]
+
+    def update(force=False, **changes):
+        with progress_lock:
+            for key, value in changes.items():
+                progress[key] += value
+            now = datetime.datetime.now().timestamp()
+            if force or now - last_saved[0] >= PROGRESS_SAVE_SECONDS:
+                last_saved[0] = now
+                save_progress(uploads_folder, progress)
+
+    def fail(file_path, e):
+        logger.error(f"Failed to process server file {file_path}: {e}")
+        with progress_lock:
+            progress["errors"].append(f"{Path(file_path).name}: {e}")
+        update(failed=1, done=1)
+
+    fastq_files = [
+        file_path
+        for file_path in sorted(directory.iterdir())
+        if file_path.is_file()
+        and split_fastq_filename(file_path.name)[0] is not None
+    ]
+
+    # Match stage
+    sequencer_id_index = SequencingSequencerId.get_index(process_id)
+    matches = sequencer_id_index.match_many(
+        [file_path.name for file_path in fastq_files]
+    )
+    candidate_files = [
+        file_path
+        for file_path in fastq_files
+        if len(matches[file_path.name]["matches"]) == 1
+    ]
+    ambiguous = sum(match["ambiguous"] for match in matches.values())
+    update(
+        force=True,
+        total=len(candidate_files),
+        ambiguous=ambiguous,
+        unmatched=len(fastq_files) - len(candidate_files) - ambiguous,
+    )
+
+    hashed = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    to_dispatch = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+
+    def hash_stage():
+        try:
+            for start in range(0, len(candidate_files), MD5_BATCH_SIZE):
+                batch = candidate_files[start : start + MD5_BATCH_SIZE]
+                try:
+                    md5s = get_md5s(batch)
+                except Exception as e:
+                    for file_path in batch:
+                        fail(file_path, e)
+                    continue
+                for file_path in batch:
+                    hashed.put((file_path, md5s[str(file_path)]))
+                update(hashed=len(batch))
+        finally:
+            hashed.put(_DONE)
+
+    def dispatch_stage():
+        while True:
+            item = to_dispatch.get()
+            if item is _DONE:
+                return
+            try:
+                dispatch_uploaded_file(**item)
+            except Exception as e:
+                logger.error(
+                    f"Failed to queue processing of "
+                    f"{item['new_filename']}: {e}"
+                )
+                with progress_lock:
+                    progress["errors"].append(f"{item['new_filename']}: {e}")
+                update(failed=1)
+
+    hasher = threading.Thread(target=hash_stage, daemon=True)
+    dispatcher = threading.Thread(target=dispatch_stage, daemon=True)
+    hasher.start()
+    dispatcher.start()
+
+    # Register stage, in this thread as it uses the database
+    item = None
+    try:
+        while True:
+            item = hashed.get()
+            if item is _DONE:
+                break
+            file_path, md5 = item
+            try:
+                new_filename, dispatch = register_uploaded_file(
+                    process_id=process_id,
+                    source_directory=directory_name,
+                    filename=file_path.name,
+                    expected_md5=md5,
+                    process_data=process_data,
+                    sequencer_id_index=sequencer_id_index,
+                )
+            except Exception as e:
+                fail(file_path, e)
+                continue
+
+            if dispatch is None:
+                update(existing=1, done=1)
+            else:
+                to_dispatch.put(dispatch)
+                linked = os.path.samefile(
+                    file_path, f"{dispatch['processed_folder']}/{new_filename}"
+                )
+                with progress_lock:
+                    progress["report"].append(
+                        {
+                            "original_filename": file_path.name,
+                            "new_filename": new_filename,
+                        }
+                    )
+                update(
+                    new=1,
+                    done=1,
+                    linked=int(linked),
+                    copied=int(not linked),
+                )
+
+            # Move it out of the way so it isn't re-visited next time
+            try:
+                processed_subdir.mkdir(exist_ok=True)
+                shutil.move(
+                    str(file_path), str(processed_subdir / file_path.name)
+                )
+            except OSError as e:
+                logger.error(
+                    f"Failed to move {file_path} into "
+                    f"'processed' subdirectory: {e}"
+                )
+    finally:
+        # Let the hash stage finish if we stopped early
+        while item is not _DONE:
+            item = hashed.get()
+        to_dispatch.put(_DONE)
+        hasher.join()
+        dispatcher.join()
+
+
+def init_ingest_server_files(process_id, directory_name, sequencing_run=None):
+    """
+    Queues ingest_server_files as a background task, after writing a
+    "queued" progress so the form can start polling right away.
+    Returns False, with the progress marked "failed", if the task could
+    not be queued, and None without touching the progress if a run of
+    the upload is still going on.
+    """
+    from tasks import ingest_server_files_async, is_locked
+
+    if is_locked(INGEST_SERVER_FILES_LOCK.format(process_id=process_id)):
+        logger.info(
+            f"Server files of {process_id} are already being processed, "
+            f"not queueing {directory_name}"
+        )
+        return None
+
+    process_data = SequencingUpload.get(process_id)
+    progress = new_progress(directory_name)
+    save_progress(process_data["uploads_folder"], progress)
+    try:
+        result = ingest_server_files_async.delay(
+            process_id,
+            str(directory_name),
+            sequencing_run,
+            process_data["uploads_folder"],
+        )
+        logger.info(
+            f"Celery ingest_server_files_async task called successfully! "
+            f"Task ID: {result.id}"
+        )
+    except Exception as e:
+        logger.error(
+            "This is an error message from helpers/server_files.py "
+            "while trying to ingest_server_files_async"
+        )
+        logger.error(e)
+        progress["status"] = "failed"
+        progress["errors"].append(f"The processing could not be queued: {e}")
+        progress["finished_at"] = datetime.datetime.now().isoformat()
+        save_progress(process_data["uploads_folder"], progress)
+        return False
+    return True
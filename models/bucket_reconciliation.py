@@ -0,0 +1,325 @@
+import os
+import logging
+import datetime
+from sqlalchemy import func
+from helpers.dbm import session_scope
+from helpers.bucket import (
+    list_blob_sizes,
+    calculate_md5,
+    init_bucket_chunked_upload_v2,
+)
+from models.db_model import (
+    SequencingUploadsTable,
+    SequencingSamplesTable,
+    SequencingSequencerIDsTable,
+    SequencingFilesUploadedTable,
+    SequencingFileStatsTable,
+    SequencingBucketReconciliationTable,
+)
+
+# Get the logger instance from app.py
+logger = logging.getLogger("my_app_logger")  # Use the same name as in app.py
+
+
+class BucketReconciliation:
+    """
+    Which files of the uploads are missing from their bucket, or are in
+    it with another size than the file that was uploaded.
+
+    A bucket is listed once (name and size of each object) for all the
+    uploads of its project, and the listing is compared with the files
+    recorded in the database. The result is kept per upload as a
+    snapshot, so the admin pages can read it without the bucket.
+    """
+
+    @classmethod
+    def _expected_files(cls, session, upload_ids):
+        """
+        (file, upload_id, region, uploads_folder, stats_size) of the
+        files of the uploads, in one query.
+        """
+        return (
+            session.query(
+                SequencingFilesUploadedTable,
+                SequencingSamplesTable.sequencingUploadId,
+                SequencingSequencerIDsTable.Region,
+                SequencingUploadsTable.uploads_folder,
+                SequencingFileStatsTable.file_size,
+            )
+            .join(
+                SequencingSequencerIDsTable,
+                SequencingFilesUploadedTable.sequencerId
+                == SequencingSequencerIDsTable.id,
+            )
+            .join(
+                SequencingSamplesTable,
+                SequencingSequencerIDsTable.sequencingSampleId
+                == SequencingSamplesTable.id,
+            )
+            .join(
+                SequencingUploadsTable,
+                SequencingSamplesTable.sequencingUploadId
+                == SequencingUploadsTable.id,
+            )
+            .outerjoin(
+                SequencingFileStatsTable,
+                SequencingFileStatsTable.sequencingFileId
+                == SequencingFilesUploadedTable.id,
+            )
+            .filter(SequencingSamplesTable.sequencingUploadId.in_(upload_ids))
+            .all()
+        )
+
+    @staticmethod
+    def _expected_size(local_file_path, stats_size):
+        """
+        The size the object should have: the one of the local file, or
+        the one recorded when it was scanned once it has been deleted.
+        None when neither is known, then only its presence is checked.
+        """
+        try:
+            return os.path.getsize(local_file_path)
+        except OSError:
+            return stats_size
+
+    @classmethod
+    def reconcile_bucket(cls, bucket_name):
+        """
+        Compares the bucket with the files of all the uploads of its
+        project and records a snapshot for each upload. Returns the
+        snapshots by upload ID, as get does.
+        """
+        with session_scope() as session:
+            upload_ids = [
+                upload_id
+                for (upload_id,) in session.query(SequencingUploadsTable.id)
+                .filter(
+                    func.lower(SequencingUploadsTable.project_id)
+                    == bucket_name.lower()
+                )
+                .all()
+            ]
+            if not upload_ids:
+                return {}
+
+            expected_files = cls._expected_files(session, upload_ids)
+
+            # Only listed once there is something to compare it with
+            blob_sizes = list_blob_sizes(bucket_name)
+            checked_at = datetime.datetime.now()
+
+            results = {
+                upload_id: {
+                    "expected_files": 0,
+                    "missing_files": [],
+                    "size_mismatched_files": [],
+                }
+                for upload_id in upload_ids
+            }
+            for (
+                file,
+                upload_id,
+                region,
+                uploads_folder,
+                stats_size,
+            ) in expected_files:
+                result = results[upload_id]
+                result["expected_files"] += 1
+                blob_path = f"{region}/{file.new_name}"
+                if blob_path not in blob_sizes:
+                    result["missing_files"].append(blob_path)
+                    continue
+
+                expected_size = cls._expected_size(
+                    f"seq_processed/{uploads_folder}/{file.new_name}",
+                    stats_size,
+                )
+                bucket_size = blob_sizes[blob_path]
+                if expected_size is not None and bucket_size != expected_size:
+                    result["size_mismatched_files"].append(
+                        {
+                            "blob_path": blob_path,
+                            "expected_size": expected_size,
+                            "bucket_size": bucket_size,
+                        }
+                    )
+
+            rows = {
+                row.sequencingUploadId: row
+                for row in session.query(SequencingBucketReconciliationTable)
+                .filter(
+                    SequencingBucketReconciliationTable.sequencingUploadId.in_(
+                        upload_ids
+                    )
+                )
+                .all()
+            }
+            for upload_id, result in results.items():
+                row = rows.get(upload_id)
+                if row is None:
+                    row = SequencingBucketReconciliationTable(
+                        sequencingUploadId=upload_id
+                    )
+                    session.add(row)
+                row.bucket = bucket_name.lower()
+                row.expected_files = result["expected_files"]
+                row.missing_files = sorted(result["missing_files"])
+                row.size_mismatched_files = result["size_mismatched_files"]
+                row.checked_at = checked_at
+                rows[upload_id] = row
+
+            logger.info(
+                f"Reconciled bucket {bucket_name}: {len(blob_sizes)} "
+                f"objects, {len(expected_files)} files of "
+                f"{len(upload_ids)} uploads"
+            )
+            return {
+                upload_id: cls._to_dict(row) for upload_id, row in rows.items()
+            }
+
+    @classmethod
+    def reconcile(cls, process_id):
+        """
+        Reconciles the bucket of an upload (and so of all the uploads
+        of its project) and returns the snapshot of the upload, or None
+        when there is no such upload.
+        """
+        with session_scope() as session:
+            upload = (
+                session.query(SequencingUploadsTable)
+                .filter_by(id=process_id)
+                .first()
+            )
+            if upload is None or not upload.project_id:
+                return None
+            bucket_name = upload.project_id
+
+        return cls.reconcile_bucket(bucket_name).get(int(process_id))
+
+    @classmethod
+    def reconcile_all(cls):
+        """Reconciles every bucket that has uploads, one listing each."""
+        with session_scope() as session:
+            bucket_names = [
+                bucket_name
+                for (bucket_name,) in session.query(
+                    func.lower(SequencingUploadsTable.project_id)
+                )
+                .distinct()
+                .all()
+                if bucket_name
+            ]
+
+        for bucket_name in bucket_names:
+            try:
+                cls.reconcile_bucket(bucket_name)
+            except Exception as e:
+                logger.error(f"Could not reconcile bucket {bucket_name}: {e}")
+        logger.info(f"Reconciled {len(bucket_names)} buckets")
+        return len(bucket_names)
+
+    @staticmethod
+    def _to_dict(row):
+        missing_files = row.missing_files or []
+        size_mismatched_files = row.size_mismatched_files or []
+        return {
+            "process_id": row.sequencingUploadId,
+            "bucket": row.bucket,
+            "expected_files": row.expected_files,
+            "missing_files": missing_files,
+            "size_mismatched_files": size_mismatched_files,
+            "complete": not missing_files and not size_mismatched_files,
+            "checked_at": (
+                row.checked_at.isoformat() if row.checked_at else None
+            ),
+        }
+
+    @classmethod
+    def get(cls, process_id):
+        """The last snapshot of an upload, None if it was never checked."""
+        with session_scope() as session:
+            row = (
+                session.query(SequencingBucketReconciliationTable)
+                .filter_by(sequencingUploadId=process_id)
+                .first()
+            )
+            return cls._to_dict(row) if row else None
+
+    @classmethod
+    def get_all(cls, only_incomplete=False):
+        """The last snapshots of all the uploads."""
+        with session_scope() as session:
+            rows = (
+                session.query(SequencingBucketReconciliationTable)
+                .order_by(
+                    SequencingBucketReconciliationTable.sequencingUploadId
+                )
+                .all()
+            )
+            snapshots = [cls._to_dict(row) for row in rows]
+        if only_incomplete:
+            snapshots = [s for s in snapshots if not s["complete"]]
+        return snapshots
+
+    @classmethod
+    def enqueue_missing(cls, process_id):
+        """
+        Reconciles the bucket of an upload and uploads again the files
+        of the upload that are missing from it or have another size.
+        Files that are not on disk anymore cannot be, they are logged.
+        Returns the number of uploads started, None if there is no such
+        upload.
+        """
+        snapshot = cls.reconcile(process_id)
+        if snapshot is None:
+            return None
+
+        blob_paths = set(snapshot["missing_files"]) | {
+            mismatch["blob_path"]
+            for mismatch in snapshot["size_mismatched_files"]
+        }
+        if not blob_paths:
+            return 0
+
+        started = 0
+        with session_scope() as session:
+            for (
+                file,
+                upload_id,
+                region,
+                uploads_folder,
+                stats_size,
+            ) in cls._expected_files(session, [process_id]):
+                blob_path = f"{region}/{file.new_name}"
+                if blob_path not in blob_paths:
+                    continue
+
+                local_file_path = (
+                    f"seq_processed/{uploads_folder}/{file.new_name}"
+                )
+                if not os.path.isfile(local_file_path):
+                    logger.error(
+                        f"Cannot upload {blob_path} of {process_id} again, "
+                        f"{local_file_path} does not exist"
+                    )
+                    continue
+
+                if not file.md5:
+                    file.md5 = calculate_md5(local_file_path)
+                    session.commit()
+
+                init_bucket_chunked_upload_v2(
+                    local_file_path=local_file_path,
+                    destination_upload_directory=region,
+                    destination_blob_name=file.new_name,
+                    sequencer_file_id=file.id,
+                    bucket_name=snapshot["bucket"],
+                    known_md5=file.md5,
+                )
+                started += 1
+
+        logger.info(
+            f"Started {started} bucket uploads of the "
+            f"{len(blob_paths)} missing files of {process_id}"
+        )
+        return started
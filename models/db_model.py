@@ -3,6 +3,7 @@ from sqlalchemy import (
     Table,
     Column,
     Integer,
+    BigInteger,
     String,
     Boolean,
     DateTime,
@@ -316,6 +317,79 @@ class SequencingFilesUploadedTable(Base):
     primer_occurrences_count = Column(Integer, nullable=True)
 
 
+class SequencingFileStatsTable(Base):
+    __tablename__ = "sequencing_file_stats"
+    id = Column(Integer, primary_key=True)
+    sequencingFileId = Column(
+        Integer,
+        ForeignKey("sequencing_files_uploaded.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+    )
+    # Size and mtime of the file when it was scanned
+    file_size = Column(BigInteger, nullable=True)
+    file_mtime = Column(Float, nullable=True)
+    read_count = Column(Integer, nullable=True)
+    base_count = Column(BigInteger, nullable=True)
+    read_length_min = Column(Integer, nullable=True)
+    read_length_max = Column(Integer, nullable=True)
+    read_length_avg = Column(Float, nullable=True)
+    gc_content = Column(Float, nullable=True)
+    length_histogram = Column(JSON, nullable=True)
+    mean_quality_per_position = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+
+
+class SequencingReportsBucketStatusTable(Base):
+    __tablename__ = "sequencing_reports_bucket_status"
+    id = Column(Integer, primary_key=True)
+    sequencingUploadId = Column(
+        Integer,
+        ForeignKey("sequencing_uploads.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    sequencingAnalysisTypeId = Column(
+        Integer,
+        ForeignKey("sequencing_analysis_types.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    # "lotus2" or "rscripts"
+    report = Column(String(20), nullable=False)
+    # The object of the report looked for in the bucket
+    blob_path = Column(String(512), nullable=True)
+    in_bucket = Column(Boolean, nullable=False, default=False)
+    checked_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index(
+            "idx_srbs_upload_type_report",
+            "sequencingUploadId",
+            "sequencingAnalysisTypeId",
+            "report",
+            unique=True,
+        ),
+    )
+
+
+class SequencingBucketReconciliationTable(Base):
+    __tablename__ = "sequencing_bucket_reconciliation"
+    id = Column(Integer, primary_key=True)
+    sequencingUploadId = Column(
+        Integer,
+        ForeignKey("sequencing_uploads.id", ondelete="CASCADE"),
+        nullable=False,
+        unique=True,
+    )
+    bucket = Column(String(250), nullable=True)
+    expected_files = Column(Integer, nullable=False, default=0)
+    # Blob paths of the files that are not in the bucket
+    missing_files = Column(JSON, nullable=True)
+    # [{"blob_path", "expected_size", "bucket_size"}] of the files that
+    # are in the bucket with another size than the local file
+    size_mismatched_files = Column(JSON, nullable=True)
+    checked_at = Column(DateTime, nullable=True)
+
+
 class SequencingCompanyUploadTable(Base):
     __tablename__ = "sequencing_company_uploads"
     id = Column(Integer, primary_key=True)
@@ -463,6 +537,43 @@ class Taxonomy(Base):
     genus = relationship("Genus")
     species = relationship("Species")
 
+    __table_args__ = (
+        # Whole lineage lookups, and taxonomy search filters by rank
+        Index(
+            "idx_taxonomy_lineage",
+            domain_id,
+            phylum_id,
+            class_id,
+            order_id,
+            family_id,
+            genus_id,
+            species_id,
+        ),
+    )
+
+
+# Rank names of every taxonomy, kept in step by TaxonomyManager so that
+# OTU queries need a single join instead of joining all rank tables
+class TaxonomyLineage(Base):
+    __tablename__ = "taxonomy_lineage"
+
+    taxonomy_id = Column(
+        Integer,
+        ForeignKey("taxonomy.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    domain_name = Column(String(255), nullable=True)
+    phylum_name = Column(String(255), nullable=True)
+    class_name = Column(String(255), nullable=True)
+    order_name = Column(String(255), nullable=True)
+    family_name = Column(String(255), nullable=True)
+    genus_name = Column(String(255), nullable=True)
+    species_name = Column(String(255), nullable=True)
+    # Glomeromycetes, Archaeosporomycetes and Paraglomeromycetes
+    amf_flag = Column(Boolean, default=False, nullable=False)
+
+    __table_args__ = (Index("idx_lineage_amf", amf_flag),)
+
 
 # OTU Table
 class OTU(Base):
@@ -473,7 +584,7 @@ class OTU(Base):
         Integer, ForeignKey("sequencing_samples.id"), nullable=False
     )
     taxonomy_id = Column(Integer, ForeignKey("taxonomy.id"), nullable=False)
-    abundance = Column(Integer, nullable=True)
+    abundance = Column(Integer, default=0, server_default="0", nullable=False)
     sequencing_analysis_id = Column(
         Integer, ForeignKey("sequencing_analysis.id"), nullable=False
     )
@@ -494,6 +605,18 @@ class OTU(Base):
         Index(
             "idx_ecm_analysis", ecm_flag, sequencing_analysis_id
         ),  # Composite index for ecm_flag + sequencing_analysis_id
+        Index(
+            "idx_otu_analysis_taxonomy_sample",
+            sequencing_analysis_id,
+            taxonomy_id,
+            sample_id,
+        ),  # Taxonomy search filtered by analysis type and taxonomy
+        Index(
+            "idx_otu_taxonomy_sample", taxonomy_id, sample_id
+        ),  # Taxonomy search filtered by taxonomy only
+        Index(
+            "idx_otu_abundance_id", abundance, id
+        ),  # Taxonomy search pages sorted by abundance
     )
 
 
@@ -0,0 +1,156 @@
+import logging
+import datetime
+from helpers.dbm import session_scope
+from models.db_model import (
+    SequencingAnalysisTable,
+    SequencingReportsBucketStatusTable,
+)
+from models.sequencing_upload import SequencingUpload
+
+# Get the logger instance from app.py
+logger = logging.getLogger("my_app_logger")  # Use the same name as in app.py
+
+# The reports whose presence in the bucket is recorded, with the
+# status field of SequencingAnalysisTable that marks them finished
+REPORTS = {
+    "lotus2": "lotus2_status",
+    "rscripts": "rscripts_status",
+}
+
+
+class ReportsBucketStatus:
+    """
+    Whether the finished lotus2 and R scripts reports of an upload are
+    in its bucket, as last checked. Pages read it from the database,
+    the bucket is only looked at by verify: after a report is uploaded
+    to the bucket, on a schedule (verify_all), and when asked to from
+    the page.
+    """
+
+    @classmethod
+    def get(cls, process_id):
+        """
+        {"lotus2": {analysis_type_id: status}, "rscripts": {...}} with
+        status {"in_bucket": bool, "checked_at": ISO time}, for the
+        reports that were checked.
+        """
+        result = {report: {} for report in REPORTS}
+        with session_scope() as session:
+            rows = (
+                session.query(SequencingReportsBucketStatusTable)
+                .filter_by(sequencingUploadId=process_id)
+                .all()
+            )
+            for row in rows:
+                if row.report not in result:
+                    continue
+                result[row.report][row.sequencingAnalysisTypeId] = {
+                    "in_bucket": bool(row.in_bucket),
+                    "checked_at": (
+                        row.checked_at.isoformat() if row.checked_at else None
+                    ),
+                }
+        return result
+
+    @classmethod
+    def apply(cls, process_id, lotus2_report, rscripts_report):
+        """
+        Fills bucket_log_exists of the results of
+        check_lotus2_reports_exist and check_rscripts_reports_exist
+        made with check_bucket=False, from the recorded statuses.
+        Reports that were never checked keep None.
+        """
+        statuses = cls.get(process_id)
+        for report, results in (
+            ("lotus2", lotus2_report),
+            ("rscripts", rscripts_report),
+        ):
+            for region_result in results:
+                status = statuses[report].get(
+                    region_result["analysis_type_id"]
+                )
+                if status and region_result["bucket_log_exists"] is None:
+                    region_result["bucket_log_exists"] = status["in_bucket"]
+                    region_result["bucket_checked_at"] = status["checked_at"]
+
+    @classmethod
+    def verify(cls, process_id):
+        """
+        Looks for the finished reports of an upload in its bucket,
+        records what was found and returns it as get does.
+        """
+        process_data = SequencingUpload.get(process_id)
+        if process_data is None:
+            return None
+
+        found = {
+            "lotus2": SequencingUpload.check_lotus2_reports_exist(
+                process_id, process_data=process_data
+            ),
+            "rscripts": SequencingUpload.check_rscripts_reports_exist(
+                process_id, process_data=process_data
+            ),
+        }
+        checked_at = datetime.datetime.now()
+
+        with session_scope() as session:
+            rows = {
+                (row.report, row.sequencingAnalysisTypeId): row
+                for row in session.query(SequencingReportsBucketStatusTable)
+                .filter_by(sequencingUploadId=process_id)
+                .all()
+            }
+            for report, status_field in REPORTS.items():
+                for region_result in found[report]:
+                    if region_result.get(status_field) != "Finished":
+                        continue
+                    key = (report, region_result["analysis_type_id"])
+                    row = rows.pop(key, None)
+                    if row is None:
+                        row = SequencingReportsBucketStatusTable(
+                            sequencingUploadId=process_id,
+                            sequencingAnalysisTypeId=key[1],
+                            report=report,
+                        )
+                        session.add(row)
+                    row.blob_path = region_result.get("bucket_blob_path")
+                    row.in_bucket = bool(region_result["bucket_log_exists"])
+                    row.checked_at = checked_at
+
+            # Reports that are no longer finished (deleted, running
+            # again) are checked again once they are
+            for row in rows.values():
+                session.delete(row)
+
+        return cls.get(process_id)
+
+    @classmethod
+    def verify_all(cls):
+        """Verifies every upload that has a finished report."""
+        with session_scope() as session:
+            process_ids = [
+                process_id
+                for (process_id,) in session.query(
+                    SequencingAnalysisTable.sequencingUploadId
+                )
+                .filter(
+                    (SequencingAnalysisTable.lotus2_status == "Finished")
+                    | (SequencingAnalysisTable.rscripts_status == "Finished")
+                )
+                .distinct()
+                .all()
+                if process_id is not None
+            ]
+
+        for process_id in process_ids:
+            try:
+                cls.verify(process_id)
+            except Exception as e:
+                logger.error(
+                    f"Could not verify the reports of {process_id} "
+                    f"in the bucket: {e}"
+                )
+        logger.info(
+            f"Verified the bucket reports of {len(process_ids)} uploads"
+        )
+        return len(process_ids)
@@ -1,7 +1,10 @@
+import os
 import logging
+from sqlalchemy.exc import IntegrityError
 from helpers.dbm import session_scope
 from models.db_model import (
     SequencingFilesUploadedTable,
+    SequencingFileStatsTable,
     SequencingUploadsTable,
     SequencingSequencerIDsTable,
     SequencingSamplesTable,
@@ -10,6 +13,7 @@ from helpers.fastqc import (
     check_fastqc_report,
     extract_total_sequences_from_fastqc_zip,
 )
+from helpers.fastq_stats import scan_fastq, file_signature
 
 # Get the logger instance from app.py
 logger = logging.getLogger("my_app_logger")  # Use the same name as in app.py
@@ -204,8 +208,91 @@ class SequencingFileUploaded:
 
             return True
 
+    @staticmethod
+    def _stats_to_dict(stats_db):
+        return {
+            column.name: getattr(stats_db, column.name)
+            for column in SequencingFileStatsTable.__table__.columns
+        }
+
+    @classmethod
+    def get_stats(cls, id, file_path=None):
+        """
+        Returns the stored FASTQ statistics of a file as a dict. When
+        file_path is given, the file is scanned if it has no statistics
+        yet or has changed since it was scanned. Returns None if there
+        is nothing stored and the file cannot be read.
+
+        The scan can take minutes on large files, so it runs with no
+        database session open.
+        """
+        with session_scope() as session:
+            stats_db = (
+                session.query(SequencingFileStatsTable)
+                .filter_by(sequencingFileId=id)
+                .first()
+            )
+            stored = cls._stats_to_dict(stats_db) if stats_db else None
+
+        signature = None
+        if file_path and os.path.exists(file_path):
+            signature = file_signature(file_path)
+
+        if stored is not None and (
+            signature is None
+            or (stored["file_size"], stored["file_mtime"]) == signature
+        ):
+            return stored
+        if signature is None:
+            return None
+
+        try:
+            stats = scan_fastq(file_path)
+        except (OSError, EOFError, ValueError) as e:
+            logger.error(f"Could not scan {file_path}: {e}")
+            return None
+
+        try:
+            return cls._save_stats(id, signature, stats)
+        except IntegrityError:
+            # Another worker stored the statistics of this file first
+            return cls._save_stats(id, signature, stats)
+
+    @classmethod
+    def _save_stats(cls, id, signature, stats):
+        """Inserts or updates the statistics of a file after a scan."""
+        with session_scope() as session:
+            stats_db = (
+                session.query(SequencingFileStatsTable)
+                .filter_by(sequencingFileId=id)
+                .first()
+            )
+            if stats_db is None:
+                stats_db = SequencingFileStatsTable(sequencingFileId=id)
+                session.add(stats_db)
+            stats_db.file_size, stats_db.file_mtime = signature
+            for key, value in stats.items():
+                setattr(stats_db, key, value)
+
+            file_db = (
+                session.query(SequencingFilesUploadedTable)
+                .filter_by(id=id)
+                .first()
+            )
+            if file_db and not file_db.total_sequences_number:
+                file_db.total_sequences_number = stats["read_count"]
+
+            session.flush()
+            return cls._stats_to_dict(stats_db)
+
     @classmethod
     def update_total_sequences(cls, id):
+        # Files that were already scanned have their read count stored
+        stats = cls.get_stats(id)
+        if stats and stats["read_count"]:
+            cls.update_field(id, "total_sequences_number", stats["read_count"])
+            return stats["read_count"]
+
         abs_zip_path = cls.get_fastqc_report(id, return_format="zip")
         total_sequences = extract_total_sequences_from_fastqc_zip(abs_zip_path)
 
@@ -5,7 +5,10 @@ from helpers.land_use import (
     get_baileys_ecoregion,
     get_elevation,
 )
-from helpers.ecoregions import get_resolve_ecoregion_objectid
+from helpers.ecoregions import (
+    get_resolve_ecoregion_objectid,
+    init_update_samples_with_ecoregions,
+)
 from models.db_model import SequencingSamplesTable, OTU, ResolveEcoregionsTable
 from sqlalchemy import or_, select
 from sqlalchemy.orm.exc import NoResultFound
@@ -156,6 +159,11 @@ class SequencingSample:
 
     @classmethod
     def update_missing_fields(self):
+        # Ecoregions of all the samples are resolved in the background, a
+        # page of coordinates at a time, the rest of the fields here for
+        # a few samples per call
+        init_update_samples_with_ecoregions()
+
         with session_scope() as session:
 
             samples_to_update_query = (
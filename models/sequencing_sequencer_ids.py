@@ -8,20 +8,29 @@ from helpers.cutadapt import (
     parse_detect_single_read_primers_output,
     detect_merged_read_primers,
     parse_detect_merged_read_primers_output,
-    get_read_length_stats,
     find_forward_reverse_files,
 )
+from helpers.primer_matcher import count_primer_hits
+from helpers.sequencer_id_index import SequencerIdIndex, split_fastq_filename
 from models.db_model import (
     SequencingSequencerIDsTable,
     SequencingSamplesTable,
     SequencingFilesUploadedTable,
 )
 from models.sequencing_upload import SequencingUpload
+from models.sequencing_files_uploaded import SequencingFileUploaded
 from sqlalchemy import and_
 
 # Get the logger instance from app.py
 logger = logging.getLogger("my_app_logger")  # Use the same name as in app.py
 
+ADAPTER_COUNT_COLUMNS = [
+    "fwd_read_fwd_adap",
+    "rev_read_rev_adap",
+    "fwd_rev_adap",
+    "fwd_rev_mrg_adap",
+]
+
 
 class SequencingSequencerId:
     def __init__(self, **kwargs):
@@ -97,6 +106,68 @@ class SequencingSequencerId:
                 new_record_id = new_record.id
                 return new_record_id, "new"
 
+    @classmethod
+    def create_many(cls, records):
+        """
+        Same as calling create() for each of the records (dicts with the
+        arguments of create), in one transaction. Records whose sample
+        already has a sequencer ID for the region are left as they are.
+        Returns the (id, "existing" or "new") of each record.
+        """
+        if not records:
+            return []
+
+        def ids_by_sample_and_region(session, sample_ids):
+            return {
+                (row.sequencingSampleId, row.Region): row.id
+                for row in session.query(
+                    SequencingSequencerIDsTable.id,
+                    SequencingSequencerIDsTable.sequencingSampleId,
+                    SequencingSequencerIDsTable.Region,
+                ).filter(
+                    SequencingSequencerIDsTable.sequencingSampleId.in_(
+                        sample_ids
+                    )
+                )
+            }
+
+        with session_scope() as session:
+            existing = ids_by_sample_and_region(
+                session, {record["sample_id"] for record in records}
+            )
+
+            new_records = {}
+            statuses = []
+            for record in records:
+                key = (record["sample_id"], record["region"])
+                if key in existing or key in new_records:
+                    statuses.append((key, "existing"))
+                    continue
+                statuses.append((key, "new"))
+                new_records[key] = {
+                    "sequencingSampleId": record["sample_id"],
+                    "SequencerID": record["sequencer_id"],
+                    "Region": record["region"],
+                    # Only set the indexes if they are not None or empty
+                    "Index_1": record["index_1"] or None,
+                    "Index_2": record["index_2"] or None,
+                }
+
+            if new_records:
+                # One multi-row INSERT, then read the new ids back
+                session.execute(
+                    SequencingSequencerIDsTable.__table__.insert(),
+                    list(new_records.values()),
+                )
+                existing.update(
+                    ids_by_sample_and_region(
+                        session, {key[0] for key in new_records}
+                    )
+                )
+            session.commit()
+
+            return [(existing[key], status) for key, status in statuses]
+
     @classmethod
     def check_df_and_add_records(cls, process_id, df, process_data):
         result = 1
@@ -136,19 +207,22 @@ class SequencingSequencerId:
             # Check each row to see if they are as expected.
             samples_data = SequencingUpload.get_samples(process_id)
             if samples_data is not None:
-                sample_ids = [row["SampleID"] for row in samples_data]
-                logger.info(sample_ids)
-                for index, row in df.iterrows():
-                    if row["SampleID"] not in sample_ids:
-                        result = 0
-                        messages.append(
-                            "SampleID: in row "
-                            + str(index + 1)
-                            + " with the value '"
-                            + str(row["SampleID"])
-                            + "' is not in the list of expected"
-                            + "' SampleIDs from the metadata"
-                        )
+                sample_ids = {row["SampleID"] for row in samples_data}
+                unknown_samples = [
+                    value not in sample_ids for value in df["SampleID"]
+                ]
+                for index, value in df.loc[
+                    unknown_samples, "SampleID"
+                ].items():
+                    result = 0
+                    messages.append(
+                        "SampleID: in row "
+                        + str(index + 1)
+                        + " with the value '"
+                        + str(value)
+                        + "' is not in the list of expected"
+                        + "' SampleIDs from the metadata"
+                    )
 
             else:
                 result = 0
@@ -160,18 +234,25 @@ class SequencingSequencerId:
                 process_data["region_2_forward_primer"],
                 process_data["region_2_reverse_primer"],
             )
-            for index, row in df.iterrows():
-                if row["Region"] not in regions:
+            regions = set(regions)
+            unknown_regions = pd.Series(
+                [value not in regions for value in df["Region"]],
+                index=df.index,
+            )
+            empty_sequencer_ids = df["SequencerID"].isna()
+            # Messages are listed row by row, as they always were
+            for index in df.index[unknown_regions | empty_sequencer_ids]:
+                if unknown_regions[index]:
                     result = 0
                     messages.append(
                         "Region: in row "
                         + str(index + 1)
                         + " with the value '"
-                        + str(row["Region"])
+                        + str(df.at[index, "Region"])
                         + "' is not in the list of expected Regions"
                     )
 
-                if pd.isna(row["SequencerID"]):
+                if empty_sequencer_ids[index]:
                     result = 0
                     messages.append(
                         "SequencerID: in row "
@@ -203,49 +284,44 @@ class SequencingSequencerId:
             indexes = ["Index_1", "Index_2"]
             for index_x in indexes:
                 logger.info("Checking for " + index_x)
-                # Check index_1 if present
-                for index, row in df.iterrows():
-                    if index_x in row:
-
-                        index_value = row[index_x]
-                        logger.info(index_value)
-                        if pd.notna(index_value):
-                            # Check length
-                            if len(index_value) > 100:
-                                result = 0
-                                messages.append(
-                                    f"{ index_x } in row {index + 1} is "
-                                    "longer than 100 characters"
-                                )
-                            # Check if only contains ATGC
-                            if not all(char in "ATGC" for char in index_value):
-                                result = 0
-                                messages.append(
-                                    f"{index_x} in row {index + 1} "
-                                    "contains invalid characters "
-                                    "(only ATGC are allowed)"
-                                )
+                values = df[index_x].dropna().astype(str)
+                too_long = values.str.len() > 100
+                # Only ATGC are allowed
+                invalid = ~values.str.fullmatch("[ATGC]*")
+                for index in values.index[too_long | invalid]:
+                    result = 0
+                    if too_long[index]:
+                        messages.append(
+                            f"{ index_x } in row {index + 1} is "
+                            "longer than 100 characters"
+                        )
+                    if invalid[index]:
+                        messages.append(
+                            f"{index_x} in row {index + 1} "
+                            "contains invalid characters "
+                            "(only ATGC are allowed)"
+                        )
 
         # No problems found, so lets add these records
         if result == 1:
             sample_id_to_id = {
                 sample["SampleID"]: sample["id"] for sample in samples_data
             }
-
-            df["db_sample_id"] = None
-
-            for index, row in df.iterrows():
-                db_sample_id = sample_id_to_id[row["SampleID"]]
-                df.at[index, "db_sample_id"] = (
-                    db_sample_id  # Add db_sample_id to the DataFrame
-                )
-                cls.create(
-                    sample_id=db_sample_id,
-                    sequencer_id=row["SequencerID"],
-                    region=row["Region"],
-                    index_1=row["Index_1"],
-                    index_2=row["Index_2"],
-                )
+            df["db_sample_id"] = (
+                df["SampleID"].map(sample_id_to_id).astype(object)
+            )
+            cls.create_many(
+                [
+                    {
+                        "sample_id": row.db_sample_id,
+                        "sequencer_id": row.SequencerID,
+                        "region": row.Region,
+                        "index_1": row.Index_1,
+                        "index_2": row.Index_2,
+                    }
+                    for row in df.itertuples(index=False)
+                ]
+            )
 
         return {
             "result": result,
@@ -254,95 +330,59 @@ class SequencingSequencerId:
         }
 
     @classmethod
-    def get_matching_sequencer_ids(
-        cls, process_id, filename, sequencing_run=None
-    ):
+    def get_index(cls, process_id):
+        """
+        SequencerIdIndex of the sequencer IDs of an upload, built from
+        the database on each call. Callers that match many files build
+        it once and pass it along.
+        """
         with session_scope() as session:
-            matching_ids = []
-
-            # Ensure the filename ends
-            # with .fastq.gz or .fq.gz and strip it off
-            if filename.endswith(".fastq.gz"):
-                filename_no_ext = filename[:-9]  # Remove the .fastq.gz suffix
-            elif filename.endswith(".fq.gz"):
-                filename_no_ext = filename[:-6]  # Remove the .fq.gz suffix
-            else:
-                # Return empty list if filename
-                # doesn't match expected extensions
-                return matching_ids
-
-            # Start building the query
-            query = (
+            records = (
                 session.query(
                     SequencingSequencerIDsTable.id,
                     SequencingSequencerIDsTable.SequencerID,
+                    SequencingSequencerIDsTable.Region,
+                    SequencingSamplesTable.SampleID,
                 )
                 .join(SequencingSamplesTable)
                 .filter(
                     SequencingSamplesTable.sequencingUploadId == process_id
                 )
+                .order_by(SequencingSequencerIDsTable.id)
+                .all()
             )
 
-            # Execute the query and retrieve results
-            sequencer_ids = query.all()
-
-            # Extract id and SequencerID pairs from the query result
-            sequencer_ids = [(id, seq_id) for id, seq_id in sequencer_ids]
+        return SequencerIdIndex(record._asdict() for record in records)
 
-            # Find matching sequencer IDs and return the corresponding ids
-            for id, seq_id in sequencer_ids:
-                if filename_no_ext.startswith(seq_id):
-                    matching_ids.append(id)
+    @classmethod
+    def get_matching_sequencer_ids(
+        cls, process_id, filename, sequencing_run=None
+    ):
+        # Return empty list if filename
+        # doesn't match expected extensions
+        if split_fastq_filename(filename)[0] is None:
+            return []
+        return cls.get_index(process_id).match(filename)
 
-            return matching_ids
+    @classmethod
+    def match_filenames(cls, process_id, filenames):
+        """
+        Matches many filenames with one lookup of the upload's sequencer
+        IDs. Returns {filename: {"matches": [ids], "ambiguous": bool,
+        "new_filename": ...}}.
+        """
+        index = cls.get_index(process_id)
+        results = index.match_many(filenames)
+        for filename, result in results.items():
+            result["new_filename"] = index.new_filename(filename)
+        return results
 
     @classmethod
     def generate_new_filename(cls, process_id, filename):
-        with session_scope() as session:
-            # Ensure the filename ends
-            # with .fastq.gz or .fq.gz and strip it off
-            if filename.endswith(".fastq.gz"):
-                filename_no_ext = filename[:-9]  # Remove the .fastq.gz suffix
-                extension = ".fastq.gz"
-            elif filename.endswith(".fq.gz"):
-                filename_no_ext = filename[:-6]  # Remove the .fq.gz suffix
-                extension = ".fq.gz"
-            else:
-                # Return None if the filename doesn't have the correct suffix
-                return None
-
-            # Query to get all relevant records
-            sequencer_records = (
-                session.query(
-                    SequencingSamplesTable.SampleID,
-                    SequencingSequencerIDsTable.SequencerID,
-                    SequencingSequencerIDsTable.Region,
-                )
-                .join(SequencingSequencerIDsTable)
-                .filter(
-                    SequencingSamplesTable.sequencingUploadId == process_id
-                )
-                .all()
-            )
-
-            # Iterate through the results to find the matching record
-            for sample_id, sequencer_id, region in sequencer_records:
-                if filename_no_ext.startswith(sequencer_id):
-                    region = region.replace(" ", "_")
-
-                    # Get suffix after ID, remove _001, and handle underscores
-                    suffix = filename_no_ext[len(sequencer_id) :].replace(
-                        "_001", ""
-                    )
-                    connector = (
-                        "_" if suffix and not suffix.startswith("_") else ""
-                    )
-
-                    return (
-                        f"{sample_id}_{region}{connector}{suffix}{extension}"
-                    )
-
+        # Return None if the filename doesn't have the correct suffix
+        if split_fastq_filename(filename)[0] is None:
             return None
+        return cls.get_index(process_id).new_filename(filename)
 
     @classmethod
     def adapters_count(
@@ -352,9 +392,20 @@ class SequencingSequencerId:
         forward_primer,
         reverse_primer,
         reverse_primer_revcomp,
+        sample_reads=None,
     ):
-
-        # Fetch sequencer record early so we can check fields and update later
+        """
+        Counts the reads of a sequencer ID that contain its primers and
+        stores the counts, unless they are already known. With
+        sample_reads, only the first sample_reads read pairs are matched
+        by the built-in primer matcher (helpers.primer_matcher) instead of
+        cutadapt and vsearch, and the counts, scaled to the whole file,
+        are returned without being stored. Returns
+        {"status": ..., "counts": {...}}, status being one of skipped,
+        counted, estimated or failed.
+        """
+        # Read what is needed up front, the database session is not kept
+        # open while the external tools run
         with session_scope() as session:
             sequencer_record = (
                 session.query(SequencingSequencerIDsTable)
@@ -365,7 +416,7 @@ class SequencingSequencerId:
                 logger.error(
                     f"Sequencer record with id {sequencer_id['id']} not found"
                 )
-                return
+                return {"status": "failed", "counts": {}}
 
             # Check primers exist
             if not (forward_primer and reverse_primer):
@@ -373,11 +424,11 @@ class SequencingSequencerId:
                     "Forward or reverse primer not provided, "
                     "skipping adapter count."
                 )
-                return
+                return {"status": "skipped", "counts": {}}
 
             # Determine if single-read adapters need
             # to be counted (any of first 3 is None)
-            need_single_read = any(
+            need_single_read = sample_reads or any(
                 getattr(sequencer_record, field) is None
                 for field in [
                     "fwd_read_fwd_adap",
@@ -388,119 +439,176 @@ class SequencingSequencerId:
 
             # Determine if merged-read adapters
             # need to be counted (4th field is None)
-            need_merged_read = (
-                sequencer_record.fwd_rev_mrg_adap is None
-                and reverse_primer_revcomp
+            need_merged_read = reverse_primer_revcomp and (
+                sample_reads or sequencer_record.fwd_rev_mrg_adap is None
             )
 
             # If nothing to do, skip
             need_read_length = sequencer_record.read_length_min is None
             if not (need_single_read or need_merged_read or need_read_length):
                 logger.info("Adapters already counted, skipping.")
-                return
+                return {"status": "skipped", "counts": {}}
 
             # Find matching forward and reverse files as before
-            files_of_sequencer = (
-                session.query(SequencingFilesUploadedTable)
+            files_of_sequencer = {
+                f.new_name: f.id
+                for f in session.query(SequencingFilesUploadedTable)
                 .filter_by(sequencerId=sequencer_id["id"])
                 .all()
-            )
+            }
 
-            filenames = [f.new_name for f in files_of_sequencer]
-
-            forward_file = None
-            reverse_file = None
-
-            for i in range(len(filenames)):
-                for j in range(i + 1, len(filenames)):
-                    f1 = filenames[i]
-                    f2 = filenames[j]
-                    forward, reverse = find_forward_reverse_files(f1, f2)
-                    if forward and reverse:
-                        forward_file = forward
-                        reverse_file = reverse
-                        break
-                if forward_file and reverse_file:
-                    break
+        filenames = list(files_of_sequencer)
 
-            if not (forward_file and reverse_file):
-                logger.warning(
-                    "Could not find matching pair"
-                    " of forward and reverse files."
-                )
-                return
+        forward_file = None
+        reverse_file = None
+
+        for i in range(len(filenames)):
+            for j in range(i + 1, len(filenames)):
+                f1 = filenames[i]
+                f2 = filenames[j]
+                forward, reverse = find_forward_reverse_files(f1, f2)
+                if forward and reverse:
+                    forward_file = forward
+                    reverse_file = reverse
+                    break
+            if forward_file and reverse_file:
+                break
 
-            file_1_path = os.path.join(
-                "seq_processed", process_folder, forward_file
+        if not (forward_file and reverse_file):
+            logger.warning(
+                "Could not find matching pair of forward and reverse files."
             )
-            file_2_path = os.path.join(
-                "seq_processed", process_folder, reverse_file
+            return {"status": "failed", "counts": {}}
+
+        file_1_path = os.path.join(
+            "seq_processed", process_folder, forward_file
+        )
+        file_2_path = os.path.join(
+            "seq_processed", process_folder, reverse_file
+        )
+
+        # Read length stats of R1, the file is only scanned
+        # if its stats are not stored already
+        counts = {}
+        length_stats = None
+        if need_read_length or sample_reads:
+            length_stats = SequencingFileUploaded.get_stats(
+                files_of_sequencer[forward_file], file_1_path
             )
-
-            # Run read length stats on R1 if not yet recorded
-            if sequencer_record.read_length_min is None:
-                try:
-                    length_stats = get_read_length_stats(file_1_path)
-                    if length_stats:
-                        sequencer_record.read_length_min = length_stats[
-                            "read_length_min"
-                        ]
-                        sequencer_record.read_length_max = length_stats[
-                            "read_length_max"
-                        ]
-                        sequencer_record.read_length_avg = length_stats[
-                            "read_length_avg"
-                        ]
-                        session.commit()
-                except RuntimeError as e:
-                    logger.error(f"Read length stats failed: {e}")
-
-            # Run single-read adapter counting if needed
-            if need_single_read:
-                try:
-                    cutadapt_log = detect_single_read_primers(
-                        file_1_path=file_1_path,
-                        file_2_path=file_2_path,
-                        forward_primer_seq=forward_primer,
-                        reverse_primer_seq=reverse_primer,
-                    )
-                except RuntimeError as e:
-                    logger.error(f"Cutadapt single-read detection failed: {e}")
-                    return
-
-                reads = parse_detect_single_read_primers_output(cutadapt_log)
-
-                if reads.get("read1_with_adapter") is not None:
-                    sequencer_record.fwd_read_fwd_adap = reads[
-                        "read1_with_adapter"
-                    ]
-                if reads.get("read2_with_adapter") is not None:
-                    sequencer_record.rev_read_rev_adap = reads[
-                        "read2_with_adapter"
-                    ]
-                if reads.get("pairs_written") is not None:
-                    sequencer_record.fwd_rev_adap = reads["pairs_written"]
-
+            if length_stats and length_stats["read_count"]:
+                if need_read_length:
+                    for field in [
+                        "read_length_min",
+                        "read_length_max",
+                        "read_length_avg",
+                    ]:
+                        counts[field] = length_stats[field]
+            else:
+                logger.error(f"Read length stats failed for {file_1_path}")
+
+        result = {"status": "counted", "counts": counts}
+        if sample_reads:
+            if not (length_stats and length_stats["read_count"]):
+                return {"status": "failed", "counts": {}}
+            try:
+                hits = count_primer_hits(
+                    file_1_path,
+                    file_2_path,
+                    forward_primer,
+                    reverse_primer,
+                    reverse_primer_revcomp,
+                    sample_reads=sample_reads,
+                )
+            except (OSError, EOFError, ValueError) as e:
+                logger.error(f"Primer matching failed: {e}")
+                return {"status": "failed", "counts": counts}
+            # Estimates are returned only, the read lengths are exact
+            scale = length_stats["read_count"] / max(hits["reads"], 1)
+            result = {
+                "status": "estimated" if hits["reads"] else "failed",
+                "counts": {
+                    field: round(hits[field] * scale)
+                    for field in ADAPTER_COUNT_COLUMNS
+                    if field in hits
+                },
+            }
+        elif need_single_read or need_merged_read:
+            adapter_counts, succeeded = cls._run_adapter_counts(
+                file_1_path,
+                file_2_path,
+                forward_primer,
+                reverse_primer,
+                reverse_primer_revcomp,
+                need_single_read,
+                need_merged_read,
+            )
+            counts.update(adapter_counts)
+            if not succeeded:
+                result["status"] = "failed"
+
+        if counts:
+            with session_scope() as session:
+                session.query(SequencingSequencerIDsTable).filter_by(
+                    id=sequencer_id["id"]
+                ).update(counts)
                 session.commit()
 
-            # Run merged-read adapter counting if needed
-            if need_merged_read:
-                try:
-                    merged_log = detect_merged_read_primers(
-                        file_1_path=file_1_path,
-                        file_2_path=file_2_path,
-                        forward_primer_seq=forward_primer,
-                        reverse_primer_seq=reverse_primer_revcomp,
-                    )
-                except RuntimeError as e:
-                    logger.error(f"Cutadapt merged-read detection failed: {e}")
-                    return
+        return result
 
-                merged_reads = parse_detect_merged_read_primers_output(
-                    merged_log
+    @staticmethod
+    def _run_adapter_counts(
+        file_1_path,
+        file_2_path,
+        forward_primer,
+        reverse_primer,
+        reverse_primer_revcomp,
+        need_single_read,
+        need_merged_read,
+    ):
+        """
+        Runs cutadapt (and vsearch for merged reads) on a pair of files.
+        Returns the counts by column name and whether all tools succeeded.
+        """
+        counts = {}
+
+        # Run single-read adapter counting if needed
+        if need_single_read:
+            try:
+                cutadapt_log = detect_single_read_primers(
+                    file_1_path=file_1_path,
+                    file_2_path=file_2_path,
+                    forward_primer_seq=forward_primer,
+                    reverse_primer_seq=reverse_primer,
                 )
+            except RuntimeError as e:
+                logger.error(f"Cutadapt single-read detection failed: {e}")
+                return counts, False
+
+            reads = parse_detect_single_read_primers_output(cutadapt_log)
+
+            if reads.get("read1_with_adapter") is not None:
+                counts["fwd_read_fwd_adap"] = reads["read1_with_adapter"]
+            if reads.get("read2_with_adapter") is not None:
+                counts["rev_read_rev_adap"] = reads["read2_with_adapter"]
+            if reads.get("pairs_written") is not None:
+                counts["fwd_rev_adap"] = reads["pairs_written"]
+
+        # Run merged-read adapter counting if needed
+        if need_merged_read:
+            try:
+                merged_log = detect_merged_read_primers(
+                    file_1_path=file_1_path,
+                    file_2_path=file_2_path,
+                    forward_primer_seq=forward_primer,
+                    reverse_primer_seq=reverse_primer_revcomp,
+                )
+            except RuntimeError as e:
+                logger.error(f"Cutadapt merged-read detection failed: {e}")
+                return counts, False
 
-                if merged_reads is not None:
-                    sequencer_record.fwd_rev_mrg_adap = merged_reads
+            merged_reads = parse_detect_merged_read_primers_output(merged_log)
 
-                session.commit()
+            if merged_reads is not None:
+                counts["fwd_rev_mrg_adap"] = merged_reads
+
+        return counts, True
@@ -7,18 +7,23 @@ import json
 import shutil
 import csv
 import re
+import time
+import threading
 import pandas as pd
 from unidecode import unidecode
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from helpers.dbm import session_scope
+from helpers import fs_index
 from helpers.fastqc import init_create_fastqc_report, check_fastqc_report
+from helpers.cutadapt import adapter_count_workers
+from helpers import metadata_config
 from helpers.metadata_check import (
     get_sequences_based_on_primers,
     build_region_primer_dict,
 )
 from helpers.bucket import (
-    check_file_exists_in_bucket,
-    calculate_md5,
+    check_files_exist_in_bucket,
     init_download_file_from_bucket,
 )
 from models.db_model import (
@@ -36,8 +41,8 @@ from models.db_model import (
 )
 from models.sequencing_analysis import SequencingAnalysis
 from models.taxonomy import TaxonomyManager
-from models.sequencing_analysis_type import SequencingAnalysisType
 from models.sequencing_files_uploaded import SequencingFileUploaded
+from models.bucket_reconciliation import BucketReconciliation
 from helpers.bucket import init_bucket_chunked_upload_v2
 from pathlib import Path
 from flask_login import current_user
@@ -49,6 +54,34 @@ from sqlalchemy import desc, func, text, or_, case
 # Get the logger instance from app.py
 logger = logging.getLogger("my_app_logger")  # Use the same name as in app.py
 
+TAXONOMY_RANKS = [
+    "Domain",
+    "Phylum",
+    "Class",
+    "Order",
+    "Family",
+    "Genus",
+    "Species",
+]
+
+# The columns of otu_full_data.csv that we import, and how many rows
+# are read, mapped and inserted at a time
+OTU_IMPORT_COLUMNS = set(
+    TAXONOMY_RANKS + ["sample_id", "abundance", "ecm_flag"]
+)
+OTU_IMPORT_CHUNK_SIZE = 50000
+
+# A sequencer ID needs an adapter count while any of these is missing
+ADAPTER_COUNT_FIELDS = [
+    "fwd_read_fwd_adap",
+    "rev_read_rev_adap",
+    "fwd_rev_adap",
+    "fwd_rev_mrg_adap",
+    "read_length_min",
+]
+# Progress of the last adapter count, kept in the uploads folder
+ADAPTER_COUNT_PROGRESS_FILE = "adapters_count_progress.json"
+
 
 class SequencingUpload:
     def __init__(self, **kwargs):
@@ -112,10 +145,24 @@ class SequencingUpload:
                 query = query.filter(SequencingUploadsTable.user_id == user_id)
 
             upload_dbs = query.order_by(desc(SequencingUploadsTable.id)).all()
+            upload_ids = [upload_db.id for upload_db, user in upload_dbs]
+
+            # All the counts below are computed with one grouped query
+            # each, instead of one query per upload
+            def restrict_to_uploads(count_query):
+                if user_id is not None:
+                    count_query = count_query.filter(
+                        SequencingSamplesTable.sequencingUploadId.in_(
+                            upload_ids
+                        )
+                    )
+                return count_query.group_by(
+                    SequencingSamplesTable.sequencingUploadId
+                ).all()
 
             # Precompute the missing adapters count
             # grouped by sequencingUploadId
-            missing_adapters_counts = (
+            missing_adapters_counts = restrict_to_uploads(
                 session.query(
                     SequencingSamplesTable.sequencingUploadId,
                     func.count(SequencingSamplesTable.id).label("cnt"),
@@ -137,8 +184,6 @@ class SequencingUpload:
                         SequencingSequencerIDsTable.fwd_rev_mrg_adap.is_(None),
                     )
                 )
-                .group_by(SequencingSamplesTable.sequencingUploadId)
-                .all()
             )
 
             # Convert to a dictionary for quick lookup
@@ -147,6 +192,80 @@ class SequencingUpload:
                 for upload_id, count in missing_adapters_counts
             }
 
+            samples_counts = dict(
+                restrict_to_uploads(
+                    session.query(
+                        SequencingSamplesTable.sequencingUploadId,
+                        func.count(SequencingSamplesTable.id),
+                    )
+                )
+            )
+
+            sequencer_ids_counts = dict(
+                restrict_to_uploads(
+                    session.query(
+                        SequencingSamplesTable.sequencingUploadId,
+                        func.count(SequencingSequencerIDsTable.id),
+                    ).join(
+                        SequencingSequencerIDsTable,
+                        SequencingSamplesTable.id
+                        == SequencingSequencerIDsTable.sequencingSampleId,
+                    )
+                )
+            )
+
+            files_counts = dict(
+                restrict_to_uploads(
+                    session.query(
+                        SequencingSamplesTable.sequencingUploadId,
+                        func.count(SequencingFilesUploadedTable.id),
+                    )
+                    .join(
+                        SequencingSequencerIDsTable,
+                        SequencingSamplesTable.id
+                        == SequencingSequencerIDsTable.sequencingSampleId,
+                    )
+                    .join(
+                        SequencingFilesUploadedTable,
+                        SequencingFilesUploadedTable.sequencerId
+                        == SequencingSequencerIDsTable.id,
+                    )
+                )
+            )
+
+            # Load all the analysis types once, grouped by region
+            analysis_types_by_region = defaultdict(list)
+            for analysis_type in (
+                session.query(SequencingAnalysisTypesTable)
+                .order_by(SequencingAnalysisTypesTable.id)
+                .all()
+            ):
+                analysis_types_by_region[analysis_type.region].append(
+                    {"id": analysis_type.id, "name": analysis_type.name}
+                )
+
+            # Load all the analyses once, keyed by upload and analysis type.
+            # If an upload has more than one analysis of the same type,
+            # the first one wins, as it did when we looked them up per upload
+            analyses_query = session.query(
+                SequencingAnalysisTable.id,
+                SequencingAnalysisTable.sequencingUploadId,
+                SequencingAnalysisTable.sequencingAnalysisTypeId,
+                SequencingAnalysisTable.lotus2_status,
+                SequencingAnalysisTable.rscripts_status,
+            ).filter(SequencingAnalysisTable.sequencingUploadId.isnot(None))
+            if user_id is not None:
+                analyses_query = analyses_query.filter(
+                    SequencingAnalysisTable.sequencingUploadId.in_(upload_ids)
+                )
+            analyses_by_upload = defaultdict(dict)
+            for analysis in analyses_query.order_by(
+                SequencingAnalysisTable.id
+            ):
+                analyses_by_upload[analysis.sequencingUploadId].setdefault(
+                    analysis.sequencingAnalysisTypeId, analysis
+                )
+
             uploads = []
             for upload_db, user in upload_dbs:
                 upload_db_dict = upload_db.__dict__
@@ -167,29 +286,23 @@ class SequencingUpload:
                 )
 
                 # Calculate the total size of the uploads folder and
-                # count the fastq files
+                # count the fastq files. A missing directory silently
+                # counts as empty.
                 upload.total_uploads_file_size = 0
                 upload.nr_fastq_files = 0  # Count of files on disk
                 uploads_folder = filtered_dict["uploads_folder"]
                 if uploads_folder:
                     full_path = os.path.join("seq_processed", uploads_folder)
-                    # Check existence silently
-                    if os.path.exists(full_path) and os.path.isdir(full_path):
-                        total_size, fastq_count = cls.get_directory_size(
-                            full_path
-                        )
-                        upload.total_uploads_file_size = total_size
-                        upload.nr_fastq_files = fastq_count
-                    else:
-                        # Silently set to 0 if directory is missing
-                        upload.total_uploads_file_size = 0
-                        upload.nr_fastq_files = 0
+                    total_size, fastq_count = cls.get_directory_size(
+                        full_path, warn_if_missing=False
+                    )
+                    upload.total_uploads_file_size = total_size
+                    upload.nr_fastq_files = fastq_count
 
-                # Calculate the number of files reported by the database
-                db_reported_files = cls._get_uploaded_files_for_upload(
-                    session, filtered_dict["id"]
+                # The number of files reported by the database
+                upload.nr_fastq_files_db_reported = files_counts.get(
+                    upload.id, 0
                 )
-                upload.nr_fastq_files_db_reported = len(db_reported_files)
 
                 # Calculate the number of regions
                 upload.nr_regions = 0
@@ -202,38 +315,25 @@ class SequencingUpload:
                     upload.regions.append(upload.region_2)
 
                 # Count the number of samples associated with this upload
-                nr_samples = (
-                    session.query(SequencingSamplesTable)
-                    .filter_by(sequencingUploadId=filtered_dict["id"])
-                    .count()
-                )
-                upload.nr_samples = nr_samples
+                upload.nr_samples = samples_counts.get(upload.id, 0)
 
-                analysis_all = SequencingAnalysis.get_by_upload(upload.id)
-
-                # Extract the analysis type IDs from the
-                # existing analyses for easier lookup
-                existing_analysis_type_ids = {
-                    analysis["analysisTypeId"] for analysis in analysis_all
-                }
+                existing_analyses = analyses_by_upload.get(upload.id, {})
 
                 # Initialize the analysis structure grouped by region
                 upload.analysis = {}
 
                 for region in upload.regions:
                     if uploads_folder:
-                        # Get the required analyses for the current region
-                        required_analyses = (
-                            SequencingAnalysisType.get_all_by_region(region)
-                        )
-
                         # Initialize a list to store analyses
                         # for the current region
                         region_analyses = []
 
                         # Because plural of analysis had to
                         # be so close as to be confusing!
-                        for required_one_analysis in required_analyses:
+                        for required_one_analysis in analysis_types_by_region[
+                            region
+                        ]:
+                            analysis_type_name = required_one_analysis["name"]
 
                             # Set up the basic structure for the analysis item
                             upload_required_analysis = {
@@ -241,9 +341,7 @@ class SequencingUpload:
                                     "id"
                                 ],
                                 "analysis_id": None,
-                                "analysis_type_name": required_one_analysis[
-                                    "name"
-                                ],
+                                "analysis_type_name": analysis_type_name,
                                 "lotus2_status": None,
                                 "lotus2_phyloseq_file_exists": False,
                                 "rscripts_status": None,
@@ -251,70 +349,54 @@ class SequencingUpload:
                                 "richness_file_exists": False,
                             }
 
-                            if (
+                            matching_analysis = existing_analyses.get(
                                 required_one_analysis["id"]
-                                in existing_analysis_type_ids
-                            ):
-                                # Find the corresponding existing
-                                # analysis to get the status
-                                matching_analysis = next(
-                                    (
-                                        a
-                                        for a in analysis_all
-                                        if a["analysisTypeId"]
-                                        == required_one_analysis["id"]
-                                    ),
-                                    None,
+                            )
+                            if matching_analysis:
+                                upload_required_analysis["lotus2_status"] = (
+                                    matching_analysis.lotus2_status
+                                )
+                                upload_required_analysis["rscripts_status"] = (
+                                    matching_analysis.rscripts_status
+                                )
+                                upload_required_analysis["analysis_id"] = (
+                                    matching_analysis.id
                                 )
 
-                                # If a match is found, set the status
-                                if matching_analysis:
-                                    upload_required_analysis[
-                                        "lotus2_status"
-                                    ] = matching_analysis["lotus2_status"]
-                                    upload_required_analysis[
-                                        "rscripts_status"
-                                    ] = matching_analysis["rscripts_status"]
-                                    upload_required_analysis["analysis_id"] = (
-                                        matching_analysis["id"]
-                                    )
-
-                            # Construct the phyloseq file path for lotus2 and
-                            # check if it exists
-                            lotus2_phyloseq_file = os.path.join(
+                            # Check if the phyloseq files of lotus2 and
+                            # rscripts and the richness file exist
+                            lotus2_folder = os.path.join(
                                 "seq_processed",
                                 uploads_folder,
                                 "lotus2_report",
-                                required_one_analysis["name"],
-                                "phyloseq.Rdata",
+                                analysis_type_name,
                             )
-                            upload_required_analysis[
-                                "lotus2_phyloseq_file_exists"
-                            ] = os.path.isfile(lotus2_phyloseq_file)
-
-                            # Construct the phyloseq file path
-                            # for rscripts and check if it exists
-                            rscripts_phyloseq_file = os.path.join(
+                            rscripts_folder = os.path.join(
                                 "seq_processed",
                                 uploads_folder,
                                 "r_output",
-                                required_one_analysis["name"],
-                                "physeq_decontam.Rdata",
+                                analysis_type_name,
+                            )
+                            upload_required_analysis[
+                                "lotus2_phyloseq_file_exists"
+                            ] = fs_index.file_exists(
+                                os.path.join(lotus2_folder, "phyloseq.Rdata")
                             )
                             upload_required_analysis[
                                 "rscripts_phyloseq_file_exists"
-                            ] = os.path.isfile(rscripts_phyloseq_file)
-
-                            richness_file = os.path.join(
-                                "seq_processed",
-                                uploads_folder,
-                                "r_output",
-                                required_one_analysis["name"],
-                                "metadata_chaorichness.csv",
+                            ] = fs_index.file_exists(
+                                os.path.join(
+                                    rscripts_folder, "physeq_decontam.Rdata"
+                                )
                             )
                             upload_required_analysis[
                                 "richness_file_exists"
-                            ] = os.path.isfile(richness_file)
+                            ] = fs_index.file_exists(
+                                os.path.join(
+                                    rscripts_folder,
+                                    "metadata_chaorichness.csv",
+                                )
+                            )
 
                             # Append this analysis to the current region's list
                             region_analyses.append(upload_required_analysis)
@@ -324,43 +406,34 @@ class SequencingUpload:
                         upload.analysis[region] = region_analyses
 
                 # Count the number of sequencer IDs associated with this upload
-                nr_sequencer_ids = (
-                    session.query(SequencingSequencerIDsTable)
-                    .join(
-                        SequencingSamplesTable,
-                        SequencingSamplesTable.id
-                        == SequencingSequencerIDsTable.sequencingSampleId,
-                    )
-                    .filter(
-                        SequencingSamplesTable.sequencingUploadId
-                        == filtered_dict["id"]
-                    )
-                    .count()
+                upload.nr_sequencer_ids = sequencer_ids_counts.get(
+                    upload.id, 0
                 )
-                upload.nr_sequencer_ids = nr_sequencer_ids
 
                 # Add user name and email to the upload dictionary
                 upload.user_name = user_dict["name"]
                 upload.user_email = user_dict["email"]
 
-                upload_dict = upload.__dict__
-                uploads.append(upload_dict)
-
                 # Add count of sequencer IDs with missing adapters
                 upload.missing_adapter_sequencer_ids = (
                     missing_adapters_dict.get(upload.id, 0)
                 )
 
+                uploads.append(upload.__dict__)
+
             return uploads
 
     @staticmethod
-    def get_directory_size(directory):
+    def get_directory_size(directory, warn_if_missing=True):
         """
         Calculates the total size of files and counts FASTQ files
         ONLY in the specified directory, not in its subdirectories.
+        The directory listing is cached until the directory changes.
 
         Args:
             directory (str): The path to the directory to scan.
+            warn_if_missing (bool): Print a warning if the directory
+                does not exist.
 
         Returns:
             tuple: (total_size_in_bytes, fastq_file_count)
@@ -370,32 +443,28 @@ class SequencingUpload:
 
         if not os.path.isdir(directory):
             # Handle cases where the directory might not exist or isn't a directory
-            print(
-                f"Warning: Directory not found or is not a directory: {directory}"
-            )
+            if warn_if_missing:
+                print(
+                    f"Warning: Directory not found or is not a directory: {directory}"
+                )
             return 0, 0
 
-        try:
-            # os.listdir() gets contents of only the top-level directory
-            for entry_name in os.listdir(directory):
-                fp = os.path.join(directory, entry_name)
-
-                # Ensure it's a file, not a subdirectory or other special file
-                if os.path.isfile(fp):
-                    total_size += os.path.getsize(fp)
-                    # Check for FASTQ extensions (case-insensitive for robustness)
-                    lower_f = entry_name.lower()
-                    if (
-                        lower_f.endswith(".fastq.gz")
-                        or lower_f.endswith(".fastq")
-                        or lower_f.endswith(".fq.gz")
-                        or lower_f.endswith(".fq")
-                    ):
-                        fastq_count += 1
-        except OSError as e:
-            print(f"Error accessing directory '{directory}': {e}")
-            # Optionally re-raise or handle more gracefully
-            return 0, 0  # Or some error indicator
+        # Only the top-level directory is listed
+        for entry_name, (is_file, size, _mtime) in fs_index.list_directory(
+            directory
+        ).items():
+            # Ensure it's a file, not a subdirectory or other special file
+            if is_file:
+                total_size += size
+                # Check for FASTQ extensions (case-insensitive for robustness)
+                lower_f = entry_name.lower()
+                if (
+                    lower_f.endswith(".fastq.gz")
+                    or lower_f.endswith(".fastq")
+                    or lower_f.endswith(".fq.gz")
+                    or lower_f.endswith(".fq")
+                ):
+                    fastq_count += 1
 
         return total_size, fastq_count
 
@@ -454,20 +523,8 @@ class SequencingUpload:
 
     @classmethod
     def get_region(cls, forward_primer, reverse_primer):
-        current_dir = os.path.dirname(__file__)
-        base_dir = os.path.abspath(os.path.join(current_dir, os.pardir))
-        regions_file_path = os.path.join(
-            base_dir, "metadataconfig", "primer_set_regions.json"
-        )
-
-        # Load the JSON file
-        with open(regions_file_path, "r") as f:
-            primer_set_region = json.load(f)
-
-        # Create a reverse lookup dictionary from primers to region names
-        primer_to_region = {
-            (key): value["Region"] for key, value in primer_set_region.items()
-        }
+        # Region of the primer set, from the prebuilt lookup
+        primer_to_region = metadata_config.primer_sets()["primer_to_region"]
 
         # Combine forward and reverse primer
         primer_set = f"{forward_primer}/{reverse_primer}"
@@ -510,7 +567,7 @@ class SequencingUpload:
     @classmethod
     def get_samples(self, sequencingUploadId):
         # Connect to the database and create a session
-        with session_scope() as session:
+        with session_scope(reuse=True) as session:
 
             # Fetch related samples
             samples = (
@@ -560,6 +617,49 @@ class SequencingUpload:
                     for column in instance.__table__.columns
                 }
 
+            # OTU counts of all the samples, grouped by sample and
+            # analysis type, instead of one query per sample
+            otu_counts_by_sample = {}
+            counts = (
+                session.query(
+                    OTU.sample_id,
+                    SequencingAnalysisTypesTable.name,
+                    func.count(Taxonomy.id),
+                    SequencingAnalysisTypesTable.id,
+                )
+                .join(Taxonomy, OTU.taxonomy_id == Taxonomy.id)
+                .join(
+                    SequencingAnalysisTable,
+                    SequencingAnalysisTable.id == OTU.sequencing_analysis_id,
+                )
+                .join(
+                    SequencingAnalysisTypesTable,
+                    SequencingAnalysisTypesTable.id
+                    == SequencingAnalysisTable.sequencingAnalysisTypeId,
+                )
+                .join(
+                    SequencingSamplesTable,
+                    SequencingSamplesTable.id == OTU.sample_id,
+                )
+                .filter(
+                    SequencingSamplesTable.sequencingUploadId
+                    == sequencingUploadId
+                )
+                .group_by(
+                    OTU.sample_id,
+                    SequencingAnalysisTypesTable.name,
+                    SequencingAnalysisTypesTable.id,
+                )
+                .all()
+            )
+            for sample_id, analysis_name, count, analysis_type_id in counts:
+                otu_counts_by_sample.setdefault(sample_id, {})[
+                    analysis_type_id
+                ] = {
+                    "name": analysis_name,
+                    "count": count,
+                }
+
             # Convert each sample instance to a dictionary and add otu_counts
             samples_list = []
             for sample, ecoregion_name in samples:  # ✅ Unpack tuple properly
@@ -569,44 +669,11 @@ class SequencingUpload:
                 )
 
                 sample_id = sample_data.get("id")  # Get the sample id
-                otu_counts = {}
-
-                # Query to get the counts grouped by analysis
-                # type name and analysis_type_id
-                counts = (
-                    session.query(
-                        SequencingAnalysisTypesTable.name,
-                        func.count(Taxonomy.id),
-                        SequencingAnalysisTypesTable.id,
-                    )
-                    .join(OTU, OTU.taxonomy_id == Taxonomy.id)
-                    .join(
-                        SequencingAnalysisTable,
-                        SequencingAnalysisTable.id
-                        == OTU.sequencing_analysis_id,
-                    )
-                    .join(
-                        SequencingAnalysisTypesTable,
-                        SequencingAnalysisTypesTable.id
-                        == SequencingAnalysisTable.sequencingAnalysisTypeId,
-                    )
-                    .filter(OTU.sample_id == sample_id)
-                    .group_by(
-                        SequencingAnalysisTypesTable.name,
-                        SequencingAnalysisTypesTable.id,
-                    )
-                    .all()
-                )
-
-                # Populate the otu_counts dictionary
-                for analysis_name, count, analysis_type_id in counts:
-                    otu_counts[analysis_type_id] = {
-                        "name": analysis_name,
-                        "count": count,
-                    }
 
                 # Add the otu_counts dictionary to the sample data
-                sample_data["otu_counts"] = otu_counts
+                sample_data["otu_counts"] = otu_counts_by_sample.get(
+                    sample_id, {}
+                )
                 sample_data["photo_count"] = photo_counts.get(sample_id, 0)
 
                 # Append the updated sample data to the list
@@ -1126,7 +1193,7 @@ class SequencingUpload:
     @classmethod
     def get_samples_with_sequencers_and_files(self, sequencingUploadId):
         # Connect to the database and create a session
-        with session_scope() as session:
+        with session_scope(reuse=True) as session:
 
             # Fetch the SequencingUpload instance
             upload_instance = (
@@ -1310,80 +1377,22 @@ class SequencingUpload:
     @classmethod
     def ensure_bucket_upload_progress(self, sequencingUploadId):
         """
-        Ensures that all files for a given sequencing upload have their
-        bucket_upload_progress updated and initiates chunked uploads if needed.
-        It also retries uploads if the file is not found in the bucket,
-        even if the progress was previously marked as 100.
+        Uploads again the files of a sequencing upload that are not in
+        its bucket, or are in it with another size than the local file,
+        whatever their bucket_upload_progress says. See
+        BucketReconciliation.enqueue_missing.
         """
-        # Connect to the database and create a session
-        with session_scope() as session:
-
-            # Fetch the SequencingUpload instance
-            upload_instance = (
-                session.query(SequencingUploadsTable)
-                .filter_by(id=sequencingUploadId)
-                .first()
-            )
-
-            # If no instance is found, return early
-            if not upload_instance:
-                logger.info(
-                    f"No SequencingUpload instance found for ID: {sequencingUploadId}"
-                )
-                return
-
-            # Access the 'project' field
-            bucket = upload_instance.project_id
-            uploads_folder = upload_instance.uploads_folder
-
-            # Fetch related uploaded files using the new helper method
-            uploaded_files = self._get_uploaded_files_for_upload(
-                session, sequencingUploadId
-            )
-
-            # Iterate through the files and check the bucket_upload_progress
-            for file, sample_id, region in uploaded_files:
-                # Construct the local path to the processed file (moved outside the if)
-                processed_file_path = (
-                    f"seq_processed/{uploads_folder}/{file.new_name}"
-                )
-                destination_upload_directory = region
-                destination_blob_name = file.new_name
-
-                # Check if upload is needed:
-                # 1. If bucket_upload_progress is not set or less than 100
-                # OR
-                # 2. If bucket_upload_progress is 100, but the file is NOT found in the bucket
-                if (
-                    not file.bucket_upload_progress
-                    or file.bucket_upload_progress < 100
-                    or not check_file_exists_in_bucket(
-                        local_file_path=processed_file_path,
-                        destination_upload_directory=destination_upload_directory,
-                        destination_blob_name=destination_blob_name,
-                        bucket_name=bucket,
-                    )
-                ):
-                    # Calculate MD5 if it is null
-                    if not file.md5:
-                        file.md5 = calculate_md5(
-                            processed_file_path
-                        )  # Calculate MD5
-                        # Update the md5 field in the database
-                        session.commit()  # Commit the change to the database
-
-                    # Start the chunked upload to the bucket
-                    init_bucket_chunked_upload_v2(
-                        local_file_path=processed_file_path,
-                        destination_upload_directory=destination_upload_directory,
-                        destination_blob_name=destination_blob_name,
-                        sequencer_file_id=file.id,
-                        bucket_name=bucket,
-                        known_md5=file.md5,  # Pass the calculated MD5
-                    )
+        started = BucketReconciliation.enqueue_missing(sequencingUploadId)
+        if started is None:
             logger.info(
-                f"Finished ensuring bucket upload progress for SequencingUpload ID: {sequencingUploadId}"
+                f"No SequencingUpload instance found for ID: {sequencingUploadId}"
             )
+            return
+
+        logger.info(
+            f"Finished ensuring bucket upload progress for SequencingUpload ID: {sequencingUploadId}"
+        )
+        return started
 
     @classmethod
     def update_field(cls, id, fieldname, value):
@@ -1657,8 +1666,9 @@ class SequencingUpload:
         return output_file_path
 
     @classmethod
-    def check_mapping_files_exist(self, process_id):
-        process_data = self.get(process_id)
+    def check_mapping_files_exist(self, process_id, process_data=None):
+        if process_data is None:
+            process_data = self.get(process_id)
         uploads_folder = process_data["uploads_folder"]
         mappings_folder = os.path.join(
             "seq_processed", uploads_folder, "mapping_files"
@@ -1670,21 +1680,29 @@ class SequencingUpload:
                 mapping_file = os.path.join(
                     mappings_folder, f"{region}_Mapping.txt"
                 )
-                if os.path.isfile(mapping_file):
+                if fs_index.file_exists(mapping_file):
                     existing_mappings.append(region)
             return existing_mappings
         else:
             return []
 
     @classmethod
-    def check_lotus2_reports_exist(cls, process_id):
-        with session_scope() as session:
-            process_data = cls.get(process_id)
+    def check_lotus2_reports_exist(
+        cls, process_id, process_data=None, check_bucket=True
+    ):
+        """
+        With check_bucket=False the bucket is not looked at and
+        bucket_log_exists is None, see ReportsBucketStatus.
+        """
+        with session_scope(reuse=True) as session:
+            if process_data is None:
+                process_data = cls.get(process_id)
 
             # Extract uploads folder and bucket from process data
             uploads_folder = process_data["uploads_folder"]
             bucket = process_data["project_id"]
             results = []  # To store the results for each region
+            bucket_checks = []  # (region_result, blob path) pairs
 
             # Iterate through each region
             for index, region in enumerate(process_data["regions"]):
@@ -1768,15 +1786,15 @@ class SequencingUpload:
                             # result dictionary
                             region_result["log_files_exist"][
                                 "LotuS_progout"
-                            ] = os.path.isfile(lotus_progout_file)
+                            ] = fs_index.file_exists(lotus_progout_file)
                             region_result["log_files_exist"]["demulti"] = (
-                                os.path.isfile(demulti_file)
+                                fs_index.file_exists(demulti_file)
                             )
                             region_result["log_files_exist"]["LotuS_run"] = (
-                                os.path.isfile(lotus_run_file)
+                                fs_index.file_exists(lotus_run_file)
                             )
                             region_result["log_files_exist"]["phyloseq"] = (
-                                os.path.isfile(phyloseq_file)
+                                fs_index.file_exists(phyloseq_file)
                             )
                             region_result["log_files_exist"][
                                 "lotus2_command_outcome"
@@ -1786,24 +1804,42 @@ class SequencingUpload:
                                 f"lotus2_report/"
                                 f"{analysis_type.name}/LotuSLogS"
                             )
-                            # Check if LotuS_progout.log exists in the bucket
-                            progout_exists = check_file_exists_in_bucket(
-                                local_file_path=lotus_progout_file,
-                                destination_upload_directory=bucket_directory,
-                                destination_blob_name="LotuS_progout.log",
-                                bucket_name=bucket,
+                            # Checked in the bucket for all regions at once
+                            bucket_checks.append(
+                                (
+                                    region_result,
+                                    f"{bucket_directory}/LotuS_progout.log",
+                                )
                             )
-                            region_result["bucket_log_exists"] = progout_exists
 
                     # Append the region result to the results list
                     results.append(region_result)
+
+            for region_result, blob_path in bucket_checks:
+                region_result["bucket_blob_path"] = blob_path
+            if not check_bucket:
+                for region_result, _ in bucket_checks:
+                    region_result["bucket_log_exists"] = None
+                return results
+
+            # One bucket listing answers for every analysis type
+            blobs_exist = check_files_exist_in_bucket(
+                [blob_path for _, blob_path in bucket_checks],
+                bucket_name=bucket,
+                match_glob="lotus2_report/*/LotuSLogS/LotuS_progout.log",
+            )
+            for region_result, blob_path in bucket_checks:
+                region_result["bucket_log_exists"] = blobs_exist[blob_path]
             return results
 
     @classmethod
     def check_all_files_uploaded(cls, sequencingUploadId):
         """
         Checks if all files associated with a SequencingUpload instance
-        have been successfully uploaded to the Google Cloud Storage bucket.
+        have been successfully uploaded to the Google Cloud Storage bucket,
+        with the same size as the local files. The bucket is listed once
+        for all the uploads of the project, and the result recorded, see
+        BucketReconciliation.
 
         Args:
             sequencingUploadId (int): The ID of the SequencingUpload instance.
@@ -1811,63 +1847,31 @@ class SequencingUpload:
         Returns:
             bool: True if all files are found in the bucket, False otherwise.
         """
-        from google.cloud import storage
-
-        with session_scope() as session:
-            upload_instance = (
-                session.query(SequencingUploadsTable)
-                .filter_by(id=sequencingUploadId)
-                .first()
-            )
-
-            if not upload_instance:
-                logger.info(
-                    f"No SequencingUpload instance found for ID: {sequencingUploadId}. Returning False."
-                )
-                return False
-
-            bucket_name = upload_instance.project_id
+        try:
+            snapshot = BucketReconciliation.reconcile(sequencingUploadId)
+        except Exception as e:
+            logger.exception(f"Error while accessing GCS bucket: {e}")
+            return False
 
-            uploaded_files = cls._get_uploaded_files_for_upload(
-                session, sequencingUploadId
+        if snapshot is None:
+            logger.info(
+                f"No SequencingUpload instance found for ID: {sequencingUploadId}. Returning False."
             )
+            return False
 
-            if not uploaded_files:
-                logger.info(
-                    f"No files found for SequencingUpload ID: {sequencingUploadId}. Returning True."
-                )
-                return True
-
-            # Group files by region to avoid redundant listings
-            files_by_region = {}
-            for file, sample_id, region in uploaded_files:
-                files_by_region.setdefault(region, []).append(file.new_name)
-
-            # Initialize client once
-            storage_client = storage.Client()
-
-            # For each region, list all blobs and check
-            for region, expected_files in files_by_region.items():
-                prefix = f"{region}/"  # GCS "folder"
-                try:
-                    bucket = storage_client.bucket(bucket_name)
-                    blobs = list(bucket.list_blobs(prefix=prefix))
-                    blob_names = {blob.name.split("/")[-1] for blob in blobs}
-
-                    for filename in expected_files:
-                        if filename not in blob_names:
-                            logger.info(
-                                f"File '{filename}' not found in bucket '{bucket_name}' under directory '{region}'. Returning False."
-                            )
-                            return False
-                except Exception as e:
-                    logger.exception(f"Error while accessing GCS bucket: {e}")
-                    return False
-
+        if not snapshot["complete"]:
             logger.info(
-                f"All files for SequencingUpload ID: {sequencingUploadId} found in bucket. Returning True."
+                f"{len(snapshot['missing_files'])} files missing and "
+                f"{len(snapshot['size_mismatched_files'])} files with "
+                f"another size in bucket '{snapshot['bucket']}' for "
+                f"SequencingUpload ID: {sequencingUploadId}. Returning False."
             )
-            return True
+            return False
+
+        logger.info(
+            f"All files for SequencingUpload ID: {sequencingUploadId} found in bucket. Returning True."
+        )
+        return True
 
     @classmethod
     def delete_local_files(cls, sequencingUploadId):
@@ -1940,14 +1944,22 @@ class SequencingUpload:
             return all_deleted_successfully
 
     @classmethod
-    def check_rscripts_reports_exist(cls, process_id):
-        with session_scope() as session:
-            process_data = cls.get(process_id)
+    def check_rscripts_reports_exist(
+        cls, process_id, process_data=None, check_bucket=True
+    ):
+        """
+        With check_bucket=False the bucket is not looked at and
+        bucket_log_exists is None, see ReportsBucketStatus.
+        """
+        with session_scope(reuse=True) as session:
+            if process_data is None:
+                process_data = cls.get(process_id)
 
             # Extract uploads folder and bucket from process data
             uploads_folder = process_data["uploads_folder"]
             bucket = process_data["project_id"]
             results = []  # To store the results for each region
+            bucket_checks = []  # (region_result, blob path) pairs
 
             # Iterate through each region
             for index, region in enumerate(process_data["regions"]):
@@ -2025,7 +2037,7 @@ class SequencingUpload:
                                 report_folder, "LibrarySize.pdf"
                             )
                             region_result["files_exist"]["LibrarySize"] = (
-                                os.path.isfile(library_size_file)
+                                fs_index.file_exists(library_size_file)
                             )
 
                             control_vs_sample_file = os.path.join(
@@ -2033,20 +2045,20 @@ class SequencingUpload:
                             )
                             region_result["files_exist"][
                                 "control_vs_sample"
-                            ] = os.path.isfile(control_vs_sample_file)
+                            ] = fs_index.file_exists(control_vs_sample_file)
 
                             filtered_rarefaction_file = os.path.join(
                                 report_folder, "filtered_rarefaction.pdf"
                             )
                             region_result["files_exist"][
                                 "filtered_rarefaction"
-                            ] = os.path.isfile(filtered_rarefaction_file)
+                            ] = fs_index.file_exists(filtered_rarefaction_file)
 
                             physeq_decontam_file = os.path.join(
                                 report_folder, "physeq_decontam.Rdata"
                             )
                             region_result["files_exist"]["physeq_decontam"] = (
-                                os.path.isfile(physeq_decontam_file)
+                                fs_index.file_exists(physeq_decontam_file)
                             )
 
                             metadata_chaorichness_file = os.path.join(
@@ -2054,13 +2066,15 @@ class SequencingUpload:
                             )
                             region_result["files_exist"][
                                 "metadata_chaorichness"
-                            ] = os.path.isfile(metadata_chaorichness_file)
+                            ] = fs_index.file_exists(
+                                metadata_chaorichness_file
+                            )
 
                             contaminants_file = os.path.join(
                                 report_folder, "contaminants.csv"
                             )
                             region_result["files_exist"]["contaminants"] = (
-                                os.path.isfile(contaminants_file)
+                                fs_index.file_exists(contaminants_file)
                             )
 
                             physeq_by_genus_file = os.path.join(
@@ -2081,10 +2095,10 @@ class SequencingUpload:
                                     "SSU_dada2_ASV_VTX_tophit_pident97_qcov98.tsv",
                                 )
                                 region_result["files_exist"]["vtx_table"] = (
-                                    os.path.isfile(vtx_table_file)
+                                    fs_index.file_exists(vtx_table_file)
                                 )
                             region_result["files_exist"]["physeq_by_genus"] = (
-                                os.path.isfile(physeq_by_genus_file)
+                                fs_index.file_exists(physeq_by_genus_file)
                             )
 
                             # Check if we need to verify files in the bucket
@@ -2092,19 +2106,33 @@ class SequencingUpload:
                                 f"lotus2_report/"
                                 f"{analysis_type.name}/r_scripts_output"
                             )
-                            # Check if LotuS_progout.log exists in the bucket
-                            decontam_exists = check_file_exists_in_bucket(
-                                local_file_path=physeq_decontam_file,
-                                destination_upload_directory=bucket_directory,
-                                destination_blob_name="physeq_decontam.Rdata",
-                                bucket_name=bucket,
-                            )
-                            region_result["bucket_log_exists"] = (
-                                decontam_exists
+                            # Checked in the bucket for all regions at once
+                            bucket_checks.append(
+                                (
+                                    region_result,
+                                    f"{bucket_directory}/"
+                                    "physeq_decontam.Rdata",
+                                )
                             )
 
                     # Append the region result to the results list
                     results.append(region_result)
+
+            for region_result, blob_path in bucket_checks:
+                region_result["bucket_blob_path"] = blob_path
+            if not check_bucket:
+                for region_result, _ in bucket_checks:
+                    region_result["bucket_log_exists"] = None
+                return results
+
+            # One bucket listing answers for every analysis type
+            blobs_exist = check_files_exist_in_bucket(
+                [blob_path for _, blob_path in bucket_checks],
+                bucket_name=bucket,
+                match_glob="lotus2_report/*/r_scripts_output/physeq_decontam.Rdata",
+            )
+            for region_result, blob_path in bucket_checks:
+                region_result["bucket_log_exists"] = blobs_exist[blob_path]
             return results
 
     @classmethod
@@ -2147,6 +2175,15 @@ class SequencingUpload:
                 )
                 return True  # No files to download, consider it successful
 
+            # Look up all the files in the bucket at once
+            files_in_bucket = check_files_exist_in_bucket(
+                [
+                    os.path.join(region, file.new_name)
+                    for file, sample_id, region in uploaded_files
+                ],
+                bucket_name=bucket_name,
+            )
+
             all_tasks_initiated_successfully = True
             for file, sample_id, region in uploaded_files:
                 local_file_path = (
@@ -2161,12 +2198,7 @@ class SequencingUpload:
                 )
 
                 # Check if file exists in bucket AND does NOT exist locally
-                file_exists_in_bucket = check_file_exists_in_bucket(
-                    local_file_path=local_file_path,
-                    destination_upload_directory=destination_upload_directory,
-                    destination_blob_name=destination_blob_name,
-                    bucket_name=bucket_name,
-                )
+                file_exists_in_bucket = files_in_bucket[blob_path]
                 file_exists_locally = os.path.exists(local_file_path)
 
                 if file_exists_in_bucket and not file_exists_locally:
@@ -2194,170 +2226,322 @@ class SequencingUpload:
             return all_tasks_initiated_successfully
 
     @classmethod
-    def adapters_count(cls, id):
+    def adapters_count(cls, id, sample_reads=None, workers=None):
+        return cls.adapters_count_many(
+            [id], sample_reads=sample_reads, workers=workers
+        ).get(id)
+
+    @classmethod
+    def adapters_count_many(cls, upload_ids, sample_reads=None, workers=None):
+        """
+        Counts primers for all sequencer IDs of the given uploads that
+        do not have their counts yet. The counts run several at a time,
+        as many as the host has cores for (see adapter_count_workers).
+        With sample_reads, every sequencer ID is estimated from its first
+        sample_reads read pairs and nothing is stored. Progress and
+        timings of each upload are written to its uploads folder, see
+        get_adapters_count_progress. Returns that progress by upload id.
+        """
         from models.sequencing_sequencer_ids import SequencingSequencerId
 
-        sequencer_ids = cls.get_sequencer_ids(id)
+        jobs = []
+        progress = {}
+        for upload_id in upload_ids:
+            process_data = cls.get(upload_id)
+            if not process_data:
+                continue
+            primers_dictionary = build_region_primer_dict(process_data)
+
+            upload_jobs = [
+                (
+                    upload_id,
+                    process_data["uploads_folder"],
+                    sequencer_id,
+                    primers_dictionary.get(sequencer_id["Region"], {}),
+                )
+                for sequencer_id in cls.get_sequencer_ids(upload_id)
+                if sample_reads
+                or any(
+                    sequencer_id[field] is None
+                    for field in ADAPTER_COUNT_FIELDS
+                )
+            ]
+            jobs += upload_jobs
+            progress[upload_id] = {
+                "uploads_folder": process_data["uploads_folder"],
+                "sample_reads": sample_reads,
+                "total": len(upload_jobs),
+                "done": 0,
+                "statuses": {},
+                "started_at": datetime.datetime.now().isoformat(),
+                "finished_at": None,
+                "seconds": 0,
+                "sequencer_ids": {},
+            }
+            cls._save_adapters_count_progress(progress[upload_id])
+
+        progress_lock = threading.Lock()
+
+        def count(job):
+            upload_id, uploads_folder, sequencer_id, primers = job
+            started = time.monotonic()
+            try:
+                result = SequencingSequencerId.adapters_count(
+                    sequencer_id,
+                    process_folder=uploads_folder,
+                    forward_primer=primers.get("Forward Primer"),
+                    reverse_primer=primers.get("Reverse Primer"),
+                    reverse_primer_revcomp=primers.get(
+                        "Reverse Primer Revcomp"
+                    ),
+                    sample_reads=sample_reads,
+                )
+            except Exception as e:
+                logger.error(
+                    f"Adapter count failed for sequencer ID "
+                    f"{sequencer_id['id']}: {e}"
+                )
+                result = {"status": "failed", "counts": {}}
+            seconds = round(time.monotonic() - started, 1)
+
+            with progress_lock:
+                upload_progress = progress[upload_id]
+                upload_progress["done"] += 1
+                upload_progress["statuses"][result["status"]] = (
+                    upload_progress["statuses"].get(result["status"], 0) + 1
+                )
+                upload_progress["seconds"] += seconds
+                upload_progress["sequencer_ids"][sequencer_id["id"]] = {
+                    "SequencerID": sequencer_id["SequencerID"],
+                    "status": result["status"],
+                    "counts": result["counts"],
+                    "seconds": seconds,
+                }
+                if upload_progress["done"] == upload_progress["total"]:
+                    upload_progress["finished_at"] = (
+                        datetime.datetime.now().isoformat()
+                    )
+                    logger.info(
+                        f"Adapters of upload {upload_id} counted: "
+                        f"{upload_progress['statuses']}, "
+                        f"{upload_progress['seconds']}s of work"
+                    )
+                cls._save_adapters_count_progress(upload_progress)
+
+        with ThreadPoolExecutor(
+            max_workers=workers or adapter_count_workers()
+        ) as pool:
+            # list() so that errors in count() are raised here
+            list(pool.map(count, jobs))
+
+        for upload_progress in progress.values():
+            if upload_progress["finished_at"] is None:
+                upload_progress["finished_at"] = (
+                    datetime.datetime.now().isoformat()
+                )
+                cls._save_adapters_count_progress(upload_progress)
+
+        return progress
+
+    @staticmethod
+    def _adapters_count_progress_path(uploads_folder):
+        return os.path.join(
+            "seq_processed", uploads_folder, ADAPTER_COUNT_PROGRESS_FILE
+        )
+
+    @classmethod
+    def _save_adapters_count_progress(cls, upload_progress):
+        if not upload_progress["uploads_folder"]:
+            return
+        path = cls._adapters_count_progress_path(
+            upload_progress["uploads_folder"]
+        )
+        temp_path = f"{path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, "w") as f:
+                json.dump(upload_progress, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.error(f"Could not save adapter count progress: {e}")
+
+    @classmethod
+    def get_adapters_count_progress(cls, id):
+        """Progress of the last adapter count of an upload, or None."""
         process_data = cls.get(id)
-        # logger.info(process_data)
-
-        primers_dictionary = build_region_primer_dict(process_data)
-        for sequencer_id in sequencer_ids:
-            region = sequencer_id["Region"]
-            # pass the sequencer_id, the region,
-            # the forward and reverse primers
-            SequencingSequencerId.adapters_count(
-                sequencer_id,
-                process_folder=process_data["uploads_folder"],
-                forward_primer=primers_dictionary[region]["Forward Primer"],
-                reverse_primer=primers_dictionary[region]["Reverse Primer"],
-                reverse_primer_revcomp=primers_dictionary[region][
-                    "Reverse Primer Revcomp"
-                ],
-            )
+        if not process_data or not process_data["uploads_folder"]:
+            return None
+        try:
+            with open(
+                cls._adapters_count_progress_path(
+                    process_data["uploads_folder"]
+                )
+            ) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
 
     @classmethod
     def process_otu_data(
-        cls, csv_file_path, sequencing_upload_id, analysis_id
+        cls,
+        csv_file_path,
+        sequencing_upload_id,
+        analysis_id,
+        chunk_size=OTU_IMPORT_CHUNK_SIZE,
     ):
-        # Step 1: Read CSV into a Pandas DataFrame
-        df = pd.read_csv(csv_file_path)
-        # Step 2: Get all existing samples upfront
-        samples = cls.get_samples(
-            sequencing_upload_id
-        )  # Fetch all samples once
-        samples_dict = {
-            sample["SampleID"]: sample["id"] for sample in samples
-        }  # Map SampleID -> id
-        # logger.info(samples_dict)
-
-        # Part A: Create taxonomies and return their IDs
-        taxonomies = cls.create_taxonomies_from_csv(
-            df, sequencing_upload_id, samples_dict
-        )
+        """
+        Imports the OTU table written by the R scripts. The CSV is read in
+        chunks of chunk_size rows so memory stays flat whatever the size of
+        the analysis. Each chunk is mapped to sample and taxonomy IDs with
+        vectorised pandas operations and written with one multi-row
+        INSERT, then committed. If the import fails part way, the OTUs
+        it already stored are deleted again before the error is raised,
+        so an analysis never keeps a partial OTU table.
+        """
+        if analysis_id is None:
+            logger.info("No analysis id given, not importing OTU data.")
+            return
 
-        # Part B: Bulk create OTUs using the taxonomy_ids
+        # Map SampleID -> id once for the whole file
         with session_scope() as session:
-            otus = []
-            counter = 0
+            samples_dict = dict(
+                session.query(
+                    SequencingSamplesTable.SampleID, SequencingSamplesTable.id
+                )
+                .filter(
+                    SequencingSamplesTable.sequencingUploadId
+                    == sequencing_upload_id
+                )
+                .all()
+            )
 
-            for sample_id, taxonomy_id, abundance, ecm_flag in taxonomies:
-                # Ensure that all required values are present and not None
-                if (
-                    sample_id is not None
-                    and pd.notna(taxonomy_id)
-                    and abundance is not None
-                    and analysis_id is not None
-                ):
-                    counter += 1
-                    otu = OTU(
-                        sample_id=sample_id,
-                        taxonomy_id=taxonomy_id,
-                        abundance=abundance,
-                        sequencing_analysis_id=analysis_id,
-                        ecm_flag=ecm_flag,
-                    )
-                    otus.append(otu)
+            # OTUs stored by this import all get a higher id
+            last_otu_id = session.query(func.max(OTU.id)).scalar() or 0
 
-            # Bulk insert OTUs into the database
-            if otus:
-                session.add_all(otus)
-                session.commit()
+        # Taxonomy tuples already resolved in earlier chunks
+        taxonomy_id_map = {}
+        rows_read = 0
+        counter = 0
+
+        try:
+            reader = pd.read_csv(
+                csv_file_path,
+                chunksize=chunk_size,
+                usecols=lambda column: column in OTU_IMPORT_COLUMNS,
+            )
+            for chunk in reader:
+                rows_read += len(chunk)
+                otus = cls.create_taxonomies_from_csv(
+                    chunk, samples_dict, taxonomy_id_map
+                )
+                if otus.empty:
+                    continue
+
+                otus["sequencing_analysis_id"] = analysis_id
+                with session_scope() as session:
+                    session.execute(
+                        OTU.__table__.insert(), otus.to_dict("records")
+                    )
+                counter += len(otus)
+                logger.info(
+                    f"OTU import for analysis {analysis_id}: "
+                    f"{rows_read} rows read, {counter} OTUs stored"
+                )
+        except Exception as e:
+            logger.error(
+                f"OTU import for analysis {analysis_id} failed, deleting "
+                f"the {counter} OTUs already stored: {e}"
+            )
+            if counter:
+                with session_scope() as session:
+                    session.query(OTU).filter(
+                        OTU.sequencing_analysis_id == analysis_id,
+                        OTU.id > last_otu_id,
+                    ).delete(synchronize_session=False)
+            raise
 
         logger.info(f"Nr of OTUs we found: {counter}")
         logger.info("OTU data processed and stored successfully.")
 
     @classmethod
-    def create_taxonomies_from_csv(
-        cls, df, sequencing_upload_id, samples_dict
-    ):
-        df = df.copy()
-        # Drop rows where Domain is missing (optional,
-        #  prevents unnecessary processing)
+    def create_taxonomies_from_csv(cls, df, samples_dict, taxonomy_id_map):
+        """
+        Maps one chunk of the OTU table to rows ready for inserting into
+        the otu table (sample_id, taxonomy_id, abundance, ecm_flag).
+        Taxonomies that are not in taxonomy_id_map yet are resolved in
+        one batch and added to it, so each lineage is looked up once per
+        import.
+        """
+        # Drop rows where Domain is missing (prevents unnecessary processing)
         df = df[df["Domain"].notna() & (df["Domain"] != "")]
+        if df.empty:
+            return pd.DataFrame()
+
+        # Missing ranks are passed on as None, never as NaN
+        lineages = df[TAXONOMY_RANKS].astype(object)
+        lineages = lineages.where(lineages.notna(), None)
+
+        unique_taxonomies = lineages.drop_duplicates()
+        new_taxonomies = [
+            taxonomy
+            for taxonomy in unique_taxonomies.itertuples(
+                index=False, name=None
+            )
+            if taxonomy not in taxonomy_id_map
+        ]
+        if new_taxonomies:
+            logger.info(f"Found {len(new_taxonomies)} new taxonomies.")
+            taxonomy_id_map.update(
+                TaxonomyManager.resolve_many(new_taxonomies)
+            )
 
-        # Extract unique taxonomies
-        unique_taxonomies = df[
-            [
-                "Domain",
-                "Phylum",
-                "Class",
-                "Order",
-                "Family",
-                "Genus",
-                "Species",
+        # Map every row to its taxonomy_id with a join on the unique lineages
+        unique_taxonomies = unique_taxonomies.assign(
+            taxonomy_id=[
+                taxonomy_id_map[taxonomy]
+                for taxonomy in unique_taxonomies.itertuples(
+                    index=False, name=None
+                )
             ]
-        ].drop_duplicates()
+        )
+        taxonomy_ids = lineages.merge(
+            unique_taxonomies, on=TAXONOMY_RANKS, how="left"
+        )["taxonomy_id"].to_numpy()
+
+        # Map SampleID to id, trying without the "S_" prefix if needed
+        sample_names = df["sample_id"].astype(str)
+        sample_ids = sample_names.map(samples_dict)
+        without_prefix = sample_names.str.startswith("S_") & sample_ids.isna()
+        sample_ids[without_prefix] = (
+            sample_names[without_prefix].str[2:].map(samples_dict)
+        )
 
-        logger.info(f"Found {len(unique_taxonomies)} unique taxonomies.")
+        if "ecm_flag" in df.columns:
+            ecm_flags = df["ecm_flag"].fillna(0).astype(bool)
+        else:
+            ecm_flags = pd.Series(False, index=df.index)
 
-        taxonomy_id_map = {}  # Maps taxonomy tuples to their database IDs
+        otus = pd.DataFrame(
+            {
+                "sample_id": sample_ids.to_numpy(),
+                "taxonomy_id": taxonomy_ids,
+                "abundance": df["abundance"].to_numpy(),
+                "ecm_flag": ecm_flags.to_numpy(),
+            }
+        ).dropna(subset=["sample_id", "taxonomy_id", "abundance"])
 
-        # Start a session for database interaction
-        with session_scope() as session:
-            for _, row in unique_taxonomies.iterrows():
-                # Create the taxonomy and store its ID in the map
-                taxonomy_id = TaxonomyManager.create(
-                    domain_name=row["Domain"],
-                    phylum_name=row["Phylum"],
-                    class_name=row["Class"],
-                    order_name=row["Order"],
-                    family_name=row["Family"],
-                    genus_name=row["Genus"],
-                    species_name=row["Species"],
-                    session=session,
-                )
-                taxonomy_tuple = tuple(
-                    row
-                )  # Convert row to a tuple for unique identification
-                taxonomy_id_map[taxonomy_tuple] = taxonomy_id  # Store in map
-
-        # Map sample IDs to taxonomy IDs
-        df["taxonomy_tuple"] = df[
-            [
-                "Domain",
-                "Phylum",
-                "Class",
-                "Order",
-                "Family",
-                "Genus",
-                "Species",
-            ]
-        ].apply(
-            tuple, axis=1
-        )  # Convert taxonomy columns into a tuple
-
-        df["taxonomy_id"] = df["taxonomy_tuple"].map(
-            taxonomy_id_map
-        )  # Map to taxonomy_id
-
-        # Create a list of tuples with (sample_id, taxonomy_id, abundance)
-        # Use samples_dict to map SampleID to id and ensure we pass
-        # the abundance as well
-        taxonomies = []
-        for _, row in df.iterrows():
-            sample = str(row["sample_id"])
-            sample_id = samples_dict.get(
-                sample
-            )  # Get the sample ID from the dict
-
-            if not sample_id and sample.startswith(
-                "S_"
-            ):  # Only try without "S_" if the sample starts with it
-                sample_without_prefix = sample[2:]  # Remove the "S_" prefix
-                sample_id = samples_dict.get(sample_without_prefix)
-
-            if (
-                sample_id
-            ):  # Only proceed if the sample exists in the dictionary
-                ecm_flag = row["ecm_flag"] if "ecm_flag" in df.columns else 0
-                taxonomies.append(
-                    (sample_id, row["taxonomy_id"], row["abundance"], ecm_flag)
-                )
-
-        logger.info(f"Mapped taxonomies to sample IDs: {len(taxonomies)}")
-
-        return taxonomies
+        # Plain python ints so the database driver does not see numpy types
+        otus = otus.astype(
+            {
+                "sample_id": "int64",
+                "taxonomy_id": "int64",
+                "abundance": "int64",
+            }
+        ).astype(object)
+
+        logger.info(f"Mapped taxonomies to sample IDs: {len(otus)}")
+
+        return otus
 
     @classmethod
     def create_symlinks(cls, sequencingUploadId):
@@ -2378,7 +2562,7 @@ class SequencingUpload:
         report_source = os.path.join(r_output_folder, "report.pdf")
         report_target = os.path.join("..", r_output_folder, "report.pdf")
         report_symlink = os.path.join(share_folder, "report.pdf")
-        if os.path.exists(
+        if fs_index.path_exists(
             os.path.join(base_path, report_source)
         ) and not os.path.islink(report_symlink):
             os.symlink(report_target, report_symlink)
@@ -2408,9 +2592,9 @@ class SequencingUpload:
                     symlink_path = os.path.join(raw_folder, file["new_name"])
                     source_file = os.path.join(base_path, file["new_name"])
 
-                    if os.path.exists(source_file) and not os.path.islink(
-                        symlink_path
-                    ):
+                    if fs_index.path_exists(
+                        source_file
+                    ) and not os.path.islink(symlink_path):
                         os.symlink(target_path, symlink_path)
 
             # Determine the correct folder name for SSU
@@ -2611,7 +2795,7 @@ class SequencingUpload:
                 symlink_path = os.path.join(results_folder, file_name)
                 full_source_path = paths["source"]
 
-                if os.path.exists(full_source_path):
+                if fs_index.path_exists(full_source_path):
                     # If the symlink exists but is broken, remove it
                     if os.path.islink(symlink_path) and not os.path.exists(
                         symlink_path
@@ -2653,11 +2837,12 @@ class SequencingUpload:
                 .all()
             )
 
-            for row in results:
-                logger.info(
-                    "Doing counting of adapters for " + str(row.upload_id)
-                )
-                cls.adapters_count(row.upload_id)
+            upload_ids = [row.upload_id for row in results]
+
+        logger.info(f"Doing counting of adapters for {upload_ids}")
+        # All sequencer IDs share one pool, so that small uploads
+        # do not leave cores idle
+        cls.adapters_count_many(upload_ids)
 
     @classmethod
     def get_excluded_ssu_files(cls, sequencingUploadId):
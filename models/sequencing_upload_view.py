@@ -0,0 +1,140 @@
+import os
+import logging
+from flask import g, has_request_context
+from helpers.dbm import session_scope
+from helpers.fastqc import check_multiqc_report
+from models.sequencing_upload import SequencingUpload
+from models.reports_bucket_status import ReportsBucketStatus
+
+# Get the logger instance from app.py
+logger = logging.getLogger("my_app_logger")  # Use the same name as in app.py
+
+
+class SequencingUploadView:
+    """
+    Everything the metadata form shows about an upload, loaded once.
+
+    The upload is read once and its samples, sequencer IDs and files
+    with the three queries of get_samples_with_sequencers_and_files,
+    and the sequencer IDs, the sample validation and the missing
+    sequencer IDs are worked out from those instead of being queried
+    again. The reports are checked locally only, whether they are in
+    the bucket is the state last recorded by ReportsBucketStatus.
+    """
+
+    def __init__(self, process_id, process_data):
+        self.process_id = process_id
+        self.process_data = process_data
+        self.samples_data = []
+        self.samples_data_complete = []
+        self.sequencer_ids = []
+        self.valid_samples = False
+        self.missing_sequencing_ids = []
+        self.multiqc_report_exists = []
+        self.mapping_files_exist = []
+        self.lotus2_report = []
+        self.rscripts_report = []
+        self.pdf_report = False
+
+    @classmethod
+    def get(cls, process_id):
+        """
+        The view of an upload, or None when there is no such upload.
+        Within a request it is loaded once and shared by all callers.
+        """
+        if not has_request_context():
+            return cls.load(process_id)
+
+        views = g.setdefault("sequencing_upload_views", {})
+        key = str(process_id)
+        if key not in views:
+            views[key] = cls.load(process_id)
+        return views[key]
+
+    @classmethod
+    def load(cls, process_id):
+        process_data = SequencingUpload.get(process_id)
+        if process_data is None:
+            return None
+
+        view = cls(process_id, process_data)
+
+        # The queries below share one session
+        with session_scope():
+            view.samples_data = SequencingUpload.get_samples(process_id)
+            view.samples_data_complete = (
+                SequencingUpload.get_samples_with_sequencers_and_files(
+                    process_id
+                )
+            )
+            view._derive_sequencer_ids()
+
+            view.lotus2_report = SequencingUpload.check_lotus2_reports_exist(
+                process_id, process_data=process_data, check_bucket=False
+            )
+            view.rscripts_report = (
+                SequencingUpload.check_rscripts_reports_exist(
+                    process_id, process_data=process_data, check_bucket=False
+                )
+            )
+        ReportsBucketStatus.apply(
+            process_id, view.lotus2_report, view.rscripts_report
+        )
+
+        view.multiqc_report_exists = check_multiqc_report(
+            process_id, process_data=process_data
+        )
+        view.mapping_files_exist = SequencingUpload.check_mapping_files_exist(
+            process_id, process_data=process_data
+        )
+        view.pdf_report = os.path.isfile(
+            os.path.join(
+                "seq_processed",
+                process_data["uploads_folder"],
+                "r_output",
+                "report.pdf",
+            )
+        )
+        return view
+
+    def _derive_sequencer_ids(self):
+        """
+        What get_sequencer_ids, validate_samples and
+        check_missing_sequencer_ids return, from the loaded samples.
+        """
+        regions = {
+            self.process_data["region_1"],
+            self.process_data["region_2"],
+        }
+        expected_regions_number = self.process_data[
+            "Sequencing_regions_number"
+        ]
+
+        sequencer_ids = []
+        valid_samples = True
+        missing_sequencing_ids = []
+        for sample in self.samples_data_complete:
+            sample_sequencer_ids = sample.get("sequencer_ids", [])
+            sequencer_ids.extend(
+                {
+                    key: value
+                    for key, value in sequencer.items()
+                    if key != "uploaded_files"
+                }
+                for sequencer in sample_sequencer_ids
+            )
+
+            sample_regions = {
+                sequencer["Region"]
+                for sequencer in sample_sequencer_ids
+                if sequencer["Region"]
+            }
+            if not sample_regions.issubset(regions):
+                valid_samples = False  # Incorrect regions
+
+            if len(sample_sequencer_ids) < expected_regions_number:
+                missing_sequencing_ids.append(sample["id"])
+
+        self.sequencer_ids = sorted(sequencer_ids, key=lambda s: s["id"])
+        self.valid_samples = valid_samples
+        self.missing_sequencing_ids = missing_sequencing_ids
@@ -1,5 +1,10 @@
+import time
+import uuid
 import logging
+import threading
+from sqlalchemy import event, text
 from helpers.dbm import session_scope
+from models.app_configuration import AppConfiguration
 from models.db_model import (
     Domain,
     Phylum,
@@ -9,6 +14,7 @@ from models.db_model import (
     Genus,
     Species,
     Taxonomy,
+    TaxonomyLineage,
     SequencingAnalysisTable,
     SequencingAnalysisTypesTable,
     OTU,
@@ -17,6 +23,259 @@ from models.db_model import (
 # Get the logger instance from app.py
 logger = logging.getLogger("my_app_logger")
 
+# Lookup tables from Domain down to Species, and the column of each
+# that points to the rank above it
+RANK_MODELS = [Domain, Phylum, Class, Order, Family, Genus, Species]
+PARENT_COLUMNS = [
+    None,
+    "domain_id",
+    "phylum_id",
+    "class_id",
+    "order_id",
+    "family_id",
+    "genus_id",
+]
+TAXONOMY_ID_COLUMNS = [
+    "domain_id",
+    "phylum_id",
+    "class_id",
+    "order_id",
+    "family_id",
+    "genus_id",
+    "species_id",
+]
+
+# Classes of arbuscular mycorrhizal fungi, flagged in taxonomy_lineage
+AMF_CLASSES = ["Glomeromycetes", "Archaeosporomycetes", "Paraglomeromycetes"]
+
+# Fills taxonomy_lineage for the taxonomies that are not in it yet
+LINEAGE_INSERT_SQL = f"""
+INSERT INTO taxonomy_lineage (
+    taxonomy_id,
+    domain_name,
+    phylum_name,
+    class_name,
+    order_name,
+    family_name,
+    genus_name,
+    species_name,
+    amf_flag
+)
+SELECT
+    t.id,
+    taxonomy_domain.name,
+    taxonomy_phylum.name,
+    taxonomy_class.name,
+    taxonomy_order.name,
+    taxonomy_family.name,
+    taxonomy_genus.name,
+    taxonomy_species.name,
+    CASE
+        WHEN taxonomy_class.name IN ({", ".join(f"'{name}'" for name in AMF_CLASSES)})
+        THEN 1 ELSE 0
+    END
+FROM taxonomy AS t
+    LEFT JOIN taxonomy_domain
+        ON t.domain_id = taxonomy_domain.id
+    LEFT JOIN taxonomy_phylum
+        ON t.phylum_id = taxonomy_phylum.id
+    LEFT JOIN taxonomy_class
+        ON t.class_id = taxonomy_class.id
+    LEFT JOIN taxonomy_order
+        ON t.order_id = taxonomy_order.id
+    LEFT JOIN taxonomy_family
+        ON t.family_id = taxonomy_family.id
+    LEFT JOIN taxonomy_genus
+        ON t.genus_id = taxonomy_genus.id
+    LEFT JOIN taxonomy_species
+        ON t.species_id = taxonomy_species.id
+WHERE t.id > :after_id
+    AND NOT EXISTS (
+        SELECT 1 FROM taxonomy_lineage AS l WHERE l.taxonomy_id = t.id
+    )
+"""
+
+# Columns the taxonomy search can be ordered by. Each is the first
+# column of an otu index that ends in id, so that a page of the keyset
+# pagination is read in index order instead of sorting every match.
+SEARCH_SORT_COLUMNS = {
+    "id": "o.id",
+    "abundance": "o.abundance",
+    "sample": "o.sample_id",
+}
+
+# The tables of a search, counted over the same joins as it is paged
+SEARCH_FROM = """
+    FROM otu AS o
+        INNER JOIN sequencing_samples AS ss
+            ON o.sample_id = ss.id
+        INNER JOIN taxonomy_lineage AS l
+            ON o.taxonomy_id = l.taxonomy_id
+        INNER JOIN sequencing_uploads AS su
+            ON ss.sequencingUploadId = su.id
+        INNER JOIN sequencing_analysis AS sa
+            ON o.sequencing_analysis_id = sa.id
+        INNER JOIN sequencing_analysis_types AS sat
+            ON sa.sequencingAnalysisTypeId = sat.id
+"""
+
+
+def parse_search_cursor(after):
+    """
+    Returns (sort_value, otu_id) of a search cursor as made by search,
+    "<sort_value>:<otu_id>". Raises ValueError if it is not one.
+    """
+    parts = str(after).split(":")
+    if len(parts) != 2:
+        raise ValueError(f"Invalid search cursor: {after}")
+    return int(parts[0]), int(parts[1])
+
+
+# Each process keeps the lookup names and taxonomy lineages it has seen.
+# Names are keyed in lower case, as the tables use a case insensitive
+# collation. Imports only ever add rows, and a miss is always checked
+# against the database before inserting, so rows added by other workers
+# are picked up on demand. Anything that edits or deletes taxonomy rows
+# must call TaxonomyManager.invalidate_cache(), which stores a new
+# version in app_configuration so that every worker reloads its cache.
+TAXONOMY_CACHE_VERSION_LABEL = "taxonomy_cache_version"
+TAXONOMY_CACHE_CHECK_INTERVAL = 60
+
+_taxonomy_cache = {}
+_taxonomy_cache_lock = threading.RLock()
+
+
+def _reset_taxonomy_cache(version=None, checked_at=0):
+    _taxonomy_cache.clear()
+    _taxonomy_cache.update(
+        version=version,
+        checked_at=checked_at,
+        loaded=False,
+        names={model: {} for model in RANK_MODELS},
+        lineages={},
+        max_taxonomy_id=0,
+    )
+
+
+_reset_taxonomy_cache()
+
+
+def _check_taxonomy_cache_version():
+    now = time.time()
+    if now - _taxonomy_cache["checked_at"] < TAXONOMY_CACHE_CHECK_INTERVAL:
+        return
+
+    version = AppConfiguration.get_value(TAXONOMY_CACHE_VERSION_LABEL)
+    if version != _taxonomy_cache["version"]:
+        if _taxonomy_cache["loaded"]:
+            logger.info("Taxonomy cache version changed, reloading it.")
+        _reset_taxonomy_cache(version)
+    _taxonomy_cache["checked_at"] = now
+
+
+def _load_rank_names(session, model, names=None):
+    """Caches the ids of the given names, or of all names if None."""
+    query = session.query(model.id, model.name)
+    if names is not None:
+        query = query.filter(model.name.in_(names))
+    cached_names = _taxonomy_cache["names"][model]
+    for row_id, name in query.order_by(model.id):
+        cached_names.setdefault(name.lower(), row_id)
+
+
+def _load_new_taxonomies(session):
+    """Caches the taxonomies added since the last time we looked."""
+    rows = (
+        session.query(
+            Taxonomy.id,
+            *[getattr(Taxonomy, column) for column in TAXONOMY_ID_COLUMNS],
+        )
+        .filter(Taxonomy.id > _taxonomy_cache["max_taxonomy_id"])
+        .order_by(Taxonomy.id)
+    )
+    lineages = _taxonomy_cache["lineages"]
+    for row in rows:
+        lineages.setdefault(tuple(row[1:]), row[0])
+        _taxonomy_cache["max_taxonomy_id"] = row[0]
+
+
+def _warm_taxonomy_cache(session):
+    for model in RANK_MODELS:
+        _load_rank_names(session, model)
+    _load_new_taxonomies(session)
+    _taxonomy_cache["loaded"] = True
+    logger.info(
+        f"Taxonomy cache loaded with {len(_taxonomy_cache['lineages'])} "
+        "taxonomies."
+    )
+
+
+def _normalise_lineage(lineage):
+    """
+    Applies the rules of TaxonomyManager.create to a tuple of rank names:
+    everything below the first "?" is dropped, and "?" or empty names
+    become None, as get_or_create never looks up or creates a "?" entry.
+    Returns None if the lineage has no domain.
+    """
+    names = list(lineage)
+    if not names[0] or names[0] == "?":
+        return None
+
+    for level in range(1, len(names) - 1):
+        if names[level] == "?":
+            names[level + 1 :] = [None] * (len(names) - level - 1)
+            break
+
+    return tuple(None if not name or name == "?" else name for name in names)
+
+
+def _resolve_rank(session, level, lineages):
+    """Makes sure every name of this rank used by lineages is cached."""
+    model = RANK_MODELS[level]
+    cached_names = _taxonomy_cache["names"][model]
+
+    # name key -> first lineage using it, which decides the parent
+    missing = {}
+    for lineage in lineages:
+        name = lineage[level]
+        if name and name.lower() not in cached_names:
+            missing.setdefault(name.lower(), lineage)
+    if not missing:
+        return
+
+    # Another worker may have created them since the cache was loaded
+    _load_rank_names(
+        session, model, [lineage[level] for lineage in missing.values()]
+    )
+
+    new_rows = []
+    for key, lineage in missing.items():
+        if key in cached_names:
+            continue
+        row = {"name": lineage[level]}
+        if level > 0:
+            parent_name = lineage[level - 1]
+            row[PARENT_COLUMNS[level]] = (
+                _taxonomy_cache["names"][RANK_MODELS[level - 1]].get(
+                    parent_name.lower()
+                )
+                if parent_name
+                else None
+            )
+        new_rows.append(row)
+
+    if new_rows:
+        session.execute(model.__table__.insert(), new_rows)
+        _load_rank_names(session, model, [row["name"] for row in new_rows])
+        logger.info(f"Created {len(new_rows)} new {model.__name__} entries.")
+
+
+def _lineage_ids(lineage):
+    return tuple(
+        (_taxonomy_cache["names"][model].get(name.lower()) if name else None)
+        for model, name in zip(RANK_MODELS, lineage)
+    )
+
 
 class TaxonomyManager:
     @classmethod
@@ -53,137 +312,126 @@ class TaxonomyManager:
         species_name,
         session,
     ):
+        """
+        Returns the id of the taxonomy with the given rank names,
+        creating it (and any missing lookup entries) if needed.
+        """
+        lineage = (
+            domain_name,
+            phylum_name,
+            class_name,
+            order_name,
+            family_name,
+            genus_name,
+            species_name,
+        )
+        return cls.resolve_many([lineage], session=session)[lineage]
 
-        if domain_name and domain_name != "" and domain_name != "?":
-            # Handle "?" by setting subsequent levels to None
-            if phylum_name == "?":
-                class_name = order_name = family_name = genus_name = (
-                    species_name
-                ) = None
-            elif class_name == "?":
-                order_name = family_name = genus_name = species_name = None
-            elif order_name == "?":
-                family_name = genus_name = species_name = None
-            elif family_name == "?":
-                genus_name = species_name = None
-            elif genus_name == "?":
-                species_name = None
-
-            # Retrieve or create each of the lookup
-            # entries, passing the session
-            domain_id = (
-                TaxonomyManager.get_or_create(
-                    Domain, domain_name, session=session
-                )
-                if domain_name
-                else None
-            )
-            phylum_id = (
-                TaxonomyManager.get_or_create(
-                    Phylum, phylum_name, domain_id=domain_id, session=session
-                )
-                if phylum_name
-                else None
-            )
-            class_id = (
-                TaxonomyManager.get_or_create(
-                    Class, class_name, phylum_id=phylum_id, session=session
-                )
-                if class_name
-                else None
-            )
-            order_id = (
-                TaxonomyManager.get_or_create(
-                    Order, order_name, class_id=class_id, session=session
-                )
-                if order_name
-                else None
-            )
-            family_id = (
-                TaxonomyManager.get_or_create(
-                    Family, family_name, order_id=order_id, session=session
-                )
-                if family_name
-                else None
-            )
-            genus_id = (
-                TaxonomyManager.get_or_create(
-                    Genus, genus_name, family_id=family_id, session=session
-                )
-                if genus_name
-                else None
-            )
-            species_id = (
-                TaxonomyManager.get_or_create(
-                    Species, species_name, genus_id=genus_id, session=session
+    @classmethod
+    def resolve_many(cls, lineages, session=None):
+        """
+        Returns {lineage: taxonomy_id} for a batch of
+        (domain, phylum, class, order, family, genus, species) name
+        tuples. Lookup entries and taxonomies that do not exist yet are
+        inserted with one statement per table. Lineages without a domain
+        map to None.
+        """
+        if session is None:
+            with session_scope() as session:
+                return cls.resolve_many(lineages, session=session)
+
+        with _taxonomy_cache_lock:
+            try:
+                result = cls._resolve_lineages(lineages, session)
+                session.commit()
+            except Exception:
+                # The cache may hold ids of rows that were rolled back
+                _reset_taxonomy_cache()
+                raise
+        return result
+
+    @classmethod
+    def _resolve_lineages(cls, lineages, session):
+        _check_taxonomy_cache_version()
+        if not _taxonomy_cache["loaded"]:
+            _warm_taxonomy_cache(session)
+
+        normalised = {
+            lineage: _normalise_lineage(lineage) for lineage in set(lineages)
+        }
+        wanted = {names for names in normalised.values() if names}
+
+        for level in range(len(RANK_MODELS)):
+            _resolve_rank(session, level, wanted)
+
+        cached_lineages = _taxonomy_cache["lineages"]
+        lineage_ids = {names: _lineage_ids(names) for names in wanted}
+        if any(ids not in cached_lineages for ids in lineage_ids.values()):
+            # Pick up taxonomies created by other workers first
+            _load_new_taxonomies(session)
+            new_taxonomies = {
+                ids
+                for ids in lineage_ids.values()
+                if ids not in cached_lineages
+            }
+            if new_taxonomies:
+                previous_max_id = _taxonomy_cache["max_taxonomy_id"]
+                session.execute(
+                    Taxonomy.__table__.insert(),
+                    [
+                        dict(zip(TAXONOMY_ID_COLUMNS, ids))
+                        for ids in new_taxonomies
+                    ],
                 )
-                if species_name
-                else None
-            )
+                _load_new_taxonomies(session)
+                cls.add_lineages(session, after_id=previous_max_id)
+                logger.info(f"Created {len(new_taxonomies)} new taxonomies.")
 
-            # Build the query
-            filters = []
-            filters.append(
-                Taxonomy.domain_id == domain_id
-                if domain_id is not None
-                else Taxonomy.domain_id.is_(None)
-            )
-            filters.append(
-                Taxonomy.phylum_id == phylum_id
-                if phylum_id is not None
-                else Taxonomy.phylum_id.is_(None)
-            )
-            filters.append(
-                Taxonomy.class_id == class_id
-                if class_id is not None
-                else Taxonomy.class_id.is_(None)
-            )
-            filters.append(
-                Taxonomy.order_id == order_id
-                if order_id is not None
-                else Taxonomy.order_id.is_(None)
-            )
-            filters.append(
-                Taxonomy.family_id == family_id
-                if family_id is not None
-                else Taxonomy.family_id.is_(None)
-            )
-            filters.append(
-                Taxonomy.genus_id == genus_id
-                if genus_id is not None
-                else Taxonomy.genus_id.is_(None)
-            )
-            filters.append(
-                Taxonomy.species_id == species_id
-                if species_id is not None
-                else Taxonomy.species_id.is_(None)
+        return {
+            lineage: (
+                cached_lineages.get(lineage_ids[names]) if names else None
             )
+            for lineage, names in normalised.items()
+        }
 
-            # Build and execute the query
-            query = session.query(Taxonomy).filter(*filters)
+    @staticmethod
+    def add_lineages(session, after_id=0):
+        """
+        Adds the taxonomies with an id above after_id that are missing
+        from taxonomy_lineage. With the default, fills in all of them.
+        """
+        session.execute(text(LINEAGE_INSERT_SQL), {"after_id": after_id})
 
-            # Execute the query
-            existing_taxonomy = query.first()
+    @classmethod
+    def rebuild_lineages(cls):
+        """
+        Rebuilds taxonomy_lineage from scratch. Runs every night as a
+        repair job, for rank names edited without invalidate_cache and
+        taxonomies written outside the ORM and resolve_many.
+        """
+        with session_scope() as session:
+            session.query(TaxonomyLineage).delete()
+            cls.add_lineages(session)
+            count = session.query(TaxonomyLineage).count()
+        logger.info(f"Rebuilt taxonomy_lineage with {count} taxonomies.")
+        return count
 
-            if existing_taxonomy:
-                # If it exists, return the ID
-                return existing_taxonomy.id
-            else:
-                # If not, create a new taxonomy record
-                new_taxonomy = Taxonomy(
-                    domain_id=domain_id,
-                    phylum_id=phylum_id,
-                    class_id=class_id,
-                    order_id=order_id,
-                    family_id=family_id,
-                    genus_id=genus_id,
-                    species_id=species_id,
-                )
-                session.add(new_taxonomy)
-                session.commit()
-                taxonomy_id = new_taxonomy.id
-                return taxonomy_id
-            return None
+    @classmethod
+    def invalidate_cache(cls):
+        """
+        Makes every process reload its taxonomy cache, and rebuilds the
+        lineage table. Call this after editing or deleting taxonomy
+        lookup entries or taxonomies.
+        """
+        cls.rebuild_lineages()
+        version = uuid.uuid4().hex
+        AppConfiguration.update_config(
+            TAXONOMY_CACHE_VERSION_LABEL,
+            version,
+            description="Changed to reload the taxonomy cache of workers",
+        )
+        with _taxonomy_cache_lock:
+            _reset_taxonomy_cache(version, checked_at=time.time())
 
     @staticmethod
     def get_or_create(model, name, session=None, **kwargs):
@@ -199,6 +447,9 @@ class TaxonomyManager:
         if session is None:
             return None
         else:
+            cached_names = _taxonomy_cache["names"].get(model, {})
+            if name.lower() in cached_names:
+                return cached_names[name.lower()]
 
             # Try to get the record
             record = session.query(model).filter(model.name == name).first()
@@ -210,9 +461,89 @@ class TaxonomyManager:
                 session.commit()
 
             record_id = record.id
+            with _taxonomy_cache_lock:
+                cached_names.setdefault(name.lower(), record_id)
 
             return record_id
 
+    @classmethod
+    def _search_filters(
+        cls,
+        session,
+        domain=None,
+        phylum=None,
+        class_=None,
+        order=None,
+        family=None,
+        genus=None,
+        species=None,
+        project=None,
+        amf_filter=None,
+        ecm_filter=None,
+        analysis_type=None,
+    ):
+        """
+        Builds the WHERE conditions of a search on the otu table (alias
+        o). Rank names are turned into ids first, and every other table
+        is reached through a subquery.
+        """
+        filters = []
+        query_params = {}
+
+        taxonomy_filters = []
+        rank_names = [domain, phylum, class_, order, family, genus, species]
+        for model, column, name in zip(
+            RANK_MODELS, TAXONOMY_ID_COLUMNS, rank_names
+        ):
+            if not name:
+                continue
+            ids = [
+                row.id
+                for row in session.query(model.id).filter(model.name == name)
+            ]
+            if not ids:
+                # Nothing can match a name that does not exist
+                return ["1 = 0"], {}
+            taxonomy_filters.append(
+                f"t.{column} IN ({', '.join(str(int(i)) for i in ids)})"
+            )
+        if taxonomy_filters:
+            filters.append(
+                "o.taxonomy_id IN (SELECT t.id FROM taxonomy AS t WHERE "
+                + " AND ".join(taxonomy_filters)
+                + ")"
+            )
+        if amf_filter:
+            filters.append(
+                "o.taxonomy_id IN (SELECT al.taxonomy_id "
+                "FROM taxonomy_lineage AS al WHERE al.amf_flag = 1)"
+            )
+
+        if project:
+            filters.append(
+                """o.sample_id IN (
+                    SELECT ss.id
+                    FROM sequencing_samples AS ss
+                        INNER JOIN sequencing_uploads AS su
+                            ON ss.sequencingUploadId = su.id
+                    WHERE su.project_id = :project
+                )"""
+            )
+            query_params["project"] = project
+        if analysis_type:
+            filters.append(
+                """o.sequencing_analysis_id IN (
+                    SELECT sa.id
+                    FROM sequencing_analysis AS sa
+                    WHERE sa.sequencingAnalysisTypeId = :analysis_type
+                )"""
+            )
+            query_params["analysis_type"] = analysis_type
+        if ecm_filter:
+            filters.append("o.ecm_flag = 1")
+
+        return filters, query_params
+
     @classmethod
     def search(
         cls,
@@ -227,10 +558,21 @@ class TaxonomyManager:
         amf_filter=None,
         ecm_filter=None,
         analysis_type=None,
+        limit=None,
+        after=None,
+        sort="id",
+        descending=False,
     ):
         """
         Search for taxonomies based on the given parameters.
+
+        Results are ordered by one of SEARCH_SORT_COLUMNS. With a limit,
+        only that many rows are returned, starting after the cursor
+        given in after (see search_page).
         """
+        if sort not in SEARCH_SORT_COLUMNS:
+            raise ValueError(f"Unknown sort column: {sort}")
+
         with session_scope() as session:
 
             # Join SequencingSamplesTable with OTU, Taxonomy
@@ -238,92 +580,73 @@ class TaxonomyManager:
             from sqlalchemy import text
 
             # Base SQL query
-            sql_query = """
+            sql_query = f"""
             SELECT
+                o.id AS otu_id,
+                {SEARCH_SORT_COLUMNS[sort]} AS sort_value,
                 o.sample_id,
                 ss.SampleID,
                 ss.Longitude,
                 ss.Latitude,
                 su.id AS upload_id,
                 su.project_id,
-                t.id AS taxonomy_id,
-                taxonomy_domain.name AS domain_name,
-                taxonomy_phylum.name AS phylum_name,
-                taxonomy_class.name AS class_name,
-                taxonomy_order.name AS order_name,
-                taxonomy_family.name AS family_name,
-                taxonomy_genus.name AS genus_name,
-                taxonomy_species.name AS species_name,
+                l.taxonomy_id,
+                l.domain_name,
+                l.phylum_name,
+                l.class_name,
+                l.order_name,
+                l.family_name,
+                l.genus_name,
+                l.species_name,
                 o.abundance,
                 o.ecm_flag,
                 sat.name AS analysis_type
-            FROM sequencing_samples AS ss
-                INNER JOIN otu AS o
-                    ON o.sample_id = ss.id
-                INNER JOIN taxonomy AS t
-                    ON o.taxonomy_id = t.id
-                INNER JOIN sequencing_uploads AS su
-                    ON ss.sequencingUploadId = su.id
-                INNER JOIN sequencing_analysis AS sa
-                    ON o.sequencing_analysis_id = sa.id
-                INNER JOIN sequencing_analysis_types AS sat
-                    ON sa.sequencingAnalysisTypeId = sat.id
-                LEFT JOIN taxonomy_domain
-                    ON t.domain_id = taxonomy_domain.id
-                LEFT JOIN taxonomy_phylum
-                    ON t.phylum_id = taxonomy_phylum.id
-                LEFT JOIN taxonomy_class
-                    ON t.class_id = taxonomy_class.id
-                LEFT JOIN taxonomy_order
-                    ON t.order_id = taxonomy_order.id
-                LEFT JOIN taxonomy_family
-                    ON t.family_id = taxonomy_family.id
-                LEFT JOIN taxonomy_genus
-                    ON t.genus_id = taxonomy_genus.id
-                LEFT JOIN taxonomy_species
-                    ON t.species_id = taxonomy_species.id
-            """
+            {SEARCH_FROM}"""
 
             # Build dynamic WHERE conditions
-            filters = []
-            query_params = {}
-
-            if domain:
-                filters.append("taxonomy_domain.name = :domain")
-                query_params["domain"] = domain
-            if phylum:
-                filters.append("taxonomy_phylum.name = :phylum")
-                query_params["phylum"] = phylum
-            if class_:
-                filters.append("taxonomy_class.name = :class_")
-                query_params["class_"] = class_
-            if order:
-                filters.append("taxonomy_order.name = :order")
-                query_params["order"] = order
-            if family:
-                filters.append("taxonomy_family.name = :family")
-                query_params["family"] = family
-            if genus:
-                filters.append("taxonomy_genus.name = :genus")
-                query_params["genus"] = genus
-            if species:
-                filters.append("taxonomy_species.name = :species")
-                query_params["species"] = species
-            if project:
-                filters.append("su.project_id = :project")
-                query_params["project"] = project
-            if analysis_type:
-                filters.append("sat.id = :analysis_type")
-                query_params["analysis_type"] = analysis_type
-            if ecm_filter:
-                filters.append("o.ecm_flag = 1")
-            if amf_filter:
-                filters.append("t.class_id IN (25, 26, 27)")
+            filters, query_params = cls._search_filters(
+                session,
+                domain=domain,
+                phylum=phylum,
+                class_=class_,
+                order=order,
+                family=family,
+                genus=genus,
+                species=species,
+                project=project,
+                amf_filter=amf_filter,
+                ecm_filter=ecm_filter,
+                analysis_type=analysis_type,
+            )
+
+            # Keyset pagination: continue after the last row we returned
+            sort_column = SEARCH_SORT_COLUMNS[sort]
+            comparison = "<" if descending else ">"
+            if after:
+                after_value, after_id = parse_search_cursor(after)
+                if sort == "id":
+                    filters.append(f"o.id {comparison} :after_id")
+                else:
+                    filters.append(
+                        f"({sort_column} {comparison} :after_value OR "
+                        f"({sort_column} = :after_value "
+                        f"AND o.id {comparison} :after_id))"
+                    )
+                query_params["after_value"] = after_value
+                query_params["after_id"] = after_id
 
             # Apply WHERE conditions if filters exist
             if filters:
                 sql_query += " WHERE " + " AND ".join(filters)
 
+            direction = "DESC" if descending else "ASC"
+            sql_query += f" ORDER BY {sort_column} {direction}"
+            if sort != "id":
+                sql_query += f", o.id {direction}"
+            if limit:
+                sql_query += " LIMIT :limit"
+                query_params["limit"] = int(limit)
+
             # Log the final SQL query for debugging
             # logger.info(f"Executing raw SQL: {sql_query}")
 
@@ -339,6 +662,8 @@ class TaxonomyManager:
             # Format results
             formatted_results = [
                 {
+                    "otu_id": row.otu_id,
+                    "cursor": f"{int(row.sort_value)}:{row.otu_id}",
                     "sample_id": row.sample_id,
                     "SampleID": row.SampleID,
                     "Longitude": row.Longitude,
@@ -361,6 +686,41 @@ class TaxonomyManager:
 
             return formatted_results
 
+    @classmethod
+    def search_page(cls, limit, after=None, **search_args):
+        """
+        Returns one page of search() results and the cursor to pass as
+        after to get the next page (None on the last page).
+        """
+        rows = cls.search(limit=limit + 1, after=after, **search_args)
+        next_cursor = rows[limit - 1]["cursor"] if len(rows) > limit else None
+        return {"data": rows[:limit], "next_cursor": next_cursor}
+
+    @classmethod
+    def count(cls, limit=None, **search_filters):
+        """
+        Counts the OTUs matching the search filters, over the same joins
+        as search so that the total matches the rows that can be paged.
+        With a limit, stops counting once it is reached, which keeps
+        broad searches cheap.
+        """
+        from sqlalchemy import text
+
+        with session_scope() as session:
+            filters, query_params = cls._search_filters(
+                session, **search_filters
+            )
+            where = " WHERE " + " AND ".join(filters) if filters else ""
+            if limit:
+                sql_query = (
+                    "SELECT COUNT(*) FROM "
+                    f"(SELECT 1 {SEARCH_FROM}{where} LIMIT :limit) AS capped"
+                )
+                query_params["limit"] = int(limit)
+            else:
+                sql_query = f"SELECT COUNT(*) {SEARCH_FROM}{where}"
+            return session.execute(text(sql_query), query_params).scalar()
+
     @classmethod
     def get_otus(
         cls, sample_id, region, analysis_type_id, amf_filter, ecm_filter
@@ -368,15 +728,16 @@ class TaxonomyManager:
         with session_scope() as session:
             query = (
                 session.query(
-                    Taxonomy,
+                    TaxonomyLineage,
                     OTU.abundance,
                     OTU.sample_id,
                     OTU.ecm_flag,
                     SequencingAnalysisTypesTable.name.label("analysis_type"),
                 )
                 .join(
-                    Taxonomy, OTU.taxonomy_id == Taxonomy.id
-                )  # Join with Taxonomy
+                    TaxonomyLineage,
+                    OTU.taxonomy_id == TaxonomyLineage.taxonomy_id,
+                )  # Join with the rank names of the taxonomy
                 .join(
                     SequencingAnalysisTable,
                     OTU.sequencing_analysis_id == SequencingAnalysisTable.id,
@@ -406,29 +767,9 @@ class TaxonomyManager:
                 )
             if ecm_filter == 1:
                 query = query.filter(OTU.ecm_flag == 1)
-            # New filter logic for Glomeromycetes,
-            # Archaeosporomycetes, and Paraglomeromycetes
+            # Only Glomeromycetes, Archaeosporomycetes and Paraglomeromycetes
             if amf_filter == 1:
-                # Query the Class table to get the IDs of the specific classes
-                class_ids = (
-                    session.query(Class.id)
-                    .filter(
-                        Class.name.in_(
-                            [
-                                "Glomeromycetes",
-                                "Archaeosporomycetes",
-                                "Paraglomeromycetes",
-                            ]
-                        )
-                    )
-                    .all()
-                )
-
-                # Extract the IDs from the result
-                class_ids = [class_id[0] for class_id in class_ids]
-
-                # Apply the filter using the dynamically retrieved IDs
-                query = query.filter(Taxonomy.class_id.in_(class_ids))
+                query = query.filter(TaxonomyLineage.amf_flag == 1)
 
             results = query.all()
 
@@ -438,39 +779,33 @@ class TaxonomyManager:
                     "abundance": int(row.abundance),
                     "analysis_type": row.analysis_type,
                     "ecm_flag": row.ecm_flag,
-                    "domain": (
-                        row.Taxonomy.domain.name
-                        if row.Taxonomy.domain
-                        else None
-                    ),
-                    "phylum": (
-                        row.Taxonomy.phylum.name
-                        if row.Taxonomy.phylum
-                        else None
-                    ),
-                    "class": (
-                        row.Taxonomy.class_.name
-                        if row.Taxonomy.class_
-                        else None
-                    ),
-                    "order": (
-                        row.Taxonomy.order.name if row.Taxonomy.order else None
-                    ),
-                    "family": (
-                        row.Taxonomy.family.name
-                        if row.Taxonomy.family
-                        else None
-                    ),
-                    "genus": (
-                        row.Taxonomy.genus.name if row.Taxonomy.genus else None
-                    ),
-                    "species": (
-                        row.Taxonomy.species.name
-                        if row.Taxonomy.species
-                        else None
-                    ),
+                    "domain": row.TaxonomyLineage.domain_name,
+                    "phylum": row.TaxonomyLineage.phylum_name,
+                    "class": row.TaxonomyLineage.class_name,
+                    "order": row.TaxonomyLineage.order_name,
+                    "family": row.TaxonomyLineage.family_name,
+                    "genus": row.TaxonomyLineage.genus_name,
+                    "species": row.TaxonomyLineage.species_name,
                 }
                 for row in results
             ]
 
             return formatted_results
+
+
+# Search and get_otus inner join taxonomy_lineage, so a taxonomy written
+# through the ORM gets its lineage row in the same transaction.
+# resolve_many inserts with Core and adds the lineages itself.
+@event.listens_for(Taxonomy, "after_insert")
+def _add_taxonomy_lineage(mapper, connection, target):
+    connection.execute(text(LINEAGE_INSERT_SQL), {"after_id": target.id - 1})
+
+
+@event.listens_for(Taxonomy, "after_update")
+def _update_taxonomy_lineage(mapper, connection, target):
+    connection.execute(
+        TaxonomyLineage.__table__.delete().where(
+            TaxonomyLineage.taxonomy_id == target.id
+        )
+    )
+    _add_taxonomy_lineage(mapper, connection, target)
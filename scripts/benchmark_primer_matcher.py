@@ -0,0 +1,95 @@
+"""
+Compares the built-in primer matcher with cutadapt/vsearch on the first
+reads of a pair of FASTQ files, for counts and time.
+
+    python -m scripts.benchmark_primer_matcher R1.fastq.gz R2.fastq.gz \
+        ITS3/ITS4 [reads]
+
+The primer set is a key of metadataconfig/primer_set_regions.json.
+cutadapt and vsearch must be installed.
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from helpers.cutadapt import (
+    subsample_fastq,
+    detect_single_read_primers,
+    parse_detect_single_read_primers_output,
+    detect_merged_read_primers,
+    parse_detect_merged_read_primers_output,
+)
+from helpers.metadata_check import get_primer_sets_regions
+from helpers.primer_matcher import count_primer_hits, SAMPLE_READS
+
+
+def cutadapt_counts(file_1_path, file_2_path, primers, reads):
+    with tempfile.TemporaryDirectory() as sample_folder:
+        sample_1_path = os.path.join(sample_folder, "R1.fastq")
+        sample_2_path = os.path.join(sample_folder, "R2.fastq")
+        subsample_fastq(file_1_path, sample_1_path, reads)
+        subsample_fastq(file_2_path, sample_2_path, reads)
+
+        single = parse_detect_single_read_primers_output(
+            detect_single_read_primers(
+                sample_1_path,
+                sample_2_path,
+                primers["Forward Primer"],
+                primers["Reverse Primer"],
+            )
+        )
+        merged = parse_detect_merged_read_primers_output(
+            detect_merged_read_primers(
+                sample_1_path,
+                sample_2_path,
+                primers["Forward Primer"],
+                primers["Reverse Primer Revcomp"],
+            )
+        )
+    return {
+        "fwd_read_fwd_adap": single["read1_with_adapter"],
+        "rev_read_rev_adap": single["read2_with_adapter"],
+        "fwd_rev_adap": single["pairs_written"],
+        "fwd_rev_mrg_adap": merged,
+    }
+
+
+def main(file_1_path, file_2_path, primer_set, reads=SAMPLE_READS):
+    primers = get_primer_sets_regions()[primer_set]
+
+    started = time.monotonic()
+    expected = cutadapt_counts(file_1_path, file_2_path, primers, reads)
+    cutadapt_seconds = time.monotonic() - started
+
+    started = time.monotonic()
+    hits = count_primer_hits(
+        file_1_path,
+        file_2_path,
+        primers["Forward Primer"],
+        primers["Reverse Primer"],
+        primers.get("Reverse Primer Revcomp"),
+        sample_reads=reads,
+    )
+    matcher_seconds = time.monotonic() - started
+
+    print(f"{'column':<20}{'cutadapt':>10}{'matcher':>10}{'diff %':>8}")
+    for field, count in expected.items():
+        found = hits.get(field)
+        diff = (
+            f"{(found - count) * 100 / count:.2f}"
+            if count and found is not None
+            else "-"
+        )
+        print(f"{field:<20}{count!s:>10}{found!s:>10}{diff:>8}")
+    print(
+        f"{hits['reads']} read pairs: cutadapt {cutadapt_seconds:.2f}s, "
+        f"matcher {matcher_seconds:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (4, 5):
+        sys.exit(__doc__)
+    main(*sys.argv[1:4], *[int(arg) for arg in sys.argv[4:]])
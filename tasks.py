@@ -1,3 +1,4 @@
+import os
 import logging
 from flask_app import celery_app
 from redis import Redis
@@ -20,9 +21,13 @@ from helpers.r_scripts import (
     generate_rscripts_report,
     generate_all_rscripts_reports,
 )
-from helpers.ecoregions import update_external_samples_with_ecoregions
+from helpers.ecoregions import (
+    update_external_samples_with_ecoregions,
+    update_samples_with_ecoregions,
+)
 from helpers.share_directory import sync_project, sync_meta_project
 from helpers.hetzner_vm import send_vm_status_to_slack
+from helpers import fs_index
 
 logger = logging.getLogger("my_app_logger")
 
@@ -50,6 +55,11 @@ def redis_lock(lock_name, expire_time=86400):
         redis_client.delete(lock_name)  # Ensure lock is released
 
 
+def is_locked(lock_name):
+    """Whether a task currently holds redis_lock(lock_name)."""
+    return bool(redis_client.exists(lock_name))
+
+
 @celery_app.task
 def generate_lotus2_report_async(
     process_id,
@@ -74,6 +84,7 @@ def generate_lotus2_report_async(
                 parameters,
                 is_meta=is_meta,
             )
+            fs_index.invalidate(os.path.join(input_dir, "lotus2_report"))
 
     except LockError:
         logger.info(
@@ -104,6 +115,7 @@ def generate_rscripts_report_async(
                 analysis_type_id,
                 is_meta=is_meta,
             )
+            fs_index.invalidate(os.path.join(input_dir, "r_output"))
     except LockError:
         logger.info(
             f"Skipping execution: R-scripts task already running for {prefix} ID: {process_id}"
@@ -140,9 +152,82 @@ def generate_all_lotus2_reports_async(analysis_type_id, from_id, to_id):
 
 @celery_app.task
 def bucket_upload_folder_v2_async(
-    folder_path, destination_upload_directory, bucket
+    folder_path, destination_upload_directory, bucket, process_id=None
 ):
     bucket_upload_folder_v2(folder_path, destination_upload_directory, bucket)
+    if process_id:
+        # A report of the upload may now be in the bucket
+        verify_reports_bucket_status_async(process_id)
+
+
+@celery_app.task
+def verify_reports_bucket_status_async(process_id=None):
+    from models.reports_bucket_status import ReportsBucketStatus
+
+    lock_key = (
+        f"celery-lock:verify_reports_bucket_status:{process_id or 'all'}"
+    )
+    try:
+        with redis_lock(lock_key):
+            if process_id:
+                ReportsBucketStatus.verify(process_id)
+            else:
+                ReportsBucketStatus.verify_all()
+
+    except LockError:
+        logger.info(
+            "Skipping execution: Task verify_reports_bucket_status_async "
+            f"is already running for {process_id or 'all uploads'}"
+        )
+    except Exception as e:
+        logger.error(
+            f"Unexpected error in verify_reports_bucket_status_async: {e}"
+        )
+        raise
+
+
+@celery_app.task
+def reconcile_bucket_uploads_async(bucket_name=None):
+    from models.bucket_reconciliation import BucketReconciliation
+
+    lock_key = f"celery-lock:reconcile_bucket_uploads:{bucket_name or 'all'}"
+    try:
+        with redis_lock(lock_key):
+            if bucket_name:
+                BucketReconciliation.reconcile_bucket(bucket_name)
+            else:
+                BucketReconciliation.reconcile_all()
+
+    except LockError:
+        logger.info(
+            "Skipping execution: Task reconcile_bucket_uploads_async "
+            f"is already running for {bucket_name or 'all buckets'}"
+        )
+    except Exception as e:
+        logger.error(
+            f"Unexpected error in reconcile_bucket_uploads_async: {e}"
+        )
+        raise
+
+
+@celery_app.task
+def rebuild_taxonomy_lineages_async():
+    from models.taxonomy import TaxonomyManager
+
+    try:
+        with redis_lock("celery-lock:rebuild_taxonomy_lineages"):
+            TaxonomyManager.rebuild_lineages()
+
+    except LockError:
+        logger.info(
+            "Skipping execution: Task rebuild_taxonomy_lineages_async "
+            "is already running"
+        )
+    except Exception as e:
+        logger.error(
+            f"Unexpected error in rebuild_taxonomy_lineages_async: {e}"
+        )
+        raise
 
 
 @celery_app.task
@@ -176,7 +261,31 @@ def create_multiqc_report_async(process_id):
 
 @celery_app.task
 def update_external_samples_with_ecoregions_async():
-    update_external_samples_with_ecoregions()
+    try:
+        with redis_lock("celery-lock:update_external_samples_ecoregions"):
+            update_external_samples_with_ecoregions()
+
+    except LockError:
+        logger.info(
+            "Skipping execution: Task "
+            "update_external_samples_with_ecoregions_async "
+            "is already running"
+        )
+
+
+@celery_app.task
+def update_samples_with_ecoregions_async():
+    # The lock also keeps two runs off the same backfill checkpoint
+    try:
+        with redis_lock("celery-lock:update_samples_ecoregions"):
+            update_samples_with_ecoregions()
+
+    except LockError:
+        logger.info(
+            "Skipping execution: Task "
+            "update_samples_with_ecoregions_async "
+            "is already running"
+        )
 
 
 @celery_app.task
@@ -218,9 +327,52 @@ def sync_meta_project_async(meta_project_id):
         raise
 
 
+@celery_app.task
+def adapters_count_all_async():
+    from models.sequencing_upload import SequencingUpload
+
+    try:
+        with redis_lock("celery-lock:adapters_count_all"):
+            SequencingUpload.adapters_count_all()
+
+    except LockError:
+        logger.info(
+            "Skipping execution: Task adapters_count_all_async "
+            "is already running"
+        )
+
+
+@celery_app.task
+def ingest_server_files_async(
+    process_id, directory_name, sequencing_run, uploads_folder=None
+):
+    from helpers.server_files import (
+        INGEST_SERVER_FILES_LOCK,
+        ingest_server_files,
+    )
+
+    lock_key = INGEST_SERVER_FILES_LOCK.format(process_id=process_id)
+    try:
+        with redis_lock(lock_key):
+            ingest_server_files(
+                process_id, directory_name, sequencing_run, uploads_folder
+            )
+
+    except LockError:
+        logger.info(
+            f"Skipping execution: Task ingest_server_files_async "
+            f"is already running for process_id: {process_id}"
+        )
+
+    except Exception as e:
+        logger.error(f"Unexpected error in ingest_server_files_async: {e}")
+        raise
+
+
 @celery_app.task
 def download_file_from_bucket_async(bucket_name, blob_path, local_file_path):
     download_file_from_bucket(bucket_name, blob_path, local_file_path)
+    fs_index.invalidate(os.path.dirname(local_file_path))
 
 
 @celery_app.task(name="tasks.send_vm_status_to_slack_task")
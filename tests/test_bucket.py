@@ -0,0 +1,140 @@
+import base64
+import hashlib
+
+import helpers.bucket as bucket_helpers
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.size = None
+        self.md5_hash = None
+        self.metadata = None
+
+    def upload_from_string(self, data, content_type=None, checksum=None):
+        self.bucket.uploads.append(self.name)
+        self.bucket.objects[self.name] = data
+        self.size = len(data)
+        self.md5_hash = base64.b64encode(hashlib.md5(data).digest()).decode()
+
+    def compose(self, sources):
+        assert len(sources) <= bucket_helpers.COMPOSE_MAX_COMPONENTS
+        self.bucket.objects[self.name] = b"".join(
+            self.bucket.objects[source.name] for source in sources
+        )
+
+    def patch(self):
+        pass
+
+    def delete(self):
+        del self.bucket.objects[self.name]
+
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+        self.uploads = []
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def list_blobs(self, prefix, delimiter=None):
+        blobs = []
+        for name, data in self.objects.items():
+            if name.startswith(prefix):
+                blob = FakeBlob(self, name)
+                blob.size = len(data)
+                blob.md5_hash = base64.b64encode(
+                    hashlib.md5(data).digest()
+                ).decode()
+                blobs.append(blob)
+        return blobs
+
+
+def test_chunked_upload_composes_and_resumes(tmp_path, mocker):
+    """
+    Files with more than 32 parts are composed in several levels, and
+    parts that are already in the bucket are not uploaded again.
+    """
+    fake_bucket = FakeBucket()
+    mocker.patch.object(bucket_helpers, "get_bucket", return_value=fake_bucket)
+    mocker.patch.object(bucket_helpers, "UPLOAD_PART_SIZE", 10)
+
+    content = bytes(range(256)) * 2
+    local_file = tmp_path / "reads.fastq.gz"
+    local_file.write_bytes(content)
+
+    # An earlier attempt got the first three parts up
+    for part_num in range(3):
+        fake_bucket.blob(
+            f"up/reads.fastq.gz.part{part_num}"
+        ).upload_from_string(content[part_num * 10 : (part_num + 1) * 10])
+    fake_bucket.uploads.clear()
+
+    assert bucket_helpers.bucket_chunked_upload_v2(
+        local_file_path=str(local_file),
+        destination_upload_directory="up",
+        destination_blob_name="reads.fastq.gz",
+        sequencer_file_id=None,
+        bucket_name="Bucket",
+        known_md5=hashlib.md5(content).hexdigest(),
+    )
+
+    assert fake_bucket.objects == {"up/reads.fastq.gz": content}
+    assert len(fake_bucket.uploads) == 52 - 3
+    assert "up/reads.fastq.gz.part0" not in fake_bucket.uploads
+
+
+def test_check_files_exist_in_bucket_lists_each_directory_once(mocker):
+    """
+    Existence of many blobs is answered with one listing per directory.
+    """
+    fake_bucket = FakeBucket()
+    for name in ["ITS2/a.fastq.gz", "ITS2/b.fastq.gz", "SSU/c.fastq.gz"]:
+        fake_bucket.objects[name] = b"x"
+    list_spy = mocker.spy(fake_bucket, "list_blobs")
+    mocker.patch.object(bucket_helpers, "get_bucket", return_value=fake_bucket)
+
+    assert bucket_helpers.check_files_exist_in_bucket(
+        ["ITS2/a.fastq.gz", "ITS2/missing.fastq.gz", "SSU/c.fastq.gz"],
+        bucket_name="Bucket",
+    ) == {
+        "ITS2/a.fastq.gz": True,
+        "ITS2/missing.fastq.gz": False,
+        "SSU/c.fastq.gz": True,
+    }
+    assert list_spy.call_count == 2
+
+
+def test_chunked_upload_deletes_parts_of_a_longer_attempt(tmp_path, mocker):
+    """
+    Parts left by an earlier attempt with more parts are deleted too.
+    """
+    fake_bucket = FakeBucket()
+    mocker.patch.object(bucket_helpers, "get_bucket", return_value=fake_bucket)
+    mocker.patch.object(bucket_helpers, "UPLOAD_PART_SIZE", 10)
+
+    content = b"x" * 25
+    local_file = tmp_path / "reads.fastq.gz"
+    local_file.write_bytes(content)
+
+    for part_num in range(3, 6):
+        fake_bucket.blob(
+            f"up/reads.fastq.gz.part{part_num}"
+        ).upload_from_string(b"old")
+    fake_bucket.objects["up/reads.fastq.gz.partial"] = b"kept"
+
+    assert bucket_helpers.bucket_chunked_upload_v2(
+        local_file_path=str(local_file),
+        destination_upload_directory="up",
+        destination_blob_name="reads.fastq.gz",
+        sequencer_file_id=None,
+        bucket_name="Bucket",
+        known_md5=hashlib.md5(content).hexdigest(),
+    )
+
+    assert fake_bucket.objects == {
+        "up/reads.fastq.gz": content,
+        "up/reads.fastq.gz.partial": b"kept",
+    }
@@ -0,0 +1,123 @@
+from sqlalchemy import create_engine
+
+import helpers.dbm as dbm
+from models import bucket_reconciliation
+from models.bucket_reconciliation import BucketReconciliation
+from models.db_model import (
+    Base,
+    SequencingBucketReconciliationTable,
+    SequencingFilesUploadedTable,
+    SequencingFileStatsTable,
+    SequencingSamplesTable,
+    SequencingSequencerIDsTable,
+    SequencingUploadsTable,
+)
+
+
+def _reconciliation_db(mocker):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(
+        engine,
+        tables=[
+            SequencingUploadsTable.__table__,
+            SequencingSamplesTable.__table__,
+            SequencingSequencerIDsTable.__table__,
+            SequencingFilesUploadedTable.__table__,
+            SequencingFileStatsTable.__table__,
+            SequencingBucketReconciliationTable.__table__,
+        ],
+    )
+    mocker.patch.object(dbm, "connect_db", return_value=engine)
+    with dbm.session_scope() as session:
+        # Two uploads of the same project, one of another project
+        for upload_id, project_id in ((1, "Proj"), (2, "proj"), (3, "other")):
+            session.add(
+                SequencingUploadsTable(
+                    id=upload_id,
+                    project_id=project_id,
+                    uploads_folder=f"UP{upload_id}",
+                )
+            )
+            session.add(
+                SequencingSamplesTable(
+                    id=upload_id, sequencingUploadId=upload_id
+                )
+            )
+            session.add(
+                SequencingSequencerIDsTable(
+                    id=upload_id, sequencingSampleId=upload_id, Region="ITS2"
+                )
+            )
+        for file_id, sequencer_id, new_name in (
+            (1, 1, "a.fastq.gz"),
+            (2, 1, "b.fastq.gz"),
+            (3, 2, "c.fastq.gz"),
+            (4, 3, "d.fastq.gz"),
+        ):
+            session.add(
+                SequencingFilesUploadedTable(
+                    id=file_id,
+                    sequencerId=sequencer_id,
+                    new_name=new_name,
+                    md5=f"md5-{file_id}",
+                )
+            )
+        session.add(SequencingFileStatsTable(sequencingFileId=3, file_size=30))
+
+
+def test_one_listing_reconciles_all_the_uploads_of_a_bucket(
+    mocker, tmp_path, monkeypatch
+):
+    _reconciliation_db(mocker)
+    monkeypatch.chdir(tmp_path)
+    local = tmp_path / "seq_processed" / "UP1"
+    local.mkdir(parents=True)
+    (local / "a.fastq.gz").write_bytes(b"0123456789")
+    (local / "b.fastq.gz").write_bytes(b"01234")
+
+    list_mock = mocker.patch.object(
+        bucket_reconciliation,
+        "list_blob_sizes",
+        return_value={
+            "ITS2/b.fastq.gz": 3,
+            "ITS2/c.fastq.gz": 30,
+            "lotus2_report/ITS2/log": 1,
+        },
+    )
+    upload_mock = mocker.patch.object(
+        bucket_reconciliation, "init_bucket_chunked_upload_v2"
+    )
+
+    snapshots = BucketReconciliation.reconcile_bucket("PROJ")
+    list_mock.assert_called_once_with("PROJ")
+    assert sorted(snapshots) == [1, 2]
+    assert snapshots[1]["missing_files"] == ["ITS2/a.fastq.gz"]
+    assert snapshots[1]["size_mismatched_files"] == [
+        {
+            "blob_path": "ITS2/b.fastq.gz",
+            "expected_size": 5,
+            "bucket_size": 3,
+        }
+    ]
+    assert snapshots[1]["complete"] is False
+    # Deleted locally, the size recorded by the scan is used
+    assert snapshots[2]["complete"] is True
+    assert BucketReconciliation.get(2) == snapshots[2]
+    assert BucketReconciliation.get(3) is None
+    assert [s["process_id"] for s in BucketReconciliation.get_all(True)] == [1]
+
+    # Only the missing and mismatched files are uploaded again
+    assert BucketReconciliation.enqueue_missing(1) == 2
+    assert sorted(
+        call.kwargs["destination_blob_name"]
+        for call in upload_mock.call_args_list
+    ) == ["a.fastq.gz", "b.fastq.gz"]
+    assert upload_mock.call_args.kwargs["bucket_name"] == "proj"
+
+    list_mock.return_value = {
+        "ITS2/a.fastq.gz": 10,
+        "ITS2/b.fastq.gz": 5,
+        "ITS2/c.fastq.gz": 30,
+    }
+    assert BucketReconciliation.enqueue_missing(2) == 0
+    assert BucketReconciliation.get(1)["complete"] is True
@@ -0,0 +1,93 @@
+import hashlib
+import os
+
+from helpers import checksums
+
+
+def test_get_md5s_reuses_stored_digests(tmp_path, monkeypatch, mocker):
+    """
+    Checksums are only calculated for files that are new or changed
+    since the last call, and the digests survive in the sidecar store.
+    """
+    monkeypatch.chdir(tmp_path)
+    delivery = tmp_path / "delivery"
+    delivery.mkdir()
+    for name in ["a.fastq.gz", "b.fastq.gz"]:
+        (delivery / name).write_bytes(name.encode() * 1000)
+    files = sorted(str(path) for path in delivery.iterdir())
+
+    compute_spy = mocker.spy(checksums, "compute_md5")
+    first = checksums.get_md5s(files, workers=2)
+    assert first == {
+        path: hashlib.md5(open(path, "rb").read()).hexdigest()
+        for path in files
+    }
+    assert compute_spy.call_count == 2
+    assert os.listdir(checksums.CHECKSUMS_FOLDER)
+
+    # Nothing changed, nothing is read again
+    assert checksums.get_md5s(files) == first
+    assert compute_spy.call_count == 2
+
+    # A rewritten file is hashed again
+    (delivery / "b.fastq.gz").write_bytes(b"new content")
+    os.utime(delivery / "b.fastq.gz", ns=(1, 1))
+    assert (
+        checksums.get_md5(files[1]) == hashlib.md5(b"new content").hexdigest()
+    )
+    assert compute_spy.call_count == 3
+
+
+def test_assemble_md5_joins_and_hashes_the_parts(tmp_path, mocker):
+    contents = [b"@read1\nACGT\n" * 5000, b"", b"@read2\nTTGA\n" * 333]
+    parts = []
+    for i, content in enumerate(contents, start=1):
+        part = tmp_path / f"sample.fastq.gz.part{i}"
+        part.write_bytes(content)
+        parts.append(str(part))
+    destination = tmp_path / "sample.fastq.gz.temp"
+    destination.write_bytes(b"left over from a failed effort")
+    expected = b"".join(contents)
+
+    md5 = checksums.assemble_md5(parts, str(destination))
+    assert md5 == hashlib.md5(expected).hexdigest()
+    assert destination.read_bytes() == expected
+
+    # Without kernel copies, the mapped parts are written instead
+    mocker.patch.object(
+        checksums.os,
+        "copy_file_range",
+        side_effect=OSError("not supported"),
+        create=True,
+    )
+    mocker.patch.object(
+        checksums.os,
+        "sendfile",
+        side_effect=OSError("not supported"),
+        create=True,
+    )
+    assert checksums.assemble_md5(parts, str(destination)) == md5
+    assert destination.read_bytes() == expected
+
+
+def test_chunk_ledger_is_used_until_a_chunk_changes(tmp_path, mocker):
+    chunks = [b"@read1\nACGT\n" * 100, b"@read2\nTTGA\n" * 7]
+    parts = [str(tmp_path / f"sample.fastq.gz.part{i}") for i in (1, 2)]
+    for part, chunk in zip(parts, chunks):
+        checksums.save_chunk(part, chunk)
+    expected = [hashlib.md5(chunk).hexdigest() for chunk in chunks]
+
+    compute_spy = mocker.spy(checksums, "compute_md5")
+    assert checksums.get_chunk_md5s(parts) == expected
+    compute_spy.assert_not_called()
+
+    # A chunk written again behind the ledger's back is hashed again
+    with open(parts[1], "ab") as f:
+        f.write(b"extra")
+    assert checksums.get_chunk_md5s(parts)[1] == (
+        hashlib.md5(chunks[1] + b"extra").hexdigest()
+    )
+    compute_spy.assert_called_once_with(parts[1])
+
+    checksums.remove_chunks(parts)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,49 @@
+from sqlalchemy import create_engine
+
+import helpers.dbm as dbm
+
+
+def test_connect_db_returns_same_engine(mocker):
+    """
+    The engine is created once per process and reused afterwards,
+    and rebuilt if the process has been forked.
+    """
+    mocker.patch.object(dbm, "_engine", None)
+    mocker.patch.object(dbm, "_engine_pid", None)
+    create_mock = mocker.patch.object(
+        dbm,
+        "_create_engine",
+        side_effect=lambda: create_engine("sqlite://"),
+    )
+
+    first = dbm.connect_db()
+    second = dbm.connect_db()
+    assert first is second
+    assert create_mock.call_count == 1
+
+    # Pretend we are now running in a forked child
+    mocker.patch("os.getpid", return_value=dbm._engine_pid + 1)
+    third = dbm.connect_db()
+    assert third is not first
+    assert create_mock.call_count == 2
+
+
+def test_session_scope_reuse(mocker):
+    """
+    Nested session_scope(reuse=True) calls get the enclosing session,
+    while plain nested calls still open their own.
+    """
+    engine = create_engine("sqlite://")
+    mocker.patch.object(dbm, "connect_db", return_value=engine)
+
+    with dbm.session_scope() as outer:
+        with dbm.session_scope(reuse=True) as inner:
+            assert inner is outer
+        with dbm.session_scope() as separate:
+            assert separate is not outer
+        # The outer session is still usable after the nested scopes
+        assert outer.is_active
+
+    # Without an enclosing scope, reuse=True opens a new session
+    with dbm.session_scope(reuse=True) as standalone:
+        assert standalone is not outer
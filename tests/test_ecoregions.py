@@ -0,0 +1,170 @@
+import json
+
+import requests
+from sqlalchemy import create_engine
+
+import helpers.dbm as dbm
+from helpers import ecoregions
+from models import sequencing_sample
+from models.db_model import (
+    Base,
+    ExternalSamplingTable,
+    ResolveEcoregionsTable,
+    SequencingSamplesTable,
+)
+from models.sequencing_sample import SequencingSample
+
+
+def _results(coordinates):
+    return [
+        {"lat": lat, "lon": lon, "ecoregion": {"OBJECTID": int(lat)}}
+        for lat, lon in coordinates
+    ]
+
+
+def test_resolve_ecoregions_sends_batches_to_the_service(mocker):
+    mocker.patch.object(ecoregions, "ECOREGIONS_BATCH_SIZE", 3)
+
+    def post(url, json, timeout):
+        response = mocker.Mock()
+        response.json.return_value = {"results": _results(json["coordinates"])}
+        return response
+
+    post_mock = mocker.patch.object(
+        ecoregions._service_session, "post", side_effect=post
+    )
+    exec_mock = mocker.patch.object(ecoregions, "return_ecoregion")
+
+    coordinates = [(float(i), 10.0) for i in range(7)]
+    objectids = ecoregions.get_resolve_ecoregion_objectids(coordinates)
+
+    assert objectids == {(float(i), 10.0): i for i in range(7)}
+    assert post_mock.call_count == 3
+    exec_mock.assert_not_called()
+
+
+def test_resolve_ecoregions_falls_back_to_the_container(mocker):
+    mocker.patch.object(
+        ecoregions._service_session,
+        "post",
+        side_effect=requests.ConnectionError("refused"),
+    )
+    exec_mock = mocker.patch.object(
+        ecoregions,
+        "return_ecoregion",
+        side_effect=lambda batch: json.dumps(_results(batch)),
+    )
+
+    assert ecoregions.get_resolve_ecoregion_objectid(20.0, 5.0) == 5
+    exec_mock.assert_called_once_with([(5.0, 20.0)])
+
+    exec_mock.side_effect = lambda batch: "not json"
+    assert ecoregions.get_resolve_ecoregion_objectid(20.0, 5.0) is None
+
+
+def _backfill_db(mocker, tmp_path):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(
+        engine,
+        tables=[
+            ResolveEcoregionsTable.__table__,
+            ExternalSamplingTable.__table__,
+        ],
+    )
+    mocker.patch.object(dbm, "connect_db", return_value=engine)
+    mocker.patch.object(
+        ecoregions,
+        "ECOREGION_BACKFILL_FOLDER",
+        str(tmp_path / ".ecoregions"),
+    )
+    with dbm.session_scope() as session:
+        for objectid in range(4):
+            session.add(
+                ResolveEcoregionsTable(
+                    id=100 + objectid, FID=objectid, OBJECTID=objectid
+                )
+            )
+        for i, (latitude, longitude) in enumerate(
+            [
+                ("1", "10"),
+                ("1", "10"),
+                ("2", "20"),
+                ("3", "30"),
+                ("bad", "0"),
+                (None, "5"),
+            ]
+        ):
+            session.add(
+                ExternalSamplingTable(
+                    id=i + 1, latitude=latitude, longitude=longitude
+                )
+            )
+
+
+def _ecoregion_ids():
+    with dbm.session_scope() as session:
+        return dict(
+            session.query(
+                ExternalSamplingTable.id,
+                ExternalSamplingTable.resolve_ecoregion_id,
+            ).all()
+        )
+
+
+def test_backfill_resumes_after_the_lookup_fails(mocker, tmp_path):
+    _backfill_db(mocker, tmp_path)
+    calls = []
+
+    def lookup(coordinates):
+        calls.append(coordinates)
+        if len(calls) == 2:
+            return None
+        return {(lat, lon): int(lat) for lat, lon in coordinates}
+
+    mocker.patch.object(
+        ecoregions, "get_resolve_ecoregion_objectids", side_effect=lookup
+    )
+
+    checkpoint = ecoregions.backfill_ecoregions(
+        "external_sampling", page_size=2
+    )
+    assert checkpoint["finished_at"] is None
+    assert checkpoint["last"] == ["2", "20"]
+    assert _ecoregion_ids() == {
+        1: 101,
+        2: 101,
+        3: 102,
+        4: None,
+        5: None,
+        6: None,
+    }
+
+    checkpoint = ecoregions.backfill_ecoregions(
+        "external_sampling", page_size=2
+    )
+    assert calls[2:] == [[(3.0, 30.0)]]
+    assert checkpoint["finished_at"] is not None
+    assert checkpoint["updated"] == 6
+    assert _ecoregion_ids() == {1: 101, 2: 101, 3: 102, 4: 103, 5: 100, 6: 100}
+    assert ecoregions.load_backfill_checkpoint("external_sampling") == (
+        checkpoint
+    )
+
+
+def test_update_missing_fields_queues_the_sample_backfill(mocker):
+    """
+    The admin request only queues the ecoregion backfill of the samples,
+    it does not run it.
+    """
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[SequencingSamplesTable.__table__])
+    mocker.patch.object(dbm, "connect_db", return_value=engine)
+    backfill = mocker.patch.object(ecoregions, "backfill_ecoregions")
+    init_backfill = mocker.patch.object(
+        sequencing_sample, "init_update_samples_with_ecoregions"
+    )
+
+    SequencingSample.update_missing_fields()
+
+    init_backfill.assert_called_once_with()
+    backfill.assert_not_called()
@@ -0,0 +1,145 @@
+import gzip
+
+import pytest
+from sqlalchemy import create_engine
+
+import helpers.dbm as dbm
+from helpers import fastq_stats
+from helpers.cutadapt import subsample_fastq
+from models import sequencing_files_uploaded
+from models.db_model import (
+    Base,
+    SequencingFilesUploadedTable,
+    SequencingFileStatsTable,
+)
+from models.sequencing_files_uploaded import SequencingFileUploaded
+
+FASTQ_FILE = "tests/fastq_files/sample1_ITS2_R1.fastq.gz"
+
+
+def _reference_stats(file_path):
+    with gzip.open(file_path, "rt") as f:
+        lines = f.read().splitlines()
+    sequences = lines[1::4]
+    qualities = lines[3::4]
+    lengths = [len(sequence) for sequence in sequences]
+    gc = sum(sequence.upper().count(b) for sequence in sequences for b in "GC")
+    first_position = [ord(quality[0]) - 33 for quality in qualities]
+    return {
+        "read_count": len(sequences),
+        "read_length_min": min(lengths),
+        "read_length_max": max(lengths),
+        "read_length_avg": sum(lengths) / len(lengths),
+        "gc_content": round(gc * 100 / sum(lengths), 2),
+        "first_quality": round(sum(first_position) / len(qualities), 2),
+    }
+
+
+@pytest.mark.parametrize("use_pigz", [True, False])
+def test_scan_fastq_matches_reference(monkeypatch, use_pigz):
+    """
+    One pass over the file gives the same numbers as counting read by
+    read, across several batches and with or without pigz.
+    """
+    if not use_pigz:
+        monkeypatch.setattr(fastq_stats.shutil, "which", lambda name: None)
+    monkeypatch.setattr(fastq_stats, "FASTQ_BATCH_READS", 7)
+
+    stats = fastq_stats.scan_fastq(FASTQ_FILE)
+    expected = _reference_stats(FASTQ_FILE)
+
+    assert stats["read_count"] == expected["read_count"]
+    assert stats["read_length_min"] == expected["read_length_min"]
+    assert stats["read_length_max"] == expected["read_length_max"]
+    assert stats["read_length_avg"] == pytest.approx(
+        expected["read_length_avg"]
+    )
+    assert stats["gc_content"] == expected["gc_content"]
+    assert stats["mean_quality_per_position"][0] == expected["first_quality"]
+    assert sum(stats["length_histogram"].values()) == stats["read_count"]
+    assert (
+        len(stats["mean_quality_per_position"]) == expected["read_length_max"]
+    )
+
+
+def test_scan_fastq_raises_on_broken_file(tmp_path):
+    broken = tmp_path / "broken.fastq.gz"
+    broken.write_bytes(b"not gzip")
+    with pytest.raises((OSError, EOFError)):
+        fastq_stats.scan_fastq(str(broken))
+
+
+def test_subsample_fastq_keeps_first_reads(tmp_path):
+    sample = tmp_path / "sample.fastq"
+    assert subsample_fastq(FASTQ_FILE, str(sample), 5) == 5
+    with gzip.open(FASTQ_FILE, "rb") as f:
+        expected = b"".join(f.readline() for _ in range(20))
+    assert sample.read_bytes() == expected
+
+
+def test_open_fastq_does_not_block_on_pigz_warnings(monkeypatch, tmp_path):
+    """
+    pigz writing more warnings than a pipe holds does not stop the
+    decompressed reads from being streamed.
+    """
+    fake_pigz = tmp_path / "pigz"
+    fake_pigz.write_text(
+        "#!/bin/sh\n"
+        "head -c 200000 /dev/zero >&2\n"
+        'for last; do :; done\ngzip -dc "$last"\n'
+    )
+    fake_pigz.chmod(0o755)
+    monkeypatch.setattr(
+        fastq_stats.shutil, "which", lambda name: str(fake_pigz)
+    )
+
+    with fastq_stats.open_fastq(FASTQ_FILE) as f:
+        content = f.read()
+    with gzip.open(FASTQ_FILE, "rb") as f:
+        assert content == f.read()
+
+
+def test_get_stats_scans_without_a_session(mocker):
+    """
+    The file is scanned with no database session open, and statistics
+    stored by another worker during the scan are updated, not inserted
+    a second time.
+    """
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(
+        engine,
+        tables=[
+            SequencingFilesUploadedTable.__table__,
+            SequencingFileStatsTable.__table__,
+        ],
+    )
+    mocker.patch.object(dbm, "connect_db", return_value=engine)
+    with dbm.session_scope() as session:
+        session.add(SequencingFilesUploadedTable(id=1))
+
+    scan_fastq = fastq_stats.scan_fastq
+
+    def scan_during_another_worker(file_path):
+        assert dbm._session_stack() == []
+        with dbm.session_scope() as session:
+            session.add(SequencingFileStatsTable(sequencingFileId=1))
+        return scan_fastq(file_path)
+
+    mocker.patch.object(
+        sequencing_files_uploaded,
+        "scan_fastq",
+        side_effect=scan_during_another_worker,
+    )
+
+    stats = SequencingFileUploaded.get_stats(1, FASTQ_FILE)
+    assert stats["read_count"] == _reference_stats(FASTQ_FILE)["read_count"]
+    with dbm.session_scope() as session:
+        assert session.query(SequencingFileStatsTable).count() == 1
+        assert (
+            session.get(SequencingFilesUploadedTable, 1).total_sequences_number
+            == stats["read_count"]
+        )
+
+    # Unchanged since it was scanned, the stored statistics are returned
+    assert SequencingFileUploaded.get_stats(1, FASTQ_FILE) == stats
+    assert sequencing_files_uploaded.scan_fastq.call_count == 1
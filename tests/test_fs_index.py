@@ -0,0 +1,64 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers import fs_index
+
+
+def test_upload_manifest_is_persisted_and_invalidated(tmp_path, monkeypatch):
+    """
+    Listings inside seq_processed/<uploads_folder> are recorded in a
+    manifest on disk, reused by other processes, and dropped by
+    invalidate() so that new files show up.
+    """
+    monkeypatch.chdir(tmp_path)
+    fs_index.invalidate()
+
+    report_dir = os.path.join("seq_processed", "00001_TEST", "r_output", "X")
+    os.makedirs(report_dir)
+    with open(os.path.join(report_dir, "contaminants.csv"), "w") as f:
+        f.write("a,b\n")
+
+    assert fs_index.file_exists(os.path.join(report_dir, "contaminants.csv"))
+    assert not fs_index.file_exists(os.path.join(report_dir, "missing.csv"))
+    assert fs_index.path_exists(
+        os.path.join("seq_processed", "00001_TEST", "r_output", "X")
+    )
+    assert os.path.isfile(
+        os.path.join("seq_processed", ".manifests", "00001_TEST.json")
+    )
+
+    # A fresh process only has the persisted manifest to go on
+    fs_index._manifests.clear()
+    manifest = fs_index.get_upload_manifest("00001_TEST")
+    assert manifest["r_output/X"]["contaminants.csv"][1] == 4
+
+    with open(os.path.join(report_dir, "LibrarySize.pdf"), "w") as f:
+        f.write("pdf")
+    fs_index.invalidate(os.path.join("seq_processed", "00001_TEST"))
+    assert fs_index.file_info(os.path.join(report_dir, "LibrarySize.pdf"))[
+        0
+    ] == len("pdf")
+
+
+def test_threads_share_the_manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(fs_index, "DIRECTORY_CHECK_INTERVAL", 0)
+    fs_index.invalidate()
+
+    upload_dir = os.path.join("seq_processed", "00002_TEST")
+    for i in range(20):
+        os.makedirs(os.path.join(upload_dir, f"dir{i}"))
+
+    def look(i):
+        for _ in range(20):
+            fs_index.list_directory(os.path.join(upload_dir, f"dir{i}"))
+        return True
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert all(executor.map(look, range(20)))
+
+    assert os.listdir(os.path.join("seq_processed", ".manifests")) == [
+        "00002_TEST.json"
+    ]
+    fs_index._manifests.clear()
+    assert len(fs_index.get_upload_manifest("00002_TEST")) == 20
@@ -0,0 +1,113 @@
+import pandas as pd
+
+from helpers import metadata_check
+
+
+def _valid_row(sample_id):
+    return {
+        "SampleID": sample_id,
+        "Site_name": "Site",
+        "Latitude": "45.5",
+        "Longitude": "-120.25",
+        "Elevation": "100",
+        "Vegetation": "Forest",
+        "Land_use": "Natural",
+        "Agricultural_land": "No",
+        "Ecosystem": "Boreal Forests/Taiga",
+        "Grid_Size": "30m x 30m",
+        "Soil_depth": "0-10cm",
+        "Transport_refrigeration": "Yes",
+        "Drying": "No",
+        "Date_collected": "2024-05-01",
+        "DNA_concentration_ng_ul": "1.5",
+        "Sample_type": "Soil",
+        "Sample_or_Control": "True sample",
+        "Notes": "",
+    }
+
+
+def _first_option(column):
+    options = metadata_check.get_columns_data()[column]["options"]
+    return options[0]
+
+
+def test_check_metadata_reports_invalid_cells_by_column(mocker):
+    mocker.patch.object(
+        metadata_check,
+        "current_user",
+        mocker.Mock(is_authenticated=True, admin=False),
+    )
+    rows = [_valid_row(f"S_{i}") for i in range(4)]
+    for row in rows:
+        for column in [
+            "Land_use",
+            "Agricultural_land",
+            "Ecosystem",
+            "Grid_Size",
+            "Transport_refrigeration",
+            "Drying",
+            "Sample_type",
+        ]:
+            row[column] = _first_option(column)
+    rows[0]["Sample_or_Control"] = "Control"
+    rows[0]["Latitude"] = "bad"  # controls are not checked
+    rows[1]["Date_collected"] = "01/05/2024"
+    rows[1]["Land_use"] = f" {rows[1]['Land_use'].upper()} "
+    rows[2]["Elevation"] = ""
+    rows[2]["Date_collected"] = "2024-13-01"
+    rows[3]["Latitude"] = "45°"
+    rows[3]["Drying"] = "Maybe"
+    df = pd.DataFrame(rows, index=[10, 11, 12, 13])
+
+    result = metadata_check.check_metadata(df, "no")
+
+    assert result["status"] == 0
+    assert list(result) == [
+        "status",
+        "Date_collected",
+        "Elevation",
+        "Latitude",
+        "Drying",
+    ]
+    assert result["Date_collected"]["message"] == (
+        "Column Date_collected has invalid values"
+    )
+    assert [cell["row"] for cell in result["Date_collected"]["invalid"]] == [
+        11,
+        12,
+    ]
+    assert result["Elevation"]["message"] == (
+        "Required column Elevation has empty values"
+    )
+    assert result["Latitude"]["invalid"] == [
+        {
+            "row": 13,
+            "value": "45°",
+            "message": (
+                "Invalid value: contains special characters like degree "
+                "symbol (°) or letters"
+            ),
+        }
+    ]
+    assert result["Drying"]["message"] == "Invalid Drying values"
+
+
+def test_check_row_matches_check_metadata(mocker):
+    mocker.patch.object(
+        metadata_check,
+        "current_user",
+        mocker.Mock(is_authenticated=True, admin=True),
+    )
+    columns_data = metadata_check.get_columns_data()
+    row = pd.Series(_valid_row("bad id"), name=3)
+    row["Elevation"] = ""  # admins may leave it empty
+    row["Soil_depth"] = "deep"
+
+    result = metadata_check.check_row(row, columns_data)
+
+    assert result["status"] == 0
+    assert result["SampleID"]["invalid"][0]["row"] == 3
+    assert result["Soil_depth"]["invalid"][0]["message"] == (
+        "Not an accepted soil depth"
+    )
+    assert "Elevation" not in result
@@ -0,0 +1,71 @@
+import json
+import os
+
+from helpers import metadata_check, metadata_config
+
+
+def _write(path, data, mtime_ns):
+    path.write_text(json.dumps(data))
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_fields_are_reloaded_only_when_a_file_changes(tmp_path, mocker):
+    mocker.patch.object(metadata_config, "CONFIG_FOLDER", str(tmp_path))
+    _write(
+        tmp_path / "columns.json",
+        {
+            "Drying": {"lookup_file": "drying.json", "allowAdminNA": "True"},
+            "Notes": {"excludeFromTemplate": "True"},
+        },
+        1_000_000_000,
+    )
+    _write(tmp_path / "drying.json", ["Yes", "No"], 1_000_000_000)
+    load_spy = mocker.spy(metadata_config.json, "load")
+
+    config = metadata_config.fields("columns.json")
+    assert config["all"]["Drying"]["options"] == ["Yes", "No"]
+    assert list(config["template"]) == ["Drying"]
+    assert config["admin"]["Drying"]["options"] == ["Yes", "No", "NA"]
+    assert config["canonical_admin"]["Drying"]["na"] == "NA"
+    assert "na" not in config["canonical"]["Drying"]
+    assert load_spy.call_count == 2
+
+    # Nothing changed, nothing is read or built again
+    assert metadata_config.fields("columns.json") is config
+    assert load_spy.call_count == 2
+
+    # A changed lookup file is read again, and the fields rebuilt
+    _write(tmp_path / "drying.json", ["Yes", "No", "Maybe"], 2_000_000_000)
+    reloaded = metadata_config.fields("columns.json")
+    assert reloaded["all"]["Drying"]["options"] == ["Yes", "No", "Maybe"]
+    assert load_spy.call_count == 3
+
+
+def test_admin_columns_do_not_change_shared_columns(mocker):
+    config = metadata_config.fields("columns.json")
+    options = list(config["all"]["Drying"]["options"])
+
+    mocker.patch.object(
+        metadata_check,
+        "current_user",
+        mocker.Mock(is_authenticated=True, admin=True),
+    )
+    assert metadata_check.get_columns_data()["Drying"]["options"] == (
+        options + ["NA"]
+    )
+    metadata_check.get_columns_data()
+
+    mocker.patch.object(
+        metadata_check,
+        "current_user",
+        mocker.Mock(is_authenticated=True, admin=False),
+    )
+    assert metadata_check.get_columns_data()["Drying"]["options"] == options
+    assert config["all"]["Drying"]["options"] == options
+
+
+def test_primer_sets_maps():
+    primer_sets = metadata_config.primer_sets()
+    assert primer_sets["primer_to_region"]["ITS3/ITS4"] == "ITS2"
+    assert "ITS4" in primer_sets["forward_to_reverse"]["ITS3"]
+    assert metadata_config.primer_sets() is primer_sets
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from helpers.primer_matcher import (
+    compile_primer,
+    count_primer_hits,
+    encode_reads,
+    find_primer,
+    reverse_complement,
+)
+
+
+def test_find_primer_allows_degenerate_bases_and_errors():
+    reads = encode_reads(
+        [
+            b"TTTTGAACGCAGCGAACTGCGATATTTT",  # R and II of the primer
+            b"TTTTGAACGCAGCGAACTCGATATTTT",  # one base deleted
+            b"TTTTGAACGTTTTAAGGCCCCCATTTT",  # too many differences
+            b"GAACG",  # shorter than the primer
+        ]
+    )
+    primer = compile_primer("GAACGCAGCRAAIIGCGATA")
+    assert find_primer(reads, primer).tolist() == [True, True, False, False]
+    assert reverse_complement("GTGARTCATCGAATCTTTG") == "CAAAGATTCGATGAYTCAC"
+    with pytest.raises(ValueError):
+        compile_primer("GAAXC")
+
+
+@pytest.mark.parametrize(
+    "sample, primers, cutadapt_counts",
+    [
+        (
+            "sample1_ITS2",
+            ("GCATCGATGAAGAACGCAGC", "TCCTCCGCTTATTGATATGC"),
+            [9751, 9933, 9691, 9052],
+        ),
+        (
+            "sample1_SSU",
+            ("CAGCCGCGGTAATTCCAGCT", "GAACCCAAACACTTTGGTTTCC"),
+            [6626, 9675, 6474, 4825],
+        ),
+    ],
+)
+def test_count_primer_hits_agrees_with_cutadapt(
+    sample, primers, cutadapt_counts
+):
+    """
+    The counts are within 1% of what cutadapt and vsearch count on the
+    same reads (the numbers the integration test expects).
+    """
+    hits = count_primer_hits(
+        f"tests/fastq_files/{sample}_R1.fastq.gz",
+        f"tests/fastq_files/{sample}_R2.fastq.gz",
+        *primers,
+        reverse_primer_revcomp=reverse_complement(primers[1]),
+    )
+    assert hits["reads"] == 10000
+    counts = [
+        hits[field]
+        for field in [
+            "fwd_read_fwd_adap",
+            "rev_read_rev_adap",
+            "fwd_rev_adap",
+            "fwd_rev_mrg_adap",
+        ]
+    ]
+    np.testing.assert_allclose(counts, cutadapt_counts, rtol=0.01)
+    assert hits["fractions"]["fwd_rev_adap"] == hits["fwd_rev_adap"] / 10000
@@ -0,0 +1,62 @@
+from sqlalchemy import create_engine
+
+import helpers.dbm as dbm
+from models.db_model import Base, SequencingReportsBucketStatusTable
+from models.reports_bucket_status import ReportsBucketStatus
+from models.sequencing_upload import SequencingUpload
+
+
+def _report(analysis_type_id, status, in_bucket, status_field):
+    return {
+        "analysis_type_id": analysis_type_id,
+        status_field: status,
+        "bucket_log_exists": in_bucket,
+        "bucket_blob_path": f"lotus2_report/{analysis_type_id}/log",
+    }
+
+
+def test_verify_records_the_finished_reports(mocker):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(
+        engine, tables=[SequencingReportsBucketStatusTable.__table__]
+    )
+    mocker.patch.object(dbm, "connect_db", return_value=engine)
+    mocker.patch.object(
+        SequencingUpload, "get", return_value={"project_id": "bucket"}
+    )
+    lotus2 = mocker.patch.object(
+        SequencingUpload,
+        "check_lotus2_reports_exist",
+        return_value=[
+            _report(1, "Finished", True, "lotus2_status"),
+            _report(2, "Started", False, "lotus2_status"),
+        ],
+    )
+    mocker.patch.object(
+        SequencingUpload,
+        "check_rscripts_reports_exist",
+        return_value=[_report(1, "Finished", False, "rscripts_status")],
+    )
+
+    statuses = ReportsBucketStatus.verify(7)
+    assert {
+        report: {
+            analysis_type_id: status["in_bucket"]
+            for analysis_type_id, status in by_type.items()
+        }
+        for report, by_type in statuses.items()
+    } == {"lotus2": {1: True}, "rscripts": {1: False}}
+    assert ReportsBucketStatus.get(7) == statuses
+    assert ReportsBucketStatus.get(8) == {"lotus2": {}, "rscripts": {}}
+
+    # The page fills in what was recorded, without the bucket
+    lotus2_report = [
+        {"analysis_type_id": 1, "bucket_log_exists": None},
+        {"analysis_type_id": 3, "bucket_log_exists": None},
+    ]
+    ReportsBucketStatus.apply(7, lotus2_report, [])
+    assert [r["bucket_log_exists"] for r in lotus2_report] == [True, None]
+
+    # A report that is no longer finished is forgotten
+    lotus2.return_value = [_report(1, "Started", False, "lotus2_status")]
+    assert ReportsBucketStatus.verify(7)["lotus2"] == {}
@@ -0,0 +1,185 @@
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import helpers.dbm as dbm
+from helpers.sequencer_id_index import SequencerIdIndex
+from models.db_model import Base, SequencingSequencerIDsTable
+from models.sequencing_sequencer_ids import SequencingSequencerId
+from models.sequencing_upload import SequencingUpload
+
+PROCESS_DATA = {
+    "region_1_forward_primer": "ITS3",
+    "region_1_reverse_primer": "ITS4",
+    "region_2_forward_primer": "WANDA",
+    "region_2_reverse_primer": "AML2",
+}
+
+
+def _mock_upload(mocker):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(
+        engine, tables=[SequencingSequencerIDsTable.__table__]
+    )
+    mocker.patch.object(dbm, "connect_db", return_value=engine)
+    mocker.patch.object(
+        SequencingUpload,
+        "get_samples",
+        return_value=[
+            {"SampleID": "S1", "id": 1},
+            {"SampleID": "S2", "id": 2},
+        ],
+    )
+    mocker.patch.object(
+        SequencingUpload, "get_regions", return_value=["ITS2", "SSU"]
+    )
+
+
+def test_check_df_reports_rows_in_order(mocker):
+    _mock_upload(mocker)
+    df = pd.DataFrame(
+        {
+            "SampleID": ["S1", "S3", "S2"],
+            "Region": ["ITS2", "LSU", "SSU"],
+            "SequencerID": ["A1", None, None],
+            "Index_1": [None, None, None],
+            "Index_2": [None, None, None],
+        }
+    )
+    result = SequencingSequencerId.check_df_and_add_records(
+        1, df, PROCESS_DATA
+    )
+    assert result["result"] == 0
+    assert result["messages"] == [
+        "SampleID: in row 2 with the value 'S3' is not in the list of "
+        "expected' SampleIDs from the metadata",
+        "Region: in row 2 with the value 'LSU' is not in the list of "
+        "expected Regions",
+        "SequencerID: in row 2 cannot be empty",
+        "SequencerID: in row 3 cannot be empty",
+    ]
+
+    df = pd.DataFrame(
+        {
+            "SampleID": ["S1", "S2"],
+            "Region": ["ITS2", "SSU"],
+            "SequencerID": ["A1", "A2"],
+            "Index_1": ["ACGN", "A" * 101],
+            "Index_2": ["ACGT", None],
+        }
+    )
+    result = SequencingSequencerId.check_df_and_add_records(
+        1, df, PROCESS_DATA
+    )
+    assert result["messages"] == [
+        "Index_1 in row 1 contains invalid characters (only ATGC are "
+        "allowed)",
+        "Index_1 in row 2 is longer than 100 characters",
+    ]
+
+
+def test_check_df_adds_records_once(mocker):
+    _mock_upload(mocker)
+    df = pd.DataFrame(
+        {
+            "SampleID": ["S1", "S2", "S2"],
+            "Region": ["ITS2", "ITS2", "SSU"],
+            "SequencerID": ["A1", "A2", "A3"],
+            "Index_1": ["ACGT", None, ""],
+            "Index_2": [None, None, None],
+        }
+    )
+    result = SequencingSequencerId.check_df_and_add_records(
+        1, df.copy(), PROCESS_DATA
+    )
+    assert result["result"] == 1
+    assert [row["db_sample_id"] for row in result["data"]] == [1, 2, 2]
+
+    with dbm.session_scope() as session:
+        rows = session.query(SequencingSequencerIDsTable).all()
+        assert sorted(
+            (row.sequencingSampleId, row.Region, row.Index_1) for row in rows
+        ) == [(1, "ITS2", "ACGT"), (2, "ITS2", None), (2, "SSU", None)]
+        ids = {row.id for row in rows}
+
+    # Uploading the same sheet again keeps the existing records
+    created = SequencingSequencerId.create_many(
+        [
+            {
+                "sample_id": 2,
+                "sequencer_id": "B",
+                "region": "SSU",
+                "index_1": None,
+                "index_2": None,
+            },
+            {
+                "sample_id": 1,
+                "sequencer_id": "B",
+                "region": "SSU",
+                "index_1": None,
+                "index_2": None,
+            },
+        ]
+    )
+    assert [status for _, status in created] == ["existing", "new"]
+    assert created[0][0] in ids
+
+
+def test_sequencer_id_index_matches_prefixes():
+    index = SequencerIdIndex(
+        [
+            {"id": 1, "SequencerID": "A1", "SampleID": "S1", "Region": "ITS2"},
+            {"id": 2, "SequencerID": "A10", "SampleID": "S2", "Region": "SSU"},
+            {"id": 3, "SequencerID": "B2", "SampleID": "S3", "Region": "ITS2"},
+        ]
+    )
+    assert index.match("A1_R1_001.fastq.gz") == [1]
+    assert index.match("A10_R1.fq.gz") == [1, 2]
+    assert index.match("C1_R1.fastq.gz") == []
+    assert index.match("A1_R1.fastq") == []
+    assert index.match_many(["A10_R2.fq.gz", "B2_R1.fastq.gz"]) == {
+        "A10_R2.fq.gz": {"matches": [1, 2], "ambiguous": True},
+        "B2_R1.fastq.gz": {"matches": [3], "ambiguous": False},
+    }
+    assert index.new_filename("B2R1_001.fastq.gz") == "S3_ITS2_R1.fastq.gz"
+    assert index.new_filename("B2_R1_001.fastq.gz") == "S3_ITS2_R1.fastq.gz"
+
+
+def test_get_index_sees_sequencer_id_changes(mocker):
+    _mock_upload(mocker)
+    with dbm.session_scope() as session:
+        session.execute(
+            text(
+                "CREATE TABLE sequencing_samples (id INTEGER PRIMARY KEY, "
+                "sequencingUploadId INTEGER, SampleID TEXT)"
+            )
+        )
+        session.execute(
+            text("INSERT INTO sequencing_samples VALUES (1, 7, 'S1')")
+        )
+        session.execute(
+            text("INSERT INTO sequencing_samples VALUES (2, 7, 'S2')")
+        )
+    SequencingSequencerId.create(1, "A1", "ITS2", None, None)
+
+    index = SequencingSequencerId.get_index(7)
+    assert SequencingSequencerId.get_matching_sequencer_ids(
+        7, "A12_R1.fastq.gz"
+    ) == [index.records[0]["id"]]
+
+    SequencingSequencerId.create(2, "A12", "ITS2", None, None)
+    result = SequencingSequencerId.match_filenames(7, ["A12_R1.fastq.gz"])
+    assert result["A12_R1.fastq.gz"]["ambiguous"] is True
+    assert (
+        SequencingSequencerId.generate_new_filename(7, "A12_R1.fastq.gz")
+        == "S1_ITS2_2_R1.fastq.gz"
+    )
+
+    # An edited SampleID is seen by the next index
+    with dbm.session_scope() as session:
+        session.execute(
+            text("UPDATE sequencing_samples SET SampleID = 'S9' WHERE id = 1")
+        )
+    assert (
+        SequencingSequencerId.generate_new_filename(7, "A1_R1.fastq.gz")
+        == "S9_ITS2_R1.fastq.gz"
+    )
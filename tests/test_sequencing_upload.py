@@ -1,4 +1,11 @@
+import io
+import os
+import pandas as pd
+import pytest
 from datetime import datetime
+from sqlalchemy import create_engine
+
+import helpers.dbm as dbm
 from tests.test_helpers import (
     _create_dummy_user_and_bucket_dependencies,
     _create_dummy_ecoregion,
@@ -8,6 +15,7 @@ from tests.test_helpers import (
 
 # Assuming models.db_model.py contains Base and SequencingUploadsTable
 from models.db_model import (
+    Base,
     SequencingUploadsTable,
     SequencingAnalysisTypesTable,
     SequencingSamplesTable,
@@ -15,6 +23,7 @@ from models.db_model import (
     OTU,
 )
 from models.sequencing_upload import SequencingUpload
+from models.taxonomy import TaxonomyManager
 
 
 # The test function for SequencingUpload.create
@@ -604,3 +613,189 @@ def test_get_samples(db_session, mocker, app):
         sequencing_upload_id_2 + 1
     )
     assert samples_no_results == []
+
+
+def test_get_directory_size(tmp_path):
+    """
+    Tests that get_directory_size only counts the top-level files and
+    notices files added after a previous (cached) call.
+    """
+    (tmp_path / "a_R1.fastq.gz").write_bytes(b"x" * 10)
+    (tmp_path / "notes.txt").write_bytes(b"x" * 5)
+    (tmp_path / "subdir").mkdir()
+    (tmp_path / "subdir" / "b_R1.fastq.gz").write_bytes(b"x" * 100)
+
+    assert SequencingUpload.get_directory_size(str(tmp_path)) == (15, 1)
+
+    (tmp_path / "c_R2.fq").write_bytes(b"x" * 20)
+    # Make sure the directory mtime differs even on coarse filesystems
+    os.utime(tmp_path, ns=(0, 0))
+    assert SequencingUpload.get_directory_size(str(tmp_path)) == (35, 2)
+
+    assert SequencingUpload.get_directory_size(str(tmp_path / "missing")) == (
+        0,
+        0,
+    )
+
+
+def test_create_taxonomies_from_csv(mocker):
+    """
+    Tests that a chunk of the OTU table is mapped to sample and taxonomy
+    IDs, resolving new lineages in one batch.
+    """
+    created = {}
+    resolve_mock = mocker.patch.object(
+        TaxonomyManager,
+        "resolve_many",
+        side_effect=lambda lineages: {
+            lineage: created.setdefault(lineage, len(created) + 1)
+            for lineage in lineages
+        },
+    )
+
+    df = pd.read_csv(
+        io.StringIO(
+            "sample_id,abundance,Domain,Phylum,Class,Order,Family,Genus,"
+            "Species,ecm_flag\n"
+            "S_A,5,Fungi,Ascomycota,,,,,,1\n"
+            "A,3,Fungi,Ascomycota,,,,,,0\n"
+            "B,2,Fungi,?,,,,,,0\n"
+            "UNKNOWN,1,Fungi,Ascomycota,,,,,,0\n"
+            "A,4,,,,,,,,0\n"
+        )
+    )
+    taxonomy_id_map = {}
+    otus = SequencingUpload.create_taxonomies_from_csv(
+        df, {"A": 10, "B": 11}, taxonomy_id_map
+    )
+
+    assert otus.to_dict("records") == [
+        {"sample_id": 10, "taxonomy_id": 1, "abundance": 5, "ecm_flag": True},
+        {"sample_id": 10, "taxonomy_id": 1, "abundance": 3, "ecm_flag": False},
+        {"sample_id": 11, "taxonomy_id": 2, "abundance": 2, "ecm_flag": False},
+    ]
+    assert resolve_mock.call_count == 1
+    assert len(created) == 2
+
+    # Lineages already in the map are not resolved again
+    SequencingUpload.create_taxonomies_from_csv(
+        df, {"A": 10, "B": 11}, taxonomy_id_map
+    )
+    assert resolve_mock.call_count == 1
+
+
+def test_process_otu_data_deletes_partial_import_on_error(mocker, tmp_path):
+    """
+    When a chunk fails, the OTUs stored from the earlier chunks are
+    deleted again, and OTUs of other imports are kept.
+    """
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(
+        engine, tables=[SequencingSamplesTable.__table__, OTU.__table__]
+    )
+    mocker.patch.object(dbm, "connect_db", return_value=engine)
+    with dbm.session_scope() as session:
+        session.add(
+            SequencingSamplesTable(id=1, sequencingUploadId=1, SampleID="A")
+        )
+        session.add(
+            OTU(
+                sample_id=1,
+                taxonomy_id=1,
+                abundance=9,
+                sequencing_analysis_id=2,
+            )
+        )
+    mocker.patch.object(
+        TaxonomyManager,
+        "resolve_many",
+        side_effect=lambda lineages: {lineage: 1 for lineage in lineages},
+    )
+    create_taxonomies = SequencingUpload.create_taxonomies_from_csv
+
+    # The second chunk cannot be mapped
+    def fail_on_second_chunk(df, samples_dict, taxonomy_id_map):
+        if df.index[0] > 0:
+            raise RuntimeError("broken chunk")
+        return create_taxonomies(df, samples_dict, taxonomy_id_map)
+
+    mocker.patch.object(
+        SequencingUpload,
+        "create_taxonomies_from_csv",
+        side_effect=fail_on_second_chunk,
+    )
+
+    csv_file = tmp_path / "otu_full_data.csv"
+    csv_file.write_text(
+        "sample_id,abundance,Domain,Phylum,Class,Order,Family,Genus,"
+        "Species\n"
+        "A,5,Fungi,Ascomycota,,,,,\n"
+        "A,3,Fungi,Basidiomycota,,,,,\n"
+    )
+    with pytest.raises(RuntimeError):
+        SequencingUpload.process_otu_data(str(csv_file), 1, 2, chunk_size=1)
+
+    with dbm.session_scope() as session:
+        assert [otu.abundance for otu in session.query(OTU).all()] == [9]
+
+
+def test_adapters_count_many_counts_missing_in_parallel(
+    mocker, monkeypatch, tmp_path
+):
+    """
+    Only sequencer IDs with a missing count are sent to the counter, all
+    uploads share the pool, and each upload's progress is saved.
+    """
+    from models.sequencing_sequencer_ids import SequencingSequencerId
+
+    monkeypatch.chdir(tmp_path)
+    done = {
+        "fwd_read_fwd_adap": 1,
+        "rev_read_rev_adap": 1,
+        "fwd_rev_adap": 1,
+        "fwd_rev_mrg_adap": 1,
+        "read_length_min": 1,
+    }
+    missing = dict(done, fwd_rev_mrg_adap=None)
+    sequencer_ids = {
+        1: [
+            dict(missing, id=11, SequencerID="A", Region="ITS2"),
+            dict(done, id=12, SequencerID="B", Region="ITS2"),
+        ],
+        2: [dict(missing, id=21, SequencerID="C", Region="SSU")],
+    }
+    mocker.patch.object(
+        SequencingUpload,
+        "get",
+        side_effect=lambda id: {"uploads_folder": f"folder{id}"},
+    )
+    mocker.patch.object(
+        SequencingUpload,
+        "get_sequencer_ids",
+        side_effect=lambda id: sequencer_ids[id],
+    )
+    mocker.patch(
+        "models.sequencing_upload.build_region_primer_dict",
+        return_value={"ITS2": {"Forward Primer": "ACGT"}},
+    )
+    counter = mocker.patch.object(
+        SequencingSequencerId,
+        "adapters_count",
+        return_value={"status": "counted", "counts": {"fwd_rev_mrg_adap": 5}},
+    )
+
+    progress = SequencingUpload.adapters_count_many([1, 2], workers=2)
+
+    assert sorted(call.args[0]["id"] for call in counter.call_args_list) == [
+        11,
+        21,
+    ]
+    assert progress[1]["total"] == 1
+    assert progress[1]["statuses"] == {"counted": 1}
+    assert progress[2]["finished_at"] is not None
+
+    mocker.patch.object(
+        SequencingUpload, "get", return_value={"uploads_folder": "folder1"}
+    )
+    saved = SequencingUpload.get_adapters_count_progress(1)
+    assert saved["sequencer_ids"]["11"]["counts"] == {"fwd_rev_mrg_adap": 5}
@@ -0,0 +1,40 @@
+from models.sequencing_upload_view import SequencingUploadView
+
+PROCESS_DATA = {
+    "region_1": "ITS2",
+    "region_2": "SSU",
+    "Sequencing_regions_number": 2,
+    "uploads_folder": "UPLOAD",
+}
+
+
+def _sequencer(id, region):
+    return {"id": id, "Region": region, "uploaded_files": [{"id": id}]}
+
+
+def test_sequencer_ids_are_derived_from_the_loaded_samples():
+    view = SequencingUploadView(1, PROCESS_DATA)
+    view.samples_data_complete = [
+        {"id": 10, "sequencer_ids": [_sequencer(3, "ITS2")]},
+        {
+            "id": 11,
+            "sequencer_ids": [_sequencer(2, "SSU"), _sequencer(1, "ITS2")],
+        },
+    ]
+
+    view._derive_sequencer_ids()
+
+    assert view.sequencer_ids == [
+        {"id": 1, "Region": "ITS2"},
+        {"id": 2, "Region": "SSU"},
+        {"id": 3, "Region": "ITS2"},
+    ]
+    assert view.valid_samples is True
+    assert view.missing_sequencing_ids == [10]
+
+    view.samples_data_complete[0]["sequencer_ids"].append(
+        _sequencer(4, "ITS1")
+    )
+    view._derive_sequencer_ids()
+    assert view.valid_samples is False
+    assert view.missing_sequencing_ids == []
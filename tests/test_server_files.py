@@ -0,0 +1,265 @@
+import errno
+import json
+import os
+import sys
+
+import pytest
+
+from helpers import server_files
+from helpers.sequencer_id_index import SequencerIdIndex
+
+
+def test_link_or_copy_links_and_falls_back_to_copy(tmp_path, mocker):
+    source = tmp_path / "source.fastq.gz"
+    source.write_bytes(b"reads")
+
+    linked = tmp_path / "linked.fastq.gz"
+    assert server_files.link_or_copy(source, linked) == "link"
+    assert os.path.samefile(source, linked)
+    # Linking again is a no-op
+    assert server_files.link_or_copy(source, linked) == "link"
+
+    # Another filesystem: the file is copied
+    mocker.patch.object(
+        server_files.os, "link", side_effect=OSError(errno.EXDEV, "")
+    )
+    copied = tmp_path / "copied.fastq.gz"
+    copied.write_bytes(b"old")
+    assert server_files.link_or_copy(source, copied) == "copy"
+    assert copied.read_bytes() == b"reads"
+    assert not os.path.samefile(source, copied)
+
+
+def test_ingest_server_files_processes_every_matching_file(
+    tmp_path, monkeypatch, mocker
+):
+    """
+    All the matching files go through the pipeline (there is no cap),
+    are linked into seq_processed and moved out of the way, and the
+    progress is saved for the form to poll.
+    """
+    monkeypatch.chdir(tmp_path)
+    delivery = tmp_path / "delivery"
+    delivery.mkdir()
+    names = [f"S{i}_R1_001.fastq.gz" for i in range(200)]
+    for name in names + ["other.fastq.gz", "notes.txt"]:
+        (delivery / name).write_bytes(name.encode())
+
+    index = SequencerIdIndex(
+        [
+            {
+                "id": i,
+                "SequencerID": f"S{i}_",
+                "SampleID": f"s{i}",
+                "Region": "ITS2",
+            }
+            for i in range(200)
+        ]
+    )
+    mocker.patch.object(
+        server_files.SequencingUpload,
+        "get",
+        return_value={"uploads_folder": "up", "project_id": "bucket"},
+    )
+    mocker.patch.object(
+        server_files.SequencingSequencerId, "get_index", return_value=index
+    )
+    mocker.patch.object(
+        server_files.SequencingSequencerId,
+        "get",
+        return_value=mocker.Mock(Region="ITS2"),
+    )
+    # The first file was registered by an earlier run
+    mocker.patch.object(
+        server_files.SequencingFileUploaded,
+        "check_if_exists",
+        side_effect=lambda sequencer_id, file_dict: sequencer_id == 0,
+    )
+    mocker.patch.object(
+        server_files.SequencingFileUploaded,
+        "create",
+        side_effect=lambda sequencer_id, file_dict: sequencer_id,
+    )
+    dispatch = mocker.patch.object(server_files, "dispatch_uploaded_file")
+
+    progress = server_files.ingest_server_files(1, str(delivery))
+
+    assert progress["status"] == "finished"
+    assert progress["total"] == 200
+    assert progress["done"] == 200
+    assert progress["new"] == 199
+    assert progress["existing"] == 1
+    assert progress["linked"] == 199
+    assert progress["unmatched"] == 1
+    assert progress["failed"] == 0
+    assert dispatch.call_count == 199
+    assert os.path.samefile(
+        tmp_path / "seq_processed" / "up" / "s5_ITS2_R1.fastq.gz",
+        delivery / "processed" / "S5_R1_001.fastq.gz",
+    )
+    assert sorted(os.listdir(delivery)) == [
+        "notes.txt",
+        "other.fastq.gz",
+        "processed",
+    ]
+    with open(
+        tmp_path / "seq_processed" / "up" / "server_files_progress.json"
+    ) as f:
+        assert json.load(f) == progress
+
+
+def test_init_ingest_server_files_marks_a_failed_queueing(
+    tmp_path, monkeypatch, mocker
+):
+    monkeypatch.chdir(tmp_path)
+    mocker.patch.object(
+        server_files.SequencingUpload,
+        "get",
+        return_value={"uploads_folder": "up"},
+    )
+    tasks = mocker.Mock()
+    tasks.is_locked.return_value = False
+    tasks.ingest_server_files_async.delay.side_effect = ConnectionError(
+        "broker down"
+    )
+    mocker.patch.dict(sys.modules, {"tasks": tasks})
+
+    assert server_files.init_ingest_server_files(1, "delivery") is False
+    progress = json.loads(
+        (
+            tmp_path
+            / "seq_processed"
+            / "up"
+            / server_files.SERVER_FILES_PROGRESS_FILE
+        ).read_text()
+    )
+    assert progress["status"] == "failed"
+    assert "broker down" in progress["errors"][0]
+
+
+def _progress_file(tmp_path):
+    return (
+        tmp_path
+        / "seq_processed"
+        / "up"
+        / server_files.SERVER_FILES_PROGRESS_FILE
+    )
+
+
+def test_init_ingest_server_files_leaves_a_running_job_alone(
+    tmp_path, monkeypatch, mocker
+):
+    monkeypatch.chdir(tmp_path)
+    mocker.patch.object(
+        server_files.SequencingUpload,
+        "get",
+        return_value={"uploads_folder": "up"},
+    )
+    tasks = mocker.Mock()
+    tasks.is_locked.return_value = True
+    mocker.patch.dict(sys.modules, {"tasks": tasks})
+
+    assert server_files.init_ingest_server_files(1, "delivery") is None
+    tasks.is_locked.assert_called_once_with(
+        "celery-lock:ingest_server_files:1"
+    )
+    tasks.ingest_server_files_async.delay.assert_not_called()
+    assert not _progress_file(tmp_path).exists()
+
+
+def test_ingest_server_files_saves_a_failed_run(tmp_path, monkeypatch, mocker):
+    """
+    An error outside the per-file handling, here a directory removed in
+    the meantime, leaves the progress "failed" instead of "queued".
+    """
+    monkeypatch.chdir(tmp_path)
+    get_upload = mocker.patch.object(
+        server_files.SequencingUpload,
+        "get",
+        return_value={"uploads_folder": "up", "project_id": "bucket"},
+    )
+
+    with pytest.raises(FileNotFoundError):
+        server_files.ingest_server_files(1, str(tmp_path / "removed"))
+    progress = json.loads(_progress_file(tmp_path).read_text())
+    assert progress["status"] == "failed"
+    assert "removed" in progress["errors"][0]
+
+    # Even when the upload cannot be read, given its folder
+    get_upload.side_effect = RuntimeError("database down")
+    with pytest.raises(RuntimeError):
+        server_files.ingest_server_files(1, str(tmp_path), uploads_folder="up")
+    progress = json.loads(_progress_file(tmp_path).read_text())
+    assert progress["status"] == "failed"
+    assert "database down" in progress["errors"][0]
+
+
+def test_ingest_server_files_counts_hash_and_dispatch_errors(
+    tmp_path, monkeypatch, mocker
+):
+    monkeypatch.chdir(tmp_path)
+    delivery = tmp_path / "delivery"
+    delivery.mkdir()
+    for name in ["S0_R1_001.fastq.gz", "S1_R1_001.fastq.gz"]:
+        (delivery / name).write_bytes(name.encode())
+
+    mocker.patch.object(
+        server_files.SequencingUpload,
+        "get",
+        return_value={"uploads_folder": "up", "project_id": "bucket"},
+    )
+    mocker.patch.object(
+        server_files.SequencingSequencerId,
+        "get_index",
+        return_value=SequencerIdIndex(
+            [
+                {
+                    "id": i,
+                    "SequencerID": f"S{i}_",
+                    "SampleID": f"s{i}",
+                    "Region": "ITS2",
+                }
+                for i in range(2)
+            ]
+        ),
+    )
+    mocker.patch.object(
+        server_files.SequencingSequencerId,
+        "get",
+        return_value=mocker.Mock(Region="ITS2"),
+    )
+    mocker.patch.object(
+        server_files.SequencingFileUploaded,
+        "check_if_exists",
+        return_value=False,
+    )
+    mocker.patch.object(
+        server_files.SequencingFileUploaded,
+        "create",
+        side_effect=lambda sequencer_id, file_dict: sequencer_id,
+    )
+    mocker.patch.object(
+        server_files,
+        "dispatch_uploaded_file",
+        side_effect=ConnectionError("broker down"),
+    )
+    get_md5s = mocker.patch.object(
+        server_files,
+        "get_md5s",
+        side_effect=lambda batch: {str(path): "md5" for path in batch},
+    )
+
+    progress = server_files.ingest_server_files(1, str(delivery))
+    assert progress["status"] == "finished"
+    assert progress["new"] == 2
+    assert progress["failed"] == 2
+    assert len(progress["errors"]) == 2
+
+    # Any error of the checksums fails the files of the batch
+    for name in ["S0_R1_001.fastq.gz", "S1_R1_001.fastq.gz"]:
+        (delivery / name).write_bytes(name.encode())
+    get_md5s.side_effect = ValueError("bad cache")
+    progress = server_files.ingest_server_files(1, str(delivery))
+    assert progress["status"] == "finished"
+    assert progress["failed"] == 2
+    assert progress["done"] == 2
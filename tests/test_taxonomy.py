@@ -0,0 +1,276 @@
+import pytest
+from sqlalchemy import create_engine, event, text
+
+import helpers.dbm as dbm
+import models.taxonomy as taxonomy
+from models.db_model import (
+    Base,
+    AppConfigurationTable,
+    Domain,
+    Phylum,
+    Taxonomy,
+    TaxonomyLineage,
+    OTU,
+)
+from models.taxonomy import TaxonomyManager, parse_search_cursor
+
+
+def test_resolve_many_uses_cache(mocker):
+    """
+    A batch of lineages is resolved with bulk inserts, and resolving it
+    again is answered from the process cache without any statement
+    other than the version check.
+    """
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(
+        engine,
+        tables=[
+            model.__table__
+            for model in taxonomy.RANK_MODELS
+            + [Taxonomy, TaxonomyLineage, AppConfigurationTable]
+        ],
+    )
+    mocker.patch.object(dbm, "connect_db", return_value=engine)
+    taxonomy._reset_taxonomy_cache()
+
+    statements = []
+    event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    full = (
+        "Fungi",
+        "Ascomycota",
+        "Pezizomycetes",
+        "Pezizales",
+        None,
+        None,
+        None,
+    )
+    unknown_class = ("Fungi", "Ascomycota", "?", "Pezizales", None, None, None)
+    no_domain = ("?", "Ascomycota", None, None, None, None, None)
+    first = TaxonomyManager.resolve_many([full, unknown_class, no_domain])
+
+    assert first[no_domain] is None
+    assert first[full] != first[unknown_class]
+    # As create always did: get_or_create skips "?", so an unknown class
+    # is a NULL class_id and the ranks below it are dropped
+    unknown = TaxonomyManager.get(first[unknown_class])
+    assert unknown["class_id"] is None
+    assert unknown["order_id"] is None
+    assert (
+        first[unknown_class]
+        == TaxonomyManager.resolve_many(
+            [("Fungi", "Ascomycota", None, None, None, None, None)]
+        ).popitem()[1]
+    )
+    with dbm.session_scope() as session:
+        assert session.query(taxonomy.Class).filter_by(name="?").count() == 0
+    assert TaxonomyManager.create(*full, session=None) == first[full]
+
+    # Another process would only see what is in the database
+    statements.clear()
+    taxonomy._reset_taxonomy_cache()
+    assert TaxonomyManager.resolve_many([full, unknown_class]) == {
+        full: first[full],
+        unknown_class: first[unknown_class],
+    }
+    assert not any(s.lstrip().upper().startswith("INSERT") for s in statements)
+
+    statements.clear()
+    TaxonomyManager.resolve_many([full, unknown_class])
+    assert statements == []
+
+    # A new version makes the next lookup reload everything
+    TaxonomyManager.invalidate_cache()
+    assert taxonomy._taxonomy_cache["loaded"] is False
+
+
+def test_search_pages_and_count(mocker):
+    """
+    Search results are returned in pages that follow each other through
+    the cursor, with the same rows as a search without a limit, and
+    count() can stop early.
+    """
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(
+        engine,
+        tables=[
+            model.__table__
+            for model in taxonomy.RANK_MODELS
+            + [Taxonomy, TaxonomyLineage, AppConfigurationTable, OTU]
+        ],
+    )
+    # Only the columns the search uses, these tables have MySQL types
+    with engine.begin() as connection:
+        for statement in [
+            "CREATE TABLE sequencing_uploads "
+            "(id INTEGER PRIMARY KEY, project_id TEXT)",
+            "CREATE TABLE sequencing_samples (id INTEGER PRIMARY KEY, "
+            "sequencingUploadId INTEGER, SampleID TEXT, "
+            "Latitude TEXT, Longitude TEXT)",
+            "CREATE TABLE sequencing_analysis (id INTEGER PRIMARY KEY, "
+            "sequencingUploadId INTEGER, sequencingAnalysisTypeId INTEGER)",
+            "CREATE TABLE sequencing_analysis_types "
+            "(id INTEGER PRIMARY KEY, name TEXT, region TEXT)",
+        ]:
+            connection.execute(text(statement))
+    mocker.patch.object(dbm, "connect_db", return_value=engine)
+    taxonomy._reset_taxonomy_cache()
+
+    glomero = (
+        "Fungi",
+        "Glomeromycota",
+        "Glomeromycetes",
+        None,
+        None,
+        None,
+        None,
+    )
+    asco = ("Fungi", "Ascomycota", None, None, None, None, None)
+    taxonomy_ids = TaxonomyManager.resolve_many([glomero, asco])
+
+    with dbm.session_scope() as session:
+        session.execute(
+            text("INSERT INTO sequencing_uploads VALUES (1, 'P1')")
+        )
+        session.execute(
+            text(
+                "INSERT INTO sequencing_analysis_types "
+                "VALUES (1, 'ITS2', 'ITS2')"
+            )
+        )
+        session.execute(
+            text("INSERT INTO sequencing_analysis VALUES (1, 1, 1)")
+        )
+        for sample_id in range(1, 6):
+            session.execute(
+                text(
+                    "INSERT INTO sequencing_samples (id, sequencingUploadId, "
+                    f"SampleID) VALUES ({sample_id}, 1, 'S{sample_id}')"
+                )
+            )
+            for lineage in (glomero, asco):
+                session.add(
+                    OTU(
+                        sample_id=sample_id,
+                        taxonomy_id=taxonomy_ids[lineage],
+                        abundance=sample_id * 10,
+                        sequencing_analysis_id=1,
+                        ecm_flag=False,
+                    )
+                )
+
+    search_filters = {"phylum": "Glomeromycota", "project": "P1"}
+    everything = TaxonomyManager.search(
+        sort="abundance", descending=True, **search_filters
+    )
+    assert [row["SampleID"] for row in everything] == [
+        "S5",
+        "S4",
+        "S3",
+        "S2",
+        "S1",
+    ]
+
+    paged = []
+    after = None
+    while True:
+        page = TaxonomyManager.search_page(
+            limit=2,
+            after=after,
+            sort="abundance",
+            descending=True,
+            **search_filters,
+        )
+        paged += page["data"]
+        after = page["next_cursor"]
+        if after is None:
+            break
+    assert paged == everything
+
+    assert TaxonomyManager.count(**search_filters) == 5
+    assert TaxonomyManager.count(limit=3, **search_filters) == 3
+    assert TaxonomyManager.count(phylum="Basidiomycota") == 0
+    assert TaxonomyManager.count(project="P1") == 10
+    assert TaxonomyManager.count(amf_filter=True) == 5
+
+    # An OTU that search cannot return is not counted either
+    with dbm.session_scope() as session:
+        session.add(
+            OTU(
+                sample_id=99,
+                taxonomy_id=taxonomy_ids[glomero],
+                abundance=1,
+                sequencing_analysis_id=1,
+                ecm_flag=False,
+            )
+        )
+    assert TaxonomyManager.count(phylum="Glomeromycota") == len(
+        TaxonomyManager.search(phylum="Glomeromycota")
+    )
+
+    # OTUs of a sample come with their rank names from taxonomy_lineage
+    otus = TaxonomyManager.get_otus(
+        sample_id=2,
+        region="ITS2",
+        analysis_type_id="",
+        amf_filter=0,
+        ecm_filter=0,
+    )
+    assert sorted((otu["phylum"], otu["class"]) for otu in otus) == [
+        ("Ascomycota", None),
+        ("Glomeromycota", "Glomeromycetes"),
+    ]
+    amf_otus = TaxonomyManager.get_otus(
+        sample_id=2,
+        region="ITS2",
+        analysis_type_id="1",
+        amf_filter=1,
+        ecm_filter=0,
+    )
+    assert [otu["class"] for otu in amf_otus] == ["Glomeromycetes"]
+
+    # The nightly rebuild puts back a lineage row that went missing
+    with dbm.session_scope() as session:
+        session.query(TaxonomyLineage).filter_by(
+            taxonomy_id=taxonomy_ids[glomero]
+        ).delete()
+    assert TaxonomyManager.count(amf_filter=True, project="P1") == 0
+    assert TaxonomyManager.rebuild_lineages() == 2
+    assert TaxonomyManager.count(amf_filter=True, project="P1") == 5
+    assert (
+        TaxonomyManager.get_otus(
+            sample_id=2,
+            region="ITS2",
+            analysis_type_id="1",
+            amf_filter=1,
+            ecm_filter=0,
+        )
+        == amf_otus
+    )
+
+    # Taxonomies written through the ORM get their lineage row with them
+    with dbm.session_scope() as session:
+        fungi = session.query(Domain).filter_by(name="Fungi").one()
+        asco_phylum = session.query(Phylum).filter_by(name="Ascomycota").one()
+        orm_taxonomy = Taxonomy(domain_id=fungi.id)
+        session.add(orm_taxonomy)
+        session.flush()
+        lineage = session.get(TaxonomyLineage, orm_taxonomy.id)
+        assert (lineage.domain_name, lineage.phylum_name) == ("Fungi", None)
+
+        orm_taxonomy.phylum_id = asco_phylum.id
+        session.flush()
+        session.expire_all()
+        lineage = session.get(TaxonomyLineage, orm_taxonomy.id)
+        assert lineage.phylum_name == "Ascomycota"
+
+
+def test_parse_search_cursor():
+    assert parse_search_cursor("30:7") == (30, 7)
+    for cursor in ("30", "a:7", "1:2:3", ""):
+        with pytest.raises(ValueError):
+            parse_search_cursor(cursor)
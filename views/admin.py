@@ -27,6 +27,7 @@ from models.sequencing_sample import SequencingSample
 from models.sequencing_upload import SequencingUpload
 from models.app_configuration import AppConfiguration
 from helpers.hetzner_vm import list_existing_vms
+from helpers.dbm import get_pool_status
 
 # Get the logger instance from app.py
 logger = logging.getLogger("my_app_logger")  # Use the same name as in app.py
@@ -105,6 +106,19 @@ def show_system_report():
     return {}
 
 
+@admin_bp.route(
+    "/admin/db_pool_status",
+    methods=["GET"],
+    endpoint="db_pool_status",
+)
+@login_required
+@admin_required
+@approved_required
+def db_pool_status():
+    # Note: this reports the pool of the web worker that served the request
+    return jsonify(get_pool_status())
+
+
 @admin_bp.route(
     "/update_missing_geo_data",
     methods=["GET"],
@@ -11,6 +11,7 @@ from flask import (
 )
 from models.sequencing_upload import SequencingUpload
 from models.sequencing_analysis import SequencingAnalysis
+from models.bucket_reconciliation import BucketReconciliation
 from models.user import User
 from helpers.lotus2 import (
     delete_generated_lotus2_report,
@@ -27,6 +28,7 @@ from helpers.bucket import (
 from helpers.r_scripts import (
     delete_generated_rscripts_report,
 )
+from helpers.cutadapt import init_adapters_count_all
 
 # Get the logger instance from app.py
 logger = logging.getLogger("my_app_logger")  # Use the same name as in app.py
@@ -268,7 +270,8 @@ def export_all_richness_data():
 @admin_required
 @approved_required
 def adapters_count_all():
-    SequencingUpload.adapters_count_all()
+    init_adapters_count_all()
+    return jsonify({"started": 1}), 200
 
 
 @projects_bp.route(
@@ -399,7 +402,12 @@ def check_bucket_uploads():
     if process_id:
         result = SequencingUpload.check_all_files_uploaded(process_id)
         return (
-            jsonify({"result": result}),
+            jsonify(
+                {
+                    "result": result,
+                    "reconciliation": BucketReconciliation.get(process_id),
+                }
+            ),
             200,
         )
     return {}
@@ -416,5 +424,40 @@ def check_bucket_uploads():
 def ensure_bucket_uploads():
     process_id = request.args.get("process_id")
     if process_id:
-        SequencingUpload.ensure_bucket_upload_progress(process_id)
+        started = SequencingUpload.ensure_bucket_upload_progress(process_id)
+        return jsonify({"result": started}), 200
     return {}
+
+
+@projects_bp.route(
+    "/bucket_reconciliation",
+    methods=["GET"],
+    endpoint="bucket_reconciliation",
+)
+@login_required
+@admin_required
+@approved_required
+def bucket_reconciliation():
+    """
+    The last reconciliation snapshots of the uploads with their buckets,
+    the ones with missing files only with incomplete=1. With a
+    process_id, the one of that upload, reconciled first with refresh=1.
+    """
+    process_id = request.args.get("process_id")
+    if process_id:
+        if request.args.get("refresh") == "1":
+            snapshot = BucketReconciliation.reconcile(process_id)
+        else:
+            snapshot = BucketReconciliation.get(process_id)
+        if snapshot is None:
+            return jsonify({"error": "No reconciliation found"}), 404
+        return jsonify(snapshot), 200
+
+    return (
+        jsonify(
+            BucketReconciliation.get_all(
+                only_incomplete=request.args.get("incomplete") == "1"
+            )
+        ),
+        200,
+    )
@@ -1,7 +1,6 @@
 from . import upload_form_bp
 import os
 import logging
-import shutil
 import json
 from pathlib import Path
 from flask_login import login_required
@@ -16,97 +15,25 @@ from helpers.decorators import (
     admin_required,
     admin_or_owner_required,
 )
-from helpers.bucket import (
-    init_bucket_chunked_upload_v2,
-    calculate_md5,
+from helpers.checksums import (
+    assemble,
+    assemble_md5,
+    get_chunk_md5s,
+    remove_chunks,
+    save_chunk,
 )
-from helpers.fastqc import (
-    init_create_fastqc_report,
+from helpers.server_files import (
+    process_uploaded_file,
+    init_ingest_server_files,
+    get_progress as get_server_files_progress,
 )
 from models.sequencing_upload import SequencingUpload
-from models.sequencing_files_uploaded import SequencingFileUploaded
 from models.sequencing_sequencer_ids import SequencingSequencerId
 from werkzeug.utils import secure_filename
 
 logger = logging.getLogger("my_app_logger")
 
 
-def process_uploaded_file(
-    process_id,
-    source_directory,
-    filename,
-    expected_md5,
-    process_data,
-    sequencing_run=None,
-):
-    uploads_folder = process_data["uploads_folder"]
-    final_file_path = f"{source_directory}/{filename}"
-
-    # Save into the database the file
-    matching_sequencer_ids = SequencingSequencerId.get_matching_sequencer_ids(
-        process_id, filename, sequencing_run
-    )
-    # Assign the file to the correct sequencer in
-    # the database and process it further
-    if len(matching_sequencer_ids) == 1:
-        file_sequencer_id = matching_sequencer_ids[0]
-
-        new_filename = SequencingSequencerId.generate_new_filename(
-            process_id, filename
-        )
-        file_dict = {
-            "md5": expected_md5,
-            "original_filename": filename,
-            "new_name": new_filename,
-        }
-
-        # Check if the file already exists before creating a new one
-        existing_file_id = SequencingFileUploaded.check_if_exists(
-            file_sequencer_id, file_dict
-        )
-
-        if existing_file_id:
-            return (
-                new_filename,
-                False,
-            )  # Already processed — success but not newly created
-
-        # Create a new entry in the database for the file
-        new_file_uploaded_id = SequencingFileUploaded.create(
-            file_sequencer_id, file_dict
-        )
-
-        # If a new filename is provided, copy the file to the new location
-        if new_filename:
-            # Get the data of the SequencingSequencerId to get the region
-            sequencerId = SequencingSequencerId.get(file_sequencer_id)
-            region = sequencerId.Region
-            bucket = process_data["project_id"]
-
-            processed_folder = f"seq_processed/{uploads_folder}"
-            processed_file_path = f"{processed_folder}/{new_filename}"
-            os.makedirs(os.path.dirname(processed_file_path), exist_ok=True)
-            shutil.copy2(final_file_path, processed_file_path)
-
-            # Generate FastQC report
-            init_create_fastqc_report(
-                new_filename, processed_folder, bucket, region
-            )
-
-            # Copy the file to the correct bucket and folder
-            init_bucket_chunked_upload_v2(
-                local_file_path=processed_file_path,
-                destination_upload_directory=region,
-                destination_blob_name=new_filename,
-                sequencer_file_id=new_file_uploaded_id,
-                bucket_name=bucket,
-                known_md5=expected_md5,
-            )
-            return new_filename, True
-
-    return None, False  # No matching sequencer ID or no processing occurred
-
-
 @upload_form_bp.route(
     "/confirm_files_uploading_finished",
     methods=["POST"],
@@ -135,106 +62,55 @@ def confirm_files_uploading_finished():
 @approved_required
 @admin_required
 def sequencing_process_server_files():
+    """
+    Starts the background processing of all the FASTQ files of a server
+    directory, see ingest_server_files. Its progress is returned by
+    sequencing_process_server_files_progress.
+    """
     process_id = request.form.get("process_id")
     directory_name = request.form.get("directory_name")
     sequencing_run = request.form.get("sequencing_run")
 
     if process_id:
-        process_data = SequencingUpload.get(process_id)
-
-        # Construct the full directory path
-        full_directory_path = Path(directory_name)
-
         # Check if the directory exists
-        if not full_directory_path.is_dir():
+        full_directory_path = Path(directory_name or "")
+        if not directory_name or not full_directory_path.is_dir():
             logger.error(f"Directory not found: {full_directory_path}")
             return {"error": "Directory not found"}, 404
 
-        # Initialize the report list and counters
-        report = []
-        matched_files_count = 0
-        scanned_files_count = 0
-        max_files_to_process = 150
-
-        # Files that get successfully matched/processed are moved here,
-        # so re-running this action doesn't keep re-visiting them and the
-        # source directory stays clean.
-        processed_subdir = full_directory_path / "processed"
-
-        # Loop through files in the directory
-        for file_path in sorted(full_directory_path.iterdir()):
-            # Stop once we've found & handled enough MATCHING files — not
-            # after merely scanning 150 filesystem entries. A directory can
-            # contain many .fastq.gz files that don't belong to this
-            # project at all (no matching sequencer ID); those shouldn't
-            # count against the limit, or a run could exhaust it entirely
-            # on irrelevant files and stop before reaching real matches
-            # further down the sorted listing.
-            if matched_files_count >= max_files_to_process:
-                logger.info(
-                    f"Reached the limit of {max_files_to_process} "
-                    "matching files processed."
-                )
-                break
-
-            # Check if the file ends with '.fastq.gz'
-            if file_path.is_file() and (
-                file_path.name.endswith(".fastq.gz")
-                or file_path.name.endswith(".fq.gz")
-            ):
-                scanned_files_count += 1
-
-                actual_md5 = calculate_md5(file_path)
-
-                # Process and rename the file
-                new_filename, is_new = process_uploaded_file(
-                    process_id=process_id,
-                    source_directory=directory_name,
-                    filename=file_path.name,
-                    expected_md5=actual_md5,
-                    process_data=process_data,
-                    sequencing_run=sequencing_run,
-                )
+        started = init_ingest_server_files(
+            process_id, directory_name, sequencing_run
+        )
+        if started is None:
+            return {
+                "error": "Files of this upload are already being processed."
+            }, 409
+        if not started:
+            return {
+                "error": "Processing of the directory could not be started."
+            }, 500
+        return {"message": "Processing of the directory started."}, 200
 
-                if is_new:
-                    report.append(
-                        {
-                            "original_filename": file_path.name,
-                            "new_filename": new_filename,
-                        }
-                    )
+    return {"message": "No process_id provided"}, 400
 
-                # A non-empty new_filename means the file was matched to a
-                # sequencer ID and handled (whether just now or in a
-                # previous run) — count it towards the processing limit,
-                # and move it out of the way so it isn't re-visited next
-                # time this action is run.
-                if new_filename:
-                    matched_files_count += 1
-                    processed_subdir.mkdir(exist_ok=True)
-                    try:
-                        shutil.move(
-                            str(file_path),
-                            str(processed_subdir / file_path.name),
-                        )
-                    except OSError as e:
-                        logger.error(
-                            f"Failed to move {file_path} into "
-                            f"'processed' subdirectory: {e}"
-                        )
-
-        # Return the report as part of the response
-        return {
-            "message": (
-                f"Files processed successfully. "
-                f"Processed {len(report)} new files "
-                f"({matched_files_count} matched, "
-                f"{scanned_files_count} scanned)."
-            ),
-            "report": report,
-        }, 200
 
-    return {"message": "No process_id provided"}, 400
+@upload_form_bp.route(
+    "/sequencing_process_server_files_progress",
+    methods=["GET"],
+    endpoint="sequencing_process_server_files_progress",
+)
+@login_required
+@approved_required
+@admin_required
+def sequencing_process_server_files_progress():
+    process_id = request.args.get("process_id")
+    if not process_id:
+        return jsonify({"message": "No process_id provided"}), 400
+
+    progress = get_server_files_progress(process_id)
+    if progress is None:
+        return jsonify({"message": "No processing found"}), 404
+    return jsonify(progress), 200
 
 
 # The js library "resumamble" indicates to us
@@ -264,35 +140,51 @@ def sequencing_file_upload_completed():
 
         final_file_path = f"seq_uploads/{uploads_folder}/{form_filename}"
         temp_file_path = f"seq_uploads/{uploads_folder}/{form_filename}.temp"
-        # Make sure we dont continue writting on a previous failed effort
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-
-        with open(temp_file_path, "ab") as temp_file:
-            for i in range(1, form_filechunks + 1):
-                chunk_path = (
-                    f"seq_uploads/{uploads_folder}/{form_filename}.part{i}"
+        chunk_paths = [
+            f"seq_uploads/{uploads_folder}/{form_filename}.part{i}"
+            for i in range(1, form_filechunks + 1)
+        ]
+        # The .temp file is truncated, so a previous failed effort is
+        # not continued. The file is then linked (not copied) into
+        # seq_processed by process_uploaded_file.
+        expected_chunk_md5s = fileopts.get("chunk_md5s")
+        if expected_chunk_md5s:
+            # Each chunk was hashed when it arrived. When they all match
+            # the chunks the browser hashed, the file is the one whose
+            # MD5 the browser calculated, and is only joined here.
+            actual_chunk_md5s = get_chunk_md5s(chunk_paths)
+            if actual_chunk_md5s == expected_chunk_md5s:
+                assemble(chunk_paths, temp_file_path)
+                actual_md5 = expected_md5
+            else:
+                actual_md5 = None
+                mismatched = [
+                    i
+                    for i, md5s in enumerate(
+                        zip(expected_chunk_md5s, actual_chunk_md5s), start=1
+                    )
+                    if md5s[0] != md5s[1]
+                ]
+                logger.error(
+                    f"Chunk MD5 mismatch for {form_filename}: "
+                    f"chunks={mismatched} "
+                    f"expected_chunks={len(expected_chunk_md5s)} "
+                    f"actual_chunks={len(actual_chunk_md5s)}"
                 )
-                with open(chunk_path, "rb") as chunk_file:
-                    temp_file.write(chunk_file.read())
-
-        actual_md5 = calculate_md5(temp_file_path)
+        else:
+            # The parts are hashed as they are joined
+            actual_md5 = assemble_md5(chunk_paths, temp_file_path)
         # Compare MD5 hashes
         if expected_md5 != actual_md5:
             logger.error(
                 f"MD5 mismatch for {form_filename}: "
-                f"expected={expected_md5} actual={actual_md5} "
-                f"temp_size={os.path.getsize(temp_file_path)}"
+                f"expected={expected_md5} actual={actual_md5}"
             )
         if expected_md5 == actual_md5:
             # MD5 hashes match, file integrity verified
             os.rename(temp_file_path, final_file_path)
             # Then, since it is now confirmed, lets delete the parts
-            for i in range(1, form_filechunks + 1):
-                chunk_path = (
-                    f"seq_uploads/{uploads_folder}/{form_filename}.part{i}"
-                )
-                os.remove(chunk_path)
+            remove_chunks(chunk_paths)
 
             source_directory = f"seq_uploads/{uploads_folder}"
             new_filename, _ = process_uploaded_file(
@@ -394,9 +286,9 @@ def sequencing_upload_chunk():
             f"seq_uploads/{uploads_folder}/" f"{filename}.part{chunk_number}"
         )
 
-        chunk_data = request.get_data()
-        with open(save_path, "wb") as f:
-            f.write(chunk_data)
+        # The chunk is hashed into the chunk ledger as it is saved, so
+        # completing the upload does not have to read the file again
+        save_chunk(save_path, request.get_data())
 
         saved_size = os.path.getsize(save_path)
         expected_chunk_size = request.args.get("resumableCurrentChunkSize")
@@ -489,3 +381,40 @@ def check_filename_matching():
         jsonify({"result": 1, "message": "No matching sequencer IDs found"}),
         200,
     )
+
+
+@upload_form_bp.route(
+    "/match_filenames",
+    methods=["POST"],
+    endpoint="match_filenames",
+)
+@login_required
+@approved_required
+@admin_or_owner_required
+def match_filenames():
+    """
+    Matches many filenames to the upload's sequencer IDs at once. The
+    filenames are sent as repeated "filenames" form fields.
+    """
+    process_id = request.form.get("process_id")
+    filenames = request.form.getlist("filenames")
+
+    if not process_id or not filenames:
+        return (
+            jsonify(
+                {"result": 2, "message": "Missing process_id or filenames"}
+            ),
+            400,
+        )
+
+    return (
+        jsonify(
+            {
+                "result": 1,
+                "matches": SequencingSequencerId.match_filenames(
+                    process_id, filenames
+                ),
+            }
+        ),
+        200,
+    )
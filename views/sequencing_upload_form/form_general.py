@@ -19,11 +19,12 @@ from helpers.metadata_check import (
     get_project_common_data,
     sanitize_data,
     get_primer_sets_regions,
-    primers_forward_to_reverse,
 )
+from helpers import metadata_config
 from models.sequencing_upload import SequencingUpload
+from models.sequencing_upload_view import SequencingUploadView
+from models.reports_bucket_status import ReportsBucketStatus
 from models.bucket import Bucket
-from helpers.fastqc import check_multiqc_report
 
 logger = logging.getLogger("my_app_logger")
 
@@ -46,7 +47,7 @@ def metadata_form():
     forward_primers = list(
         {key.split("/")[0]: None for key in primer_set_regions}.keys()
     )
-    forward_to_reverse = primers_forward_to_reverse(primer_set_regions)
+    forward_to_reverse = metadata_config.primer_sets()["forward_to_reverse"]
     samples_data = []
     sequencer_ids = []
     regions = SequencingUpload.get_regions()
@@ -68,16 +69,15 @@ def metadata_form():
     flat_sequencer_rows = []
 
     if process_id:
-        process_data = SequencingUpload.get(process_id)
-        if process_data is not None:
+        upload_view = SequencingUploadView.get(process_id)
+        if upload_view is not None:
+            process_data = upload_view.process_data
             is_owner = current_user.id == process_data["user_id"]
 
             nr_files_per_sequence = process_data["nr_files_per_sequence"]
             regions = process_data["regions"]
 
-            samples_data = SequencingUpload.get_samples(process_id)
-
-            samples_data = sanitize_data(samples_data)
+            samples_data = sanitize_data(upload_view.samples_data)
 
             # lets create the extra data dictionary
             # Iterate through each sample in samples_data
@@ -107,16 +107,10 @@ def metadata_form():
                             if key not in extra_col_names:
                                 extra_col_names.append(key)
 
-            sequencer_ids = SequencingUpload.get_sequencer_ids(process_id)
-            valid_samples = SequencingUpload.validate_samples(process_id)
-            missing_sequencing_ids = (
-                SequencingUpload.check_missing_sequencer_ids(process_id)
-            )
-            samples_data_complete = (
-                SequencingUpload.get_samples_with_sequencers_and_files(
-                    process_id
-                )
-            )
+            sequencer_ids = upload_view.sequencer_ids
+            valid_samples = upload_view.valid_samples
+            missing_sequencing_ids = upload_view.missing_sequencing_ids
+            samples_data_complete = upload_view.samples_data_complete
 
             if samples_data_complete:
                 num_regions = process_data.get("Sequencing_regions_number", 1)
@@ -159,26 +153,14 @@ def metadata_form():
                 for sequencer in sample.get("sequencer_ids", [])
             )
 
-            multiqc_report_exists = check_multiqc_report(process_id)
-            mapping_files_exist = SequencingUpload.check_mapping_files_exist(
-                process_id
-            )
+            multiqc_report_exists = upload_view.multiqc_report_exists
+            mapping_files_exist = upload_view.mapping_files_exist
 
-            lotus2_report = SequencingUpload.check_lotus2_reports_exist(
-                process_id
-            )
-            rscripts_report = SequencingUpload.check_rscripts_reports_exist(
-                process_id
-            )
-            # check if pdf report exists
-            r_scripts_report = os.path.join(
-                "seq_processed",
-                process_data["uploads_folder"],
-                "r_output",
-                "report.pdf",
-            )
-            if os.path.isfile(r_scripts_report):
-                pdf_report = True
+            # Whether the reports are in the bucket is loaded by the page
+            # from sequencing_bucket_reports_status
+            lotus2_report = upload_view.lotus2_report
+            rscripts_report = upload_view.rscripts_report
+            pdf_report = upload_view.pdf_report
         else:
             return redirect(url_for("upload_form_bp.metadata_form"))
 
@@ -217,6 +199,36 @@ def metadata_form():
     )
 
 
+@upload_form_bp.route(
+    "/sequencing_bucket_reports_status",
+    methods=["GET"],
+    endpoint="sequencing_bucket_reports_status",
+)
+@login_required
+@approved_required
+@staff_or_granted_permission_required
+def sequencing_bucket_reports_status():
+    """
+    The recorded bucket status of the reports of an upload, see
+    ReportsBucketStatus.get. With refresh=1 the bucket is checked first,
+    for everyone who can see the metadata form, as the form did on every
+    view before the status was recorded.
+    """
+    process_id = request.args.get("process_id")
+    if not process_id or SequencingUpload.get(process_id) is None:
+        return jsonify({"error": "Upload not found"}), 404
+
+    try:
+        if request.args.get("refresh") == "1":
+            return jsonify(ReportsBucketStatus.verify(process_id))
+        return jsonify(ReportsBucketStatus.get(process_id))
+    except Exception as e:
+        logger.error(
+            f"Could not check the reports of {process_id} in the bucket: {e}"
+        )
+        return jsonify({"error": "Could not check the bucket"}), 500
+
+
 @upload_form_bp.route(
     "/upload_process_common_fields",
     methods=["POST"],
@@ -139,6 +139,7 @@ def upload_report_to_bucket():
             folder_path=output_path,
             destination_upload_directory=bucket_directory,
             bucket=bucket,
+            process_id=process_id,
         )
     return redirect(
         url_for("upload_form_bp.metadata_form", process_id=process_id)
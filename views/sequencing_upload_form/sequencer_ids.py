@@ -309,11 +309,29 @@ def upload_sequencer_ids_file():
 @approved_required
 def adapters_count():
     process_id = request.args.get("process_id")
+    # Optional: estimate from the first sample_reads reads of each file
+    sample_reads = request.args.get("sample_reads", type=int)
     if process_id:
-        SequencingUpload.adapters_count(process_id)
+        SequencingUpload.adapters_count(process_id, sample_reads=sample_reads)
         return "done"
 
 
+@upload_form_bp.route(
+    "/adapters_count_progress",
+    methods=["GET"],
+    endpoint="adapters_count_progress",
+)
+@login_required
+@admin_required
+@approved_required
+def adapters_count_progress():
+    process_id = request.args.get("process_id")
+    progress = SequencingUpload.get_adapters_count_progress(process_id)
+    if progress is None:
+        return jsonify({"error": "No adapter count found"}), 404
+    return jsonify(progress), 200
+
+
 @upload_form_bp.route("/primers_chart", endpoint="primers_chart")
 @login_required
 @approved_required
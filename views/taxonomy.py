@@ -9,7 +9,11 @@ from flask import (
     Response,
 )
 from flask_login import login_required
-from models.taxonomy import TaxonomyManager
+from models.taxonomy import (
+    TaxonomyManager,
+    SEARCH_SORT_COLUMNS,
+    parse_search_cursor,
+)
 from models.sequencing_sample import SequencingSample
 from models.sequencing_upload import SequencingUpload
 from models.sequencing_analysis_type import SequencingAnalysisType
@@ -20,6 +24,11 @@ logger = logging.getLogger("my_app_logger")  # Use the same name as in app.py
 
 taxonomy_bp = Blueprint("taxonomy", __name__)
 
+# Rows per page of search results, and where counting stops
+SEARCH_PAGE_SIZE = 500
+SEARCH_MAX_PAGE_SIZE = 2000
+SEARCH_COUNT_LIMIT = 100000
+
 
 @taxonomy_bp.route(
     "/taxonomy/search", methods=["GET"], endpoint="taxonomy_search"
@@ -63,25 +72,57 @@ def taxonomy_search_results():
     if ecm_filter == "no":
         ecm_filter_yes = False
 
+    search_filters = {
+        "domain": domain,
+        "phylum": phylum,
+        "class_": class_,
+        "order": order,
+        "family": family,
+        "genus": genus,
+        "species": species,
+        "project": project,
+        "amf_filter": amf_filter_yes,
+        "ecm_filter": ecm_filter_yes,
+        "analysis_type": analysis_type,
+    }
+
+    # Paging and sorting
+    after = request.args.get("after") or None
+    if after:
+        try:
+            parse_search_cursor(after)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+    sort = request.args.get("sort", "id")
+    if sort not in SEARCH_SORT_COLUMNS:
+        sort = "id"
+    descending = request.args.get("direction") == "desc"
+    try:
+        limit = int(request.args.get("limit", SEARCH_PAGE_SIZE))
+    except ValueError:
+        limit = SEARCH_PAGE_SIZE
+    limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+
     # Use TaxonomyManager to perform the search
-    all_results = TaxonomyManager.search(
-        domain=domain,
-        phylum=phylum,
-        class_=class_,
-        order=order,
-        family=family,
-        genus=genus,
-        species=species,
-        project=project,
-        amf_filter=amf_filter_yes,
-        ecm_filter=ecm_filter_yes,
-        analysis_type=analysis_type,
+    page = TaxonomyManager.search_page(
+        limit=limit,
+        after=after,
+        sort=sort,
+        descending=descending,
+        **search_filters,
     )
 
-    total_results = len(all_results)  # Get total number of results
-    limited_results = all_results[:500]  # Return only the first 500 results
+    response = {"data": page["data"], "next_cursor": page["next_cursor"]}
+
+    # The total only needs to be counted for the first page
+    if not after:
+        total_results = TaxonomyManager.count(
+            limit=SEARCH_COUNT_LIMIT + 1, **search_filters
+        )
+        response["total_results"] = min(total_results, SEARCH_COUNT_LIMIT)
+        response["total_capped"] = total_results > SEARCH_COUNT_LIMIT
 
-    return jsonify({"data": limited_results, "total_results": total_results})
+    return jsonify(response)
 
 
 @taxonomy_bp.route(